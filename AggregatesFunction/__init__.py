@@ -0,0 +1,37 @@
+"""
+AggregatesFunction - Atualiza os agregados do Cosmos DB a partir do change feed
+Trigger: timer (a cada minuto)
+"""
+import azure.functions as func
+import logging
+
+try:
+    from shared.adapters.cosmos_adapter import cosmos_adapter
+    from shared.adapters.cosmos_aggregates import ChangeFeedAggregator
+    COSMOS_ADAPTER_AVAILABLE = True
+except ImportError as e:
+    logging.warning(f"⚠️ Cosmos adapter não disponível: {e}")
+    COSMOS_ADAPTER_AVAILABLE = False
+    cosmos_adapter = None
+
+logger = logging.getLogger(__name__)
+
+async def main(timer: func.TimerRequest) -> None:
+    """
+    Aplica as mudanças de messages e promotions desde a última execução
+    
+    O continuation token fica no próprio documento de agregado, então execuções
+    atrasadas ou sobrepostas não contam nada duas vezes.
+    """
+    if not COSMOS_ADAPTER_AVAILABLE or not cosmos_adapter or not cosmos_adapter.client:
+        logger.warning("⚠️ Cosmos DB não configurado, agregados não atualizados")
+        return
+    
+    if timer.past_due:
+        logger.info("⏰ AggregatesFunction atrasada, processando o acumulado")
+    
+    try:
+        report = await ChangeFeedAggregator(cosmos_adapter).run_once()
+        logger.info(f"📈 Agregados: {report['processed']} em {report['duration_ms']}ms")
+    except Exception as e:
+        logger.error(f"Erro no AggregatesFunction: {e}", exc_info=True)
@@ -7,6 +7,7 @@ import azure.functions as func
 import json
 import logging
 import os
+import uuid
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -129,10 +130,10 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
             from shared.adapters.cosmos_adapter import cosmos_adapter
             
-            # Criar sessão se não existir
+            # Criar sessão se não existir (sessões já vistas neste worker não vão ao Cosmos)
             await cosmos_adapter.create_session(session_id)
             
-            # Buscar histórico da conversa
+            # Buscar histórico da conversa (point read do documento da sessão)
             history = await cosmos_adapter.get_recent_messages(session_id, limit=10)
             
         except Exception as e:
@@ -216,7 +217,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                         # Adicionar metadata
                         extracted_data['session_id'] = session_id
                         extracted_data['created_at'] = datetime.utcnow().isoformat()
-                        extracted_data['promo_id'] = f"promo_{datetime.utcnow().timestamp()}"
+                        extracted_data['promo_id'] = f"promo_{uuid.uuid4().hex}"
                         
                         # Salvar no Cosmos DB
                         try:
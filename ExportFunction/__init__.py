@@ -1,12 +1,19 @@
 """
-ExportFunction - Gera arquivo Excel da promoção e retorna como base64
+ExportFunction - Gera arquivo Excel da promoção
+Entrega o arquivo binário (application/vnd.openxmlformats...) ou um link de download
+de curta duração no Blob Storage - nunca base64 dentro do JSON
 """
 import logging
 import json
+import asyncio
 import azure.functions as func
 from datetime import datetime
 from io import BytesIO
-import base64
+import sys
+from pathlib import Path
+
+# Adiciona o diretório raiz ao path
+sys.path.insert(0, str(Path(__file__).parent.parent))
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +27,27 @@ except ImportError as e:
     EXCEL_AVAILABLE = False
     logger.error(f"❌ openpyxl não disponível: {e}")
 
+# Import do blob adapter (links de download)
+try:
+    from shared.adapters.blob_adapter import EXCEL_CONTENT_TYPE, async_blob_adapter
+    BLOB_AVAILABLE = True
+except ImportError as e:
+    logger.warning(f"⚠️ Blob adapter não disponível: {e}")
+    EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    BLOB_AVAILABLE = False
+
 async def main(req: func.HttpRequest) -> func.HttpResponse:
     """
-    Gera arquivo Excel da promoção e retorna como base64
+    Gera arquivo Excel da promoção
     
     POST /api/export
-    Body: { "promo_data": {...}, "format": "excel" }
+    Body: { "promo_data": {...}, "format": "excel", "delivery": "stream" | "url" }
+    
+    - delivery "stream" (padrão): responde o próprio arquivo, com Content-Disposition
+    - delivery "url": envia para o Blob Storage e responde JSON com o link
+      { "success", "delivery": "url", "filename", "download_url", "expires_at" };
+      sem Blob Storage responde { "success", "delivery": "stream", "filename" } e o
+      cliente baixa pelo POST com delivery "stream"
     """
     logger.info('📊 ExportFunction: Gerando exportação')
     
@@ -33,6 +55,7 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         req_body = req.get_json()
         promo_data = req_body.get('promo_data', {})
         export_format = req_body.get('format', 'excel')
+        delivery = req_body.get('delivery', 'stream')
         
         if not promo_data:
             return func.HttpResponse(
@@ -49,34 +72,6 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
                 status_code=500
             )
         
-        # Gera arquivo Excel
-        logger.info(f"📝 Gerando arquivo Excel para: {promo_data.get('titulo', 'sem_titulo')}")
-        try:
-            excel_buffer = generate_excel(promo_data)
-            logger.info("✅ Excel gerado em memória")
-        except Exception as e:
-            logger.error(f"❌ Erro ao gerar Excel: {str(e)}", exc_info=True)
-            return func.HttpResponse(
-                json.dumps({"success": False, "error": f"Erro ao gerar Excel: {str(e)}"}),
-                mimetype="application/json",
-                status_code=500
-            )
-        
-        # Converte para base64
-        try:
-            excel_buffer.seek(0)
-            excel_bytes = excel_buffer.read()
-            logger.info(f"📦 Tamanho do Excel: {len(excel_bytes)} bytes")
-            excel_base64 = base64.b64encode(excel_bytes).decode('utf-8')
-            logger.info(f"📦 Base64 gerado: {len(excel_base64)} caracteres")
-        except Exception as e:
-            logger.error(f"❌ Erro ao converter para base64: {str(e)}", exc_info=True)
-            return func.HttpResponse(
-                json.dumps({"success": False, "error": f"Erro ao converter: {str(e)}"}),
-                mimetype="application/json",
-                status_code=500
-            )
-        
         # Nome do arquivo
         try:
             titulo = promo_data.get('titulo', 'promocao')
@@ -84,20 +79,58 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             titulo = ''.join(c for c in titulo if c.isalnum() or c in (' ', '_')).replace(' ', '_').lower()
             timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
             filename = f"{titulo}_{timestamp}.xlsx"
-            logger.info(f"✅ Exportação concluída: {filename}")
         except Exception as e:
             logger.warning(f"Erro ao gerar filename: {e}")
             filename = f"promocao_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.xlsx"
         
+        link_available = BLOB_AVAILABLE and async_blob_adapter.client is not None
+        if delivery == 'url' and not link_available:
+            # Sem Blob Storage não há link: o cliente pede o arquivo direto
+            logger.info(f"ℹ️ Blob Storage não configurado, download direto de {filename}")
+            return _json_response({"success": True, "delivery": "stream", "filename": filename, "format": export_format})
+        
+        # Gera arquivo Excel (fora do event loop)
+        logger.info(f"📝 Gerando arquivo Excel para: {promo_data.get('titulo', 'sem_titulo')}")
+        try:
+            excel_buffer = await asyncio.to_thread(generate_excel, promo_data)
+            size = excel_buffer.getbuffer().nbytes
+            logger.info(f"📦 Tamanho do Excel: {size} bytes")
+        except Exception as e:
+            logger.error(f"❌ Erro ao gerar Excel: {str(e)}", exc_info=True)
+            return func.HttpResponse(
+                json.dumps({"success": False, "error": f"Erro ao gerar Excel: {str(e)}"}),
+                mimetype="application/json",
+                status_code=500
+            )
+        
+        if delivery == 'url':
+            blob_url = await async_blob_adapter.upload_stream(excel_buffer, filename, length=size)
+            link = await async_blob_adapter.get_download_url(blob_url, filename)
+            if link:
+                logger.info(f"✅ Exportação concluída: {filename} (link até {link['expires_at']})")
+                return _json_response({
+                    "success": True,
+                    "delivery": "url",
+                    "filename": filename,
+                    "download_url": link["url"],
+                    "expires_at": link["expires_at"],
+                    "size_bytes": size,
+                    "format": export_format
+                })
+            # Upload ou SAS falhou: o cliente baixa pelo POST com delivery "stream"
+            logger.warning(f"⚠️ Link de download indisponível para {filename}")
+            return _json_response({"success": True, "delivery": "stream", "filename": filename, "format": export_format})
+        
+        logger.info(f"✅ Exportação concluída: {filename}")
         return func.HttpResponse(
-            json.dumps({
-                "success": True,
-                "excel_base64": excel_base64,
-                "filename": filename,
-                "format": "excel"
-            }, ensure_ascii=False),
-            mimetype="application/json",
-            status_code=200
+            body=excel_buffer.getvalue(),
+            status_code=200,
+            mimetype=EXCEL_CONTENT_TYPE,
+            headers={
+                "Content-Disposition": f'attachment; filename="{filename}"',
+                "Access-Control-Expose-Headers": "Content-Disposition",
+                "Cache-Control": "no-store"
+            }
         )
         
     except Exception as e:
@@ -109,6 +142,14 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+def _json_response(payload: dict) -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps(payload, ensure_ascii=False),
+        mimetype="application/json",
+        status_code=200
+    )
+
+
 def generate_excel(promo_data: dict) -> BytesIO:
     """
     Gera arquivo Excel com os dados da promoção em formato de tabela
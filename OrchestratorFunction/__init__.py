@@ -238,9 +238,14 @@ Estado atual da promoção:
                 if current_state.get("status") == "ready" and current_state.get("data"):
                     export_result = await self._call_export(current_state["data"])
                     if export_result.get("success"):
-                        # Armazena o base64 no estado para o frontend processar
-                        current_state["data"]["excel_base64"] = export_result.get("excel_base64")
-                        current_state["data"]["excel_filename"] = export_result.get("filename")
+                        # Só a referência vai para o estado: o arquivo não volta ao servidor a cada requisição
+                        current_state["data"].pop("excel_base64", None)
+                        current_state["data"].pop("excel_filename", None)
+                        current_state["data"]["excel_export"] = {
+                            "filename": export_result.get("filename"),
+                            "download_url": export_result.get("download_url"),
+                            "expires_at": export_result.get("expires_at")
+                        }
                         
                         response = f"""✅ **Excel gerado com sucesso!**
 
@@ -384,7 +389,7 @@ Deseja fazer algo mais com esta promoção?"""
                 # Remove campos None e metadatos para não confundir a GPT
                 promo_data_clean = {
                     k: v for k, v in promo_data.items() 
-                    if v is not None and k not in ['erro', 'summary', 'excel_base64', 'excel_filename', 'multiple_promotions']
+                    if v is not None and k not in ['erro', 'summary', 'excel_base64', 'excel_filename', 'excel_export', 'multiple_promotions']
                 }
                 
                 validation_result = await self._call_validator(promo_data_clean)
@@ -621,14 +626,15 @@ Pode descrever de forma natural ou estruturada!"""
             return {"success": False, "error": str(e)}
     
     async def _call_export(self, promo_data: Dict) -> Dict:
-        """Chama ExportFunction para gerar Excel"""
+        """Chama ExportFunction para gerar Excel (pede link de download, não o arquivo)"""
         try:
             async with httpx.AsyncClient(timeout=90.0) as client:
                 response = await client.post(
                     self.export_url,
                     json={
-                        "promo_data": promo_data,
-                        "format": "excel"
+                        "promo_data": {k: v for k, v in promo_data.items() if k != 'excel_export'},
+                        "format": "excel",
+                        "delivery": "url"
                     }
                 )
                 response.raise_for_status()
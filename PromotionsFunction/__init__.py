@@ -0,0 +1,81 @@
+"""
+PromotionsFunction - Lista as promoções finalizadas, uma página por vez
+Endpoint: GET /api/promotions?limit=50&cursor=<next_cursor>
+"""
+import azure.functions as func
+import json
+import logging
+
+# Import do cosmos adapter
+try:
+    from shared.adapters.cosmos_adapter import cosmos_adapter
+    COSMOS_ADAPTER_AVAILABLE = True
+except ImportError as e:
+    logging.warning(f"⚠️ Cosmos adapter não disponível: {e}")
+    COSMOS_ADAPTER_AVAILABLE = False
+    cosmos_adapter = None
+
+logger = logging.getLogger(__name__)
+
+# Mesmo padrão do GET /api/promotions local (src/api/endpoints.py)
+DEFAULT_PAGE_SIZE = 50
+
+async def main(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    Página de promoções (mais recentes primeiro) só com os campos de resumo
+    O cursor é o continuation token do Cosmos DB devolvido em next_cursor
+    """
+    logger.info('PromotionsFunction processando requisição')
+    
+    # CORS headers
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Allow-Methods': 'GET, OPTIONS',
+        'Access-Control-Allow-Headers': 'Content-Type'
+    }
+    
+    # Handle OPTIONS (preflight)
+    if req.method == 'OPTIONS':
+        return func.HttpResponse("", status_code=200, headers=headers)
+    
+    try:
+        limit = int(req.params.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return func.HttpResponse(
+            json.dumps({"error": "limit deve ser um inteiro maior que zero"}),
+            status_code=400,
+            headers=headers
+        )
+    
+    if not (COSMOS_ADAPTER_AVAILABLE and cosmos_adapter and cosmos_adapter.client):
+        return func.HttpResponse(
+            json.dumps({"error": "Cosmos DB não configurado"}),
+            status_code=503,
+            headers=headers
+        )
+    
+    try:
+        page = await cosmos_adapter.get_promotions_page(page_size=limit, cursor=req.params.get('cursor') or None)
+        return func.HttpResponse(
+            json.dumps({
+                "promotions": page["promotions"],
+                "count": len(page["promotions"]),
+                "next_cursor": page["next_cursor"]
+            }, ensure_ascii=False),
+            status_code=200,
+            headers=headers
+        )
+        
+    except Exception as e:
+        logger.error(f"Erro no PromotionsFunction: {e}")
+        return func.HttpResponse(
+            json.dumps({
+                "error": "Erro ao listar promoções",
+                "details": str(e)
+            }),
+            status_code=500,
+            headers=headers
+        )
@@ -7,6 +7,15 @@ import json
 import os
 import logging
 
+# Import do cosmos adapter
+try:
+    from shared.adapters.cosmos_adapter import cosmos_adapter
+    COSMOS_ADAPTER_AVAILABLE = True
+except ImportError as e:
+    logging.warning(f"⚠️ Cosmos adapter não disponível: {e}")
+    COSMOS_ADAPTER_AVAILABLE = False
+    cosmos_adapter = None
+
 logger = logging.getLogger(__name__)
 
 async def main(req: func.HttpRequest) -> func.HttpResponse:
@@ -34,9 +43,12 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
         cosmos_ok = bool(os.environ.get("COSMOS_ENDPOINT"))
         blob_ok = bool(os.environ.get("AZURE_STORAGE_CONNECTION_STRING"))
         
-        # TODO: Buscar contagens reais do Cosmos DB
-        messages_stored = 0
-        promotions_count = 0
+        # Contagens mantidas pelo change feed (AggregatesFunction): um point read por tipo
+        aggregates = {}
+        if COSMOS_ADAPTER_AVAILABLE and cosmos_adapter and cosmos_adapter.client:
+            aggregates = await cosmos_adapter.get_aggregates()
+        messages_stored = aggregates.get("messages", {}).get("total", 0)
+        promotions_count = aggregates.get("promotions", {}).get("total", 0)
         
         # Montar resposta de status
         status = {
@@ -50,6 +62,20 @@ async def main(req: func.HttpRequest) -> func.HttpResponse:
             "environment": "azure"
         }
         
+        if "promotions" in aggregates:
+            promotions = aggregates["promotions"]
+            status["promotion_stats"] = {
+                "by_status": promotions.get("by_status", {}),
+                "by_month": promotions.get("by_month", {}),
+                "by_mecanica": promotions.get("by_mecanica", {}),
+                "by_segment": promotions.get("by_segment", {}),
+                "updated_at": promotions.get("updated_at")
+            }
+        
+        # Consumo de RU deste worker (por operação e por minuto) e orçamento de RU/s
+        if COSMOS_ADAPTER_AVAILABLE and cosmos_adapter and cosmos_adapter.client:
+            status["cosmos_usage"] = cosmos_adapter.get_stats()
+        
         logger.info(f"Status check: OpenAI={openai_ok}, Cosmos={cosmos_ok}, Blob={blob_ok}")
         
         return func.HttpResponse(
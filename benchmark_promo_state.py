@@ -0,0 +1,82 @@
+"""
+Micro-benchmark do PromoState
+Mede memória por instância e ops/s de from_dict, to_dict, missing_fields,
+get_completion_percentage e escrita de campo em N estados
+
+Uso:
+    python benchmark_promo_state.py [quantidade]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+
+from src.core.promo_state import PromoState
+
+
+def sample_dict(i: int) -> dict:
+    # Metade dos estados completos, metade no meio da conversa
+    data = {
+        "session_id": f"session_{i}",
+        "titulo": f"Promoção {i}",
+        "mecanica": "progressiva",
+        "descricao": "Desconto progressivo por volume",
+        "segmentacao": "Farmácias",
+        "produtos": ["Nivea Sun 50", "Nivea Sun 30"],
+        "status": "draft",
+        "created_at": "2026-01-01T12:00:00",
+        "updated_at": "2026-01-01T12:00:00",
+        "metadata": {},
+    }
+    if i % 2:
+        data.update(periodo_inicio="01/01/2026", periodo_fim="31/03/2026", condicoes="Mínimo 50 un.", recompensas="8% OFF")
+    return data
+
+
+def measure_memory(dicts) -> float:
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    states = [PromoState.from_dict(d) for d in dicts]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    per_instance = (after - before) / len(states)
+    del states
+    return per_instance
+
+
+def ops_per_second(label: str, func, items, repeat: int = 1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for item in items:
+            func(item)
+    elapsed = time.perf_counter() - started
+    total = len(items) * repeat
+    print(f"  {label:<32} {total / elapsed:>12,.0f} ops/s")
+
+
+def main(count: int):
+    print(f"⏱️ PromoState com {count:,} estados (Python {sys.version.split()[0]})")
+    dicts = [sample_dict(i) for i in range(count)]
+
+    print(f"  {'memória por instância':<32} {measure_memory(dicts):>12,.0f} bytes (estado + listas/dicts)")
+    print(f"  {'tamanho do objeto':<32} {sys.getsizeof(PromoState()):>12,} bytes (sem __dict__ separado)"
+          if not hasattr(PromoState(), '__dict__') else
+          f"  {'tamanho do objeto':<32} {sys.getsizeof(PromoState()) + sys.getsizeof(PromoState().__dict__):>12,} bytes (objeto + __dict__)")
+
+    ops_per_second("from_dict", PromoState.from_dict, dicts)
+    states = [PromoState.from_dict(d) for d in dicts]
+    ops_per_second("to_dict", PromoState.to_dict, states)
+    ops_per_second("missing_fields", PromoState.missing_fields, states, repeat=3)
+    ops_per_second("get_completion_percentage", PromoState.get_completion_percentage, states, repeat=3)
+    ops_per_second("is_complete", PromoState.is_complete, states, repeat=3)
+
+    def write_field(state):
+        state.descricao = "Nova descrição"
+        state.get_completion_percentage()
+
+    ops_per_second("escrita + completion", write_field, states)
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
@@ -0,0 +1,125 @@
+"""
+Benchmark da busca textual de promoções (FTS5)
+Popula um banco temporário com N promoções sintéticas e mede latência da busca
+comparando com um LIKE equivalente
+
+Uso:
+    python benchmark_promotion_search.py [num_promocoes]
+"""
+import sys
+import json
+import random
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+from statistics import median
+
+import aiosqlite
+
+from src.services.database import LocalDatabase
+
+MARCAS = ["Nivea", "Dove", "Colgate", "Omo", "Ypê", "Pantene", "Seda", "Rexona", "Lux", "Protex"]
+MECANICAS = ["progressiva", "casada", "pontos", "relâmpago", "leve mais pague menos"]
+PUBLICOS = ["farmácias", "supermercados", "atacarejos", "distribuidores", "varejo regional"]
+PRODUTOS = ["shampoo", "condicionador", "sabonete", "desodorante", "creme dental", "amaciante", "detergente", "protetor solar"]
+
+QUERIES = ["nivea", "protetor solar", "progressiva farmácias", "desconto", "colgate creme", "inexistentexyz"]
+
+
+def fake_promotion(i: int) -> tuple:
+    marca = random.choice(MARCAS)
+    produtos = random.sample(PRODUTOS, 3)
+    mecanica = random.choice(MECANICAS)
+    publico = random.choice(PUBLICOS)
+    desconto = random.randint(3, 30)
+    return (
+        f"promo_bench_{i}",
+        f"session_bench_{i}",
+        f"Promoção {mecanica} {marca} {i}",
+        mecanica,
+        f"Campanha {mecanica} de {marca} para {publico} com foco em {', '.join(produtos)}",
+        publico,
+        "01/01/2026",
+        "31/03/2026",
+        f"Compra mínima de {random.randint(10, 200)} unidades de {produtos[0]}",
+        f"Até {desconto}% de desconto em {produtos[1]}",
+        json.dumps([f"{marca} {p}" for p in produtos], ensure_ascii=False),
+        json.dumps(["higiene"]),
+        "sent",
+        "2026-01-01T00:00:00",
+    )
+
+
+def percentile(values: list, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def populate(db_path: str, total: int):
+    async with aiosqlite.connect(db_path) as db:
+        await db.executemany(
+            """INSERT INTO promotions
+               (promo_id, session_id, titulo, mecanica, descricao, segmentacao,
+                periodo_inicio, periodo_fim, condicoes, recompensas, produtos,
+                categorias, status, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (fake_promotion(i) for i in range(total))
+        )
+        await db.commit()
+
+
+async def like_search(db_path: str, term: str, limit: int = 20) -> int:
+    pattern = f"%{term}%"
+    async with aiosqlite.connect(db_path) as db:
+        cursor = await db.execute(
+            """SELECT id FROM promotions
+               WHERE titulo LIKE ? OR descricao LIKE ? OR condicoes LIKE ?
+                  OR recompensas LIKE ? OR produtos LIKE ?
+               LIMIT ?""",
+            (pattern, pattern, pattern, pattern, pattern, limit)
+        )
+        return len(await cursor.fetchall())
+
+
+async def run(total: int, repeat: int = 20):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = str(Path(tmp) / "bench.db")
+        database = LocalDatabase(db_path)
+        await database.initialize()
+
+        print(f"📦 Inserindo {total} promoções (triggers FTS ativos)...")
+        start = time.perf_counter()
+        await populate(db_path, total)
+        print(f"   {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        await database.rebuild_search_index()
+        print(f"🔎 Rebuild completo do índice: {time.perf_counter() - start:.2f}s")
+
+        print(f"\n{'query':<24}{'total':>8}{'fts p50':>12}{'fts p95':>12}{'like p50':>12}")
+        for query in QUERIES:
+            fts_times, like_times = [], []
+            hits = 0
+            for _ in range(repeat):
+                start = time.perf_counter()
+                result = await database.search_promotions(query, limit=20)
+                fts_times.append((time.perf_counter() - start) * 1000)
+                hits = result["total"]
+
+                start = time.perf_counter()
+                await like_search(db_path, query)
+                like_times.append((time.perf_counter() - start) * 1000)
+            print(
+                f"{query:<24}{hits:>8}{median(fts_times):>10.2f}ms"
+                f"{percentile(fts_times, 0.95):>10.2f}ms{median(like_times):>10.2f}ms"
+            )
+
+        start = time.perf_counter()
+        await database.search_promotions("nivea", limit=20, offset=1000)
+        print(f"\n📄 Página profunda (offset=1000): {(time.perf_counter() - start) * 1000:.2f}ms")
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    asyncio.run(run(n))
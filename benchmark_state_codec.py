@@ -0,0 +1,94 @@
+"""
+Benchmark dos codecs de promo_states.state_data
+Mede tamanho e throughput de encode/decode em estados realistas com
+metadata.multiple_promotions (campanhas divididas por mês)
+
+Uso:
+    python benchmark_state_codec.py [iteracoes]
+"""
+import sys
+import json
+import time
+
+from src.core.promo_state import PromoState
+from src.services.state_codec import StateCodec, ENCODERS
+
+MULTIPLE_SIZES = [0, 12, 36]
+THRESHOLDS = [0, 4096]
+
+
+def realistic_state(num_promotions: int) -> dict:
+    state = PromoState(
+        session_id="session_20260101_120000",
+        promo_id="promo_20260101_120000",
+        titulo="Promoção progressiva Nivea verão 2026",
+        mecanica="progressiva",
+        descricao="Desconto progressivo por faixa de volume para toda a linha de protetores solares",
+        segmentacao="Farmácias e drogarias das regiões Sul e Sudeste",
+        periodo_inicio="01/01/2026",
+        periodo_fim="31/12/2026",
+        condicoes="Compra mínima de 50 unidades por pedido, faturamento até o último dia útil do mês",
+        recompensas="Até 8.4% OFF conforme faixa de volume",
+        produtos=["Nivea Sun FPS 30", "Nivea Sun FPS 50", "Nivea Sun Kids FPS 60"],
+        categorias=["protetor solar", "dermocosméticos"],
+        clientes_alvo=["Rede A", "Rede B", "Rede C"],
+        volume_minimo="50",
+        desconto_percentual="8.4",
+        status="awaiting_excel_confirmation",
+    ).to_dict()
+
+    state["metadata"] = {
+        "multiple_promotions": [
+            {
+                **{k: v for k, v in state.items() if k != "metadata"},
+                "titulo": f"{state['titulo']} - mês {i + 1:02d}",
+                "periodo_inicio": f"01/{(i % 12) + 1:02d}/2026",
+                "periodo_fim": f"28/{(i % 12) + 1:02d}/2026",
+                "desconto_percentual": str(round(3 + (i % 5) * 1.35, 2)),
+            }
+            for i in range(num_promotions)
+        ]
+    }
+    return state
+
+
+def measure(codec: StateCodec, state: dict, iterations: int) -> tuple:
+    blob = codec.encode(state)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.encode(state)
+    encode_ops = iterations / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        codec.decode(blob)
+    decode_ops = iterations / (time.perf_counter() - start)
+
+    return len(blob), encode_ops, decode_ops
+
+
+def run(iterations: int):
+    print(f"Codecs disponíveis: {', '.join(ENCODERS)}")
+    for size in MULTIPLE_SIZES:
+        state = realistic_state(size)
+        legacy = json.dumps(state, ensure_ascii=False)
+        print(f"\n📦 multiple_promotions={size} (JSON legado: {len(legacy.encode('utf-8'))} bytes)")
+        print(f"{'codec':<10}{'compressão':>12}{'bytes':>10}{'encode/s':>12}{'decode/s':>12}")
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            json.loads(json.dumps(state, ensure_ascii=False))
+        legacy_ops = iterations / (time.perf_counter() - start)
+        print(f"{'legado':<10}{'-':>12}{len(legacy.encode('utf-8')):>10}{'':>12}{legacy_ops:>12.0f} (ida+volta)")
+
+        for name in ENCODERS:
+            for threshold in THRESHOLDS:
+                codec = StateCodec(name, compress_threshold=threshold)
+                size_bytes, enc, dec = measure(codec, state, iterations)
+                label = f">={threshold}" if threshold else "não"
+                print(f"{name:<10}{label:>12}{size_bytes:>10}{enc:>12.0f}{dec:>12.0f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
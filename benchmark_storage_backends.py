@@ -0,0 +1,111 @@
+"""
+Benchmark dos backends de persistência (contrato StorageBackend)
+Roda a mesma carga - N sessões x M turnos, como o chat faz a cada turno - contra
+cada backend e reporta a latência por operação
+
+Uso:
+    python benchmark_storage_backends.py [sessoes] [turnos] [memory,sqlite,cosmos]
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import statistics
+from typing import Dict, List
+
+from src.core.promo_state import PromoState
+from src.services.storage import InMemoryStorage
+from src.services.database import LocalDatabase
+
+
+class Timings:
+    """Latências coletadas por nome de operação"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    async def measure(self, operation: str, coro):
+        started = time.perf_counter()
+        result = await coro
+        self.samples.setdefault(operation, []).append((time.perf_counter() - started) * 1000)
+        return result
+
+    def report(self, name: str, elapsed: float):
+        total_ops = sum(len(values) for values in self.samples.values())
+        print(f"\n📦 {name}: {total_ops} operações em {elapsed:.2f}s ({total_ops / elapsed:.0f} ops/s)")
+        print(f"  {'operação':<24} {'n':>6} {'média ms':>10} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9}")
+        for operation, values in self.samples.items():
+            ordered = sorted(values)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+            print(
+                f"  {operation:<24} {len(values):>6} {statistics.mean(values):>10.3f} "
+                f"{statistics.median(values):>9.3f} {p95:>9.3f} {ordered[-1]:>9.3f}"
+            )
+
+
+async def run_session(backend, timings: Timings, session_id: str, turns: int):
+    """Um chat completo: a cada turno lê estado e histórico, grava estado e mensagem"""
+    for turn in range(turns):
+        data = await timings.measure("get_promo_state", backend.get_promo_state(session_id))
+        state = PromoState.from_dict(data) if data else PromoState(session_id=session_id)
+        await timings.measure("get_recent_messages", backend.get_recent_messages(session_id, limit=10))
+
+        state.titulo = f"Promoção {session_id}"
+        state.descricao = f"Descrição atualizada no turno {turn}"
+        state.produtos = [f"SKU-{i}" for i in range(turn + 1)]
+        state.update_timestamp()
+        await timings.measure("save_promo_state", backend.save_promo_state(session_id, state.to_dict()))
+        await timings.measure(
+            "save_message",
+            backend.save_message(session_id, f"mensagem {turn} do usuário", f"resposta {turn} do agente")
+        )
+
+    state.promo_id = f"promo_{session_id}"
+    await timings.measure("save_promotion", backend.save_promotion(state.to_dict()))
+    await timings.measure("get_promotion_by_id", backend.get_promotion_by_id(state.promo_id))
+
+
+async def run_backend(name: str, backend, sessions: int, turns: int):
+    await backend.initialize()
+    timings = Timings()
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        run_session(backend, timings, f"bench_{name}_{i}", turns) for i in range(sessions)
+    ))
+    await timings.measure("get_promotions", backend.get_promotions(limit=50))
+    await timings.measure("list_all_promo_states", backend.list_all_promo_states())
+    timings.report(name, time.perf_counter() - started)
+
+
+async def main(sessions: int, turns: int, backends: List[str]):
+    print(f"⏱️ Carga: {sessions} sessões x {turns} turnos")
+
+    if "memory" in backends:
+        await run_backend("memory", InMemoryStorage(), sessions, turns)
+
+    if "sqlite" in backends:
+        with tempfile.TemporaryDirectory() as tmp:
+            database = LocalDatabase(os.path.join(tmp, "benchmark.db"))
+            try:
+                await run_backend("sqlite", database, sessions, turns)
+            finally:
+                await database.close()
+
+    if "cosmos" in backends:
+        if not (os.environ.get("COSMOS_DB_ENDPOINT") and os.environ.get("COSMOS_DB_KEY")):
+            print("\n⏭️ cosmos: credenciais não configuradas")
+        else:
+            from shared.adapters.cosmos_adapter import CosmosDBAdapter
+            adapter = CosmosDBAdapter()
+            try:
+                await run_backend("cosmos", adapter, sessions, turns)
+            finally:
+                await adapter.close()
+
+
+if __name__ == "__main__":
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    turns = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    backends = sys.argv[3].split(",") if len(sys.argv) > 3 else ["memory", "sqlite", "cosmos"]
+    asyncio.run(main(sessions, turns, backends))
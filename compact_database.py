@@ -0,0 +1,37 @@
+"""
+Script de Retenção e Compactação do SQLite
+Aplica uma vez as políticas de retenção (messages/system_logs) e compacta o banco
+
+Uso:
+    python compact_database.py [caminho_do_banco] [--convert]
+
+    --convert  habilita auto_vacuum incremental em bancos antigos (VACUUM completo;
+               rode com o app parado)
+"""
+import sys
+import json
+import asyncio
+
+from src.services.database import LocalDatabase
+from src.services.retention import RetentionWorker
+
+
+async def compact(db_path: str, convert: bool) -> bool:
+    print(f"🧹 Aplicando retenção em: {db_path}")
+    database = LocalDatabase(db_path)
+    await database.initialize()
+
+    if convert and not await database.enable_incremental_vacuum():
+        print("❌ Não foi possível habilitar auto_vacuum incremental")
+        return False
+
+    report = await RetentionWorker(database).run_once()
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"✅ {report['reclaimed_bytes'] / (1024 * 1024):.2f} MB recuperados")
+    return True
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    path = args[0] if args else "promoagente_local.db"
+    sys.exit(0 if asyncio.run(compact(path, "--convert" in sys.argv)) else 1)
@@ -0,0 +1,54 @@
+"""
+Fixtures compartilhadas dos testes de persistência
+
+- local_database: abre LocalDatabase (SQLite) no diretório temporário do teste; todos
+  são fechados no teardown, mesmo se o teste falhar (uma conexão aiosqlite esquecida
+  aberta impede o processo de terminar)
+- storage_backend: cada backend do contrato StorageBackend, já inicializado, para a
+  bateria de conformidade; o Cosmos DB real só entra com COSMOS_DB_ENDPOINT/COSMOS_DB_KEY
+"""
+import os
+import asyncio
+from typing import List
+
+import pytest
+
+from src.services.database import LocalDatabase
+from src.services.storage import InMemoryStorage
+
+
+@pytest.fixture
+def local_database(tmp_path):
+    opened: List[LocalDatabase] = []
+
+    async def open_database(name: str = "local.db", **kwargs) -> LocalDatabase:
+        database = LocalDatabase(str(tmp_path / name), **kwargs)
+        await database.initialize()
+        opened.append(database)
+        return database
+
+    yield open_database
+    for database in opened:
+        asyncio.run(database.close())
+
+
+@pytest.fixture(params=["InMemoryStorage", "LocalDatabase", "CosmosDBAdapter (fake)", "CosmosDBAdapter"])
+def storage_backend(request, tmp_path):
+    if request.param == "InMemoryStorage":
+        backend = InMemoryStorage()
+    elif request.param == "LocalDatabase":
+        backend = LocalDatabase(str(tmp_path / "conformance.db"))
+    elif request.param == "CosmosDBAdapter (fake)":
+        from test_cosmos_adapter import make_adapter
+        backend, _, _ = make_adapter()
+        assert asyncio.run(backend.ensure_containers())
+    else:
+        if not (os.environ.get("COSMOS_DB_ENDPOINT") and os.environ.get("COSMOS_DB_KEY")):
+            pytest.skip("credenciais do Cosmos DB não configuradas")
+        from shared.adapters.cosmos_adapter import CosmosDBAdapter
+        backend = CosmosDBAdapter()
+
+    asyncio.run(backend.initialize())
+    yield backend
+    if hasattr(backend, "close"):
+        asyncio.run(backend.close())
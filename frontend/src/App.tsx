@@ -23,6 +23,8 @@ const theme = {
 function App() {
   const [status, setStatus] = useState<SystemStatus | null>(null);
   const [history, setHistory] = useState<PromotionRecord[]>([]);
+  const [historyCursor, setHistoryCursor] = useState<string | null>(null);
+  const [loadingHistory, setLoadingHistory] = useState(false);
   const [messages, setMessages] = useState<ChatMessage[]>([]);
   const [sessionId, setSessionId] = useState<string | undefined>(() => {
     return localStorage.getItem("promoagente-session") || undefined;
@@ -39,17 +41,8 @@ function App() {
       }
     };
 
-    const loadHistory = async () => {
-      try {
-        const records = await fetchPromotions();
-        setHistory(records);
-      } catch (error) {
-        console.error("Erro ao carregar histórico", error);
-      }
-    };
-
     loadStatus();
-    loadHistory();
+    reloadHistory();
   }, []);
 
   useEffect(() => {
@@ -58,12 +51,28 @@ function App() {
     }
   }, [sessionId]);
 
+  // Primeira página do histórico (mais recentes); as seguintes vêm pelo cursor
   const reloadHistory = async () => {
     try {
-      const records = await fetchPromotions();
-      setHistory(records);
+      const page = await fetchPromotions();
+      setHistory(page.promotions);
+      setHistoryCursor(page.nextCursor);
+    } catch (error) {
+      console.error("Erro ao carregar histórico", error);
+    }
+  };
+
+  const loadMoreHistory = async () => {
+    if (!historyCursor || loadingHistory) return;
+    setLoadingHistory(true);
+    try {
+      const page = await fetchPromotions(historyCursor);
+      setHistory(previous => [...previous, ...page.promotions]);
+      setHistoryCursor(page.nextCursor);
     } catch (error) {
-      console.error("Erro ao recarregar histórico", error);
+      console.error("Erro ao carregar mais promoções", error);
+    } finally {
+      setLoadingHistory(false);
     }
   };
 
@@ -72,7 +81,14 @@ function App() {
       <GlobalStyle />
       <Layout
         header={<StatusBar status={status} />}
-        sidebar={<HistoryPanel records={history} />}
+        sidebar={
+          <HistoryPanel
+            records={history}
+            hasMore={historyCursor !== null}
+            loading={loadingHistory}
+            onLoadMore={loadMoreHistory}
+          />
+        }
         main={
           <ChatPanel 
             messages={messages} 
@@ -1,8 +1,8 @@
 import { FormEvent, useState, useEffect } from "react";
 import styled from "styled-components";
 import ReactMarkdown from "react-markdown";
-import { sendChatMessage } from "../services/api";
-import { ChatMessage } from "../types";
+import { downloadExport, sendChatMessage } from "../services/api";
+import { ChatMessage, ExcelExportRef } from "../types";
 
 interface ChatPanelProps {
   messages: ChatMessage[];
@@ -167,50 +167,46 @@ export function ChatPanel({ messages, onMessagesChange, sessionId, onSessionChan
   const [isSending, setIsSending] = useState(false);
   const currentSession = sessionId;
 
-  // Função para fazer download do Excel
-  const downloadExcel = (base64: string, filename: string) => {
-    try {
-      // Converte base64 para blob
-      const byteCharacters = atob(base64);
-      const byteNumbers = new Array(byteCharacters.length);
-      for (let i = 0; i < byteCharacters.length; i++) {
-        byteNumbers[i] = byteCharacters.charCodeAt(i);
-      }
-      const byteArray = new Uint8Array(byteNumbers);
-      const blob = new Blob([byteArray], { 
-        type: 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet' 
-      });
-
-      // Cria link de download
-      const url = window.URL.createObjectURL(blob);
+  // Função para fazer download do Excel: link do Blob Storage ou arquivo direto da API
+  const downloadExcel = async (ref: ExcelExportRef, promoData: Record<string, unknown>) => {
+    const triggerDownload = (href: string) => {
       const link = document.createElement('a');
-      link.href = url;
-      link.download = filename;
+      link.href = href;
+      link.download = ref.filename;
       document.body.appendChild(link);
       link.click();
-      
-      // Cleanup
       document.body.removeChild(link);
-      window.URL.revokeObjectURL(url);
-      
-      console.log('✅ Download do Excel iniciado:', filename);
+    };
+
+    try {
+      const linkValid = ref.download_url && (!ref.expires_at || new Date(ref.expires_at).getTime() > Date.now());
+      if (linkValid) {
+        triggerDownload(ref.download_url as string);
+      } else {
+        const blob = await downloadExport(promoData);
+        const url = window.URL.createObjectURL(blob);
+        triggerDownload(url);
+        // Revoga só depois que o navegador começou o download disparado pelo click()
+        setTimeout(() => window.URL.revokeObjectURL(url), 0);
+      }
+      console.log('✅ Download do Excel iniciado:', ref.filename);
     } catch (error) {
       console.error('❌ Erro ao fazer download do Excel:', error);
     }
   };
 
-  // Monitora mudanças no estado para detectar excel_base64
+  // Monitora mudanças no estado para detectar a referência da exportação
   useEffect(() => {
-    if (currentState?.data?.excel_base64 && currentState?.data?.excel_filename) {
+    const ref: ExcelExportRef | undefined = currentState?.data?.excel_export;
+    if (ref?.filename) {
       console.log('📊 Excel detectado no estado, iniciando download...');
-      downloadExcel(currentState.data.excel_base64, currentState.data.excel_filename);
-      
-      // Remove o excel do estado após download para não baixar novamente
+      const promoData = { ...currentState.data };
+      delete promoData.excel_export;
+      downloadExcel(ref, promoData);
+
+      // Remove a referência do estado após download para não baixar novamente
       if (onStateChange) {
-        const newState = { ...currentState };
-        delete newState.data.excel_base64;
-        delete newState.data.excel_filename;
-        onStateChange(newState);
+        onStateChange({ ...currentState, data: promoData });
       }
     }
   }, [currentState]);
@@ -3,6 +3,9 @@ import { PromotionRecord } from "../types";
 
 interface HistoryPanelProps {
   records: PromotionRecord[];
+  hasMore?: boolean;
+  loading?: boolean;
+  onLoadMore?: () => void;
 }
 
 const Title = styled.h2`
@@ -34,6 +37,22 @@ const PromoMeta = styled.p`
   color: ${({ theme }) => theme.colors.muted};
 `;
 
+const LoadMoreButton = styled.button`
+  width: 100%;
+  margin-top: 16px;
+  padding: 10px;
+  border-radius: 10px;
+  border: 1px solid rgba(31, 60, 136, 0.2);
+  background: #ffffff;
+  color: ${({ theme }) => theme.colors.primary};
+  cursor: pointer;
+
+  &:disabled {
+    cursor: default;
+    color: ${({ theme }) => theme.colors.muted};
+  }
+`;
+
 const EmptyState = styled.div`
   text-align: center;
   padding: 24px;
@@ -43,7 +62,7 @@ const EmptyState = styled.div`
   color: ${({ theme }) => theme.colors.muted};
 `;
 
-export function HistoryPanel({ records }: HistoryPanelProps) {
+export function HistoryPanel({ records, hasMore = false, loading = false, onLoadMore }: HistoryPanelProps) {
   if (records.length === 0) {
     return (
       <div>
@@ -56,15 +75,12 @@ export function HistoryPanel({ records }: HistoryPanelProps) {
     );
   }
 
-  // Mostra apenas as 3 últimas promoções
-  const recentRecords = records.slice(-3).reverse();
-
   return (
     <div>
       <Title>Promoções recentes</Title>
       <PromoList>
-        {recentRecords.map(record => (
-          <PromoCard key={record.id}>
+        {records.map(record => (
+          <PromoCard key={record.promo_id}>
             <PromoTitle>{record.titulo || "Promoção sem título"}</PromoTitle>
             <PromoMeta>
               {record.mecanica && `📊 ${record.mecanica} • `}
@@ -83,6 +99,11 @@ export function HistoryPanel({ records }: HistoryPanelProps) {
           </PromoCard>
         ))}
       </PromoList>
+      {hasMore && onLoadMore && (
+        <LoadMoreButton onClick={onLoadMore} disabled={loading}>
+          {loading ? "Carregando..." : "Carregar mais"}
+        </LoadMoreButton>
+      )}
     </div>
   );
 }
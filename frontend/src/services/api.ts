@@ -1,5 +1,5 @@
 import axios from "axios";
-import { ChatResponse, PromotionRecord, SystemStatus } from "../types";
+import { ChatResponse, PromotionPage, PromotionRecord, SystemStatus } from "../types";
 
 const api = axios.create({
   baseURL: import.meta.env.VITE_API_BASE_URL ?? "http://localhost:7000"
@@ -19,16 +19,31 @@ export async function fetchStatus(): Promise<SystemStatus> {
   return response.data;
 }
 
-export async function fetchPromotions(): Promise<PromotionRecord[]> {
+export async function fetchPromotions(cursor?: string | null, limit = 5): Promise<PromotionPage> {
   try {
-    const response = await api.get<{ promotions: PromotionRecord[]; count: number }>("/api/promotions");
-    return response.data.promotions || [];
+    const response = await api.get<{ promotions: PromotionRecord[]; count: number; next_cursor?: string | null }>(
+      "/api/promotions",
+      { params: { limit, cursor: cursor ?? undefined } }
+    );
+    return {
+      promotions: response.data.promotions || [],
+      nextCursor: response.data.next_cursor ?? null
+    };
   } catch (error: unknown) {
     console.warn("Endpoint /api/promotions indisponível, retornando lista vazia.");
-    return [];
+    return { promotions: [], nextCursor: null };
   }
 }
 
+export async function downloadExport(promoData: Record<string, unknown>): Promise<Blob> {
+  const response = await api.post<Blob>(
+    "/api/export",
+    { promo_data: promoData, format: "excel", delivery: "stream" },
+    { responseType: "blob" }
+  );
+  return response.data;
+}
+
 export async function getPromotionState(sessionId: string): Promise<any> {
   const response = await api.get(`/api/promotion-state/${sessionId}`);
   return response.data;
@@ -36,7 +36,7 @@ export interface SystemStatus {
 }
 
 export interface PromotionRecord {
-  id: string;
+  id?: string;
   promo_id: string;
   session_id: string;
   titulo?: string;
@@ -51,3 +51,14 @@ export interface PromotionRecord {
   created_at: string;
   sent_at?: string;
 }
+
+export interface PromotionPage {
+  promotions: PromotionRecord[];
+  nextCursor: string | null;
+}
+
+export interface ExcelExportRef {
+  filename: string;
+  download_url?: string | null;
+  expires_at?: string | null;
+}
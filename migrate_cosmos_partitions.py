@@ -0,0 +1,56 @@
+"""
+Script de Migração do Particionamento do Cosmos DB
+Copia messages/promo_states do layout antigo (partição única) para os containers
+particionados por session_id e indexa as promoções existentes em promotion_ids.
+Pode ser interrompido e rodado de novo: continua do checkpoint e nunca sobrescreve
+documentos já presentes no destino.
+
+Uso:
+    python migrate_cosmos_partitions.py [messages,promo_states,promotion_ids] [--checkpoint arquivo] [--reset]
+
+    --reset  descarta o checkpoint e recomeça do início (documentos já copiados são pulados)
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+
+from shared.adapters.cosmos_adapter import CosmosDBAdapter
+from shared.adapters.cosmos_migration import PartitionMigration, MIGRATIONS
+
+
+async def migrate(kinds, checkpoint_path: str) -> bool:
+    adapter = CosmosDBAdapter()
+    if not adapter.client:
+        print("❌ Defina COSMOS_DB_ENDPOINT e COSMOS_DB_KEY")
+        return False
+
+    print(f"🚚 Migrando {', '.join(kinds)} (checkpoint: {checkpoint_path})")
+    try:
+        report = await PartitionMigration(adapter, checkpoint_path).run(kinds)
+    finally:
+        await adapter.close()
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return all(report[kind]["done"] for kind in kinds)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = sys.argv[1:]
+    checkpoint = "cosmos_migration_checkpoint.json"
+    if "--checkpoint" in args:
+        index = args.index("--checkpoint")
+        checkpoint = args[index + 1]
+        del args[index:index + 2]
+    if "--reset" in args and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    positional = [a for a in args if not a.startswith("--")]
+    kinds = positional[0].split(",") if positional else list(MIGRATIONS)
+    unknown = [kind for kind in kinds if kind not in MIGRATIONS]
+    if unknown:
+        print(f"❌ Tipos desconhecidos: {', '.join(unknown)} (use {', '.join(MIGRATIONS)})")
+        sys.exit(2)
+    sys.exit(0 if asyncio.run(migrate(kinds, checkpoint)) else 1)
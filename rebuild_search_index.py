@@ -0,0 +1,33 @@
+"""
+Script de Reconstrução do Índice de Busca de Promoções
+Cria (se necessário) e reconstrói o índice FTS5 de um banco SQLite existente
+
+Uso:
+    python rebuild_search_index.py [caminho_do_banco]
+"""
+import sys
+import asyncio
+import time
+
+from src.services.database import LocalDatabase
+
+
+async def rebuild(db_path: str) -> bool:
+    print(f"🔎 Reconstruindo índice de busca em: {db_path}")
+    database = LocalDatabase(db_path)
+    await database.initialize()
+
+    start = time.perf_counter()
+    ok = await database.rebuild_search_index()
+    elapsed = time.perf_counter() - start
+
+    if ok:
+        print(f"✅ Índice reconstruído em {elapsed:.2f}s")
+    else:
+        print("❌ Não foi possível reconstruir o índice (FTS5 disponível?)")
+    return ok
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else "promoagente_local.db"
+    sys.exit(0 if asyncio.run(rebuild(path)) else 1)
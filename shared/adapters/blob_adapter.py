@@ -2,17 +2,53 @@
 Blob Storage Adapter - Substitui armazenamento local por Azure Blob Storage
 Gerencia upload/download de arquivos Excel gerados
 Compatível com Python 3.11 e Azure Functions
+
+BlobStorageAdapter usa o SDK síncrono; AsyncBlobStorageAdapter (azure.storage.blob.aio)
+é a variante para código assíncrono: envia o arquivo em blocos paralelos direto de
+um file handle/SpooledTemporaryFile, sem carregar tudo na memória nem travar o worker,
+e gera links de download de curta duração (SAS) para o arquivo não trafegar em JSON.
 """
 import os
+import shutil
+import asyncio
 import logging
-from typing import Optional
-from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Optional, Union
+from urllib.parse import unquote
+from datetime import datetime, timedelta
 from pathlib import Path
 from io import BytesIO
-from azure.storage.blob import BlobServiceClient, ContentSettings
+from tempfile import SpooledTemporaryFile
+from azure.core.exceptions import ResourceExistsError
+from azure.storage.blob import BlobSasPermissions, BlobServiceClient, ContentSettings, generate_blob_sas
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+from shared.adapters.client_lifecycle import close_on_exit, close_stale_client
 
 logger = logging.getLogger(__name__)
 
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Upload assíncrono: arquivos acima de BLOB_MAX_SINGLE_PUT_SIZE vão em blocos de
+# BLOB_MAX_BLOCK_SIZE, até BLOB_UPLOAD_CONCURRENCY blocos em paralelo
+BLOB_MAX_BLOCK_SIZE = int(os.environ.get("BLOB_MAX_BLOCK_SIZE", str(4 * 1024 * 1024)))
+BLOB_MAX_SINGLE_PUT_SIZE = int(os.environ.get("BLOB_MAX_SINGLE_PUT_SIZE", str(8 * 1024 * 1024)))
+BLOB_UPLOAD_CONCURRENCY = int(os.environ.get("BLOB_UPLOAD_CONCURRENCY", "4"))
+# Workbooks até este tamanho ficam em memória; acima, o spool transborda para disco
+BLOB_SPOOL_MAX_MEMORY = int(os.environ.get("BLOB_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+# Validade dos links de download (SAS só de leitura) das exportações
+EXPORT_LINK_TTL_MINUTES = int(os.environ.get("EXPORT_LINK_TTL_MINUTES", "15"))
+
+
+async def spool_workbook(workbook, max_memory: int = BLOB_SPOOL_MAX_MEMORY) -> SpooledTemporaryFile:
+    """Serializa um openpyxl Workbook numa thread, num buffer que vai para disco se crescer"""
+    spool = SpooledTemporaryFile(max_size=max_memory)
+    try:
+        await asyncio.to_thread(workbook.save, spool)
+        spool.seek(0)
+        return spool
+    except Exception:
+        spool.close()
+        raise
+
 
 class BlobStorageAdapter:
     """Adapter para Azure Blob Storage - substitui armazenamento local"""
@@ -274,6 +310,240 @@ class BlobStorageAdapter:
             return []
 
 
+class AsyncBlobStorageAdapter:
+    """Variante assíncrona do BlobStorageAdapter (azure.storage.blob.aio)"""
+    
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], AsyncBlobServiceClient]] = None,
+        max_concurrency: int = BLOB_UPLOAD_CONCURRENCY
+    ):
+        """
+        Inicializa o cliente assíncrono usando variáveis de ambiente
+        
+        Args:
+            client_factory: Cria o cliente (testes apontam para um stand-in local);
+                por padrão AZURE_STORAGE_CONNECTION_STRING com os limites de bloco
+            max_concurrency: Blocos enviados em paralelo por arquivo
+        """
+        self.connection_string = os.environ.get("AZURE_STORAGE_CONNECTION_STRING")
+        self.container_name = "excel-exports"
+        self.max_concurrency = max_concurrency
+        self.client = None
+        self.container_client = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._container_ready = False
+        self.local_storage_path = Path("exports")
+        
+        if client_factory is None:
+            if not self.connection_string:
+                logger.warning("⚠️ Blob Storage não configurado. Arquivos serão salvos localmente.")
+                self.local_storage_path.mkdir(exist_ok=True)
+                return
+            client_factory = lambda: AsyncBlobServiceClient.from_connection_string(
+                self.connection_string,
+                max_block_size=BLOB_MAX_BLOCK_SIZE,
+                max_single_put_size=BLOB_MAX_SINGLE_PUT_SIZE
+            )
+        self._client_factory = client_factory
+        
+        try:
+            # O cliente só abre conexões no primeiro upload, dentro do event loop do worker
+            self._bind(client_factory())
+        except Exception as e:
+            logger.error(f"❌ Erro ao conectar Blob Storage: {e}")
+            self.client = None
+            self.local_storage_path.mkdir(exist_ok=True)
+    
+    def _bind(self, client):
+        self.client = client
+        self.container_client = client.get_container_client(self.container_name)
+        self._container_ready = False
+    
+    async def _ready(self):
+        """
+        Garante um cliente vivo no event loop atual e o container criado
+        
+        Um cliente por worker, compartilhado entre invocações; recriado se o loop
+        mudou (a sessão HTTP do cliente antigo pertence ao loop anterior, que é fechado).
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._loop is not None:
+                logger.info("🔄 Event loop mudou, recriando cliente Blob Storage")
+                stale = self.client
+                self._bind(self._client_factory())
+                await close_stale_client(stale, "Blob Storage")
+            self._loop = loop
+        
+        if not self._container_ready:
+            try:
+                await self.container_client.create_container()
+                logger.info(f"Container '{self.container_name}' criado")
+            except ResourceExistsError:
+                pass
+            self._container_ready = True
+    
+    async def close(self):
+        """Fecha as conexões HTTP do cliente (fim do worker/script)"""
+        if self.client and self._loop is not None:
+            await self.client.close()
+            self._loop = None
+    
+    async def upload_stream(
+        self,
+        stream: BinaryIO,
+        filename: str,
+        length: Optional[int] = None,
+        content_type: str = EXCEL_CONTENT_TYPE
+    ) -> str:
+        """
+        Upload a partir de um arquivo aberto ou SpooledTemporaryFile
+        
+        O SDK lê o stream em blocos e envia até max_concurrency blocos em paralelo;
+        o conteúdo nunca é carregado inteiro na memória.
+        
+        Returns:
+            str: URL do blob ou caminho local (fallback)
+        """
+        if not self.client:
+            return await asyncio.to_thread(self._save_local, stream, filename)
+        
+        try:
+            # Organiza arquivos por data: 2025/11/06/arquivo.xlsx
+            blob_name = f"{datetime.utcnow().strftime('%Y/%m/%d')}/{filename}"
+            
+            await self._ready()
+            blob_client = self.container_client.get_blob_client(blob_name)
+            await blob_client.upload_blob(
+                stream,
+                length=length,
+                overwrite=True,
+                max_concurrency=self.max_concurrency,
+                content_settings=ContentSettings(content_type=content_type)
+            )
+            
+            logger.info(f"✅ Arquivo enviado para Blob Storage: {blob_name}")
+            return blob_client.url
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao enviar para Blob Storage: {e}")
+            # Fallback para local
+            stream.seek(0)
+            return await asyncio.to_thread(self._save_local, stream, filename)
+    
+    async def upload_excel_file(
+        self,
+        file_content: Union[bytes, BinaryIO],
+        filename: str,
+        promo_id: str = None
+    ) -> str:
+        """
+        Upload de arquivo Excel (bytes ou file handle) para Blob Storage
+        
+        Returns:
+            str: URL do arquivo ou caminho local
+        """
+        if isinstance(file_content, (bytes, bytearray)):
+            return await self.upload_stream(BytesIO(file_content), filename, length=len(file_content))
+        return await self.upload_stream(file_content, filename)
+    
+    async def upload_excel_from_path(self, file_path: str) -> str:
+        """
+        Upload de arquivo Excel a partir de caminho local, em blocos direto do disco
+        
+        Returns:
+            str: URL do arquivo ou caminho local
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                return await self.upload_stream(f, Path(file_path).name, length=os.path.getsize(file_path))
+            
+        except Exception as e:
+            logger.error(f"Erro ao fazer upload do arquivo {file_path}: {e}")
+            return file_path
+    
+    async def upload_workbook(self, workbook, filename: str) -> str:
+        """
+        Serializa um openpyxl Workbook (fora do event loop) e envia para Blob Storage
+        
+        Returns:
+            str: URL do arquivo ou caminho local
+        """
+        with await spool_workbook(workbook) as spool:
+            length = spool.seek(0, os.SEEK_END)
+            spool.seek(0)
+            return await self.upload_stream(spool, filename, length=length)
+    
+    async def get_download_url(
+        self,
+        blob_url: str,
+        filename: Optional[str] = None,
+        expiry_minutes: int = EXPORT_LINK_TTL_MINUTES
+    ) -> Optional[Dict]:
+        """
+        Gera um link de download de curta duração (SAS só de leitura) para um blob
+        
+        Com connection string usa a chave da conta; com identidade gerenciada,
+        uma user delegation key. O SAS define o Content-Disposition, então o
+        navegador baixa com o nome do arquivo.
+        
+        Args:
+            blob_url: URL retornada pelo upload
+            filename: Nome sugerido no download (padrão: nome do blob)
+            expiry_minutes: Validade do link
+            
+        Returns:
+            dict: {"url", "expires_at"} ou None (sem Blob Storage ou arquivo salvo localmente)
+        """
+        if not self.client or not blob_url.startswith(self.client.url):
+            return None
+        
+        try:
+            await self._ready()
+            blob_name = unquote(blob_url.split(f"{self.container_name}/", 1)[-1])
+            filename = filename or Path(blob_name).name
+            now = datetime.utcnow()
+            expires_at = (now + timedelta(minutes=expiry_minutes)).replace(microsecond=0)
+            
+            account_key = getattr(self.client.credential, 'account_key', None)
+            delegation_key = None
+            if not account_key:
+                delegation_key = await self.client.get_user_delegation_key(now - timedelta(minutes=5), expires_at)
+            
+            sas_token = generate_blob_sas(
+                account_name=self.client.account_name,
+                container_name=self.container_name,
+                blob_name=blob_name,
+                account_key=account_key,
+                user_delegation_key=delegation_key,
+                permission=BlobSasPermissions(read=True),
+                start=now - timedelta(minutes=5),  # Tolerância a diferença de relógio
+                expiry=expires_at,
+                content_disposition=f'attachment; filename="{filename}"',
+                content_type=EXCEL_CONTENT_TYPE
+            )
+            return {"url": f"{blob_url}?{sas_token}", "expires_at": expires_at.isoformat() + "Z"}
+            
+        except Exception as e:
+            logger.error(f"❌ Erro ao gerar link de download: {e}")
+            return None
+    
+    def _save_local(self, stream: BinaryIO, filename: str) -> str:
+        """Salva o stream localmente como fallback (roda numa thread)"""
+        try:
+            filepath = self.local_storage_path / filename
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            
+            logger.info(f"📁 Arquivo salvo localmente: {filepath}")
+            return str(filepath.absolute())
+            
+        except Exception as e:
+            logger.error(f"Erro ao salvar localmente: {e}")
+            raise
+
+
 class ExcelServiceAzure:
     """
     Serviço de Excel integrado com Blob Storage
@@ -293,10 +563,45 @@ class ExcelServiceAzure:
         Returns:
             str: URL do arquivo no Blob ou caminho local
         """
+        wb = self._build_workbook(promo_data)
+        
+        # Salva em memória
+        excel_buffer = BytesIO()
+        wb.save(excel_buffer)
+        excel_buffer.seek(0)
+        
+        # Upload para Blob Storage
+        blob_url = self.blob_adapter.upload_excel_file(
+            excel_buffer.read(),
+            self._filename(promo_data),
+            promo_data.get('promo_id')
+        )
+        
+        return blob_url
+    
+    async def generate_promotion_excel_async(self, promo_data: dict, blob_adapter: "AsyncBlobStorageAdapter" = None) -> str:
+        """
+        Versão assíncrona: monta e serializa o workbook numa thread e envia em blocos
+        a partir de um SpooledTemporaryFile (AsyncBlobStorageAdapter)
+        
+        Returns:
+            str: URL do arquivo no Blob ou caminho local
+        """
+        wb = await asyncio.to_thread(self._build_workbook, promo_data)
+        return await (blob_adapter or async_blob_adapter).upload_workbook(wb, self._filename(promo_data))
+    
+    @staticmethod
+    def _filename(promo_data: dict) -> str:
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        titulo_safe = promo_data.get('titulo', 'promocao').replace(' ', '_')[:30]
+        return f"promocao_{titulo_safe}_{timestamp}.xlsx"
+    
+    @staticmethod
+    def _build_workbook(promo_data: dict):
+        """Monta o workbook da promoção (no caminho assíncrono roda numa thread)"""
         # Importa o serviço original
         from openpyxl import Workbook
         from openpyxl.styles import Font, PatternFill, Border, Side
-        from io import BytesIO
         
         # Cria workbook
         wb = Workbook()
@@ -335,26 +640,11 @@ class ExcelServiceAzure:
         ]
         ws.append(data_row)
         
-        # Salva em memória
-        excel_buffer = BytesIO()
-        wb.save(excel_buffer)
-        excel_buffer.seek(0)
-        
-        # Nome do arquivo
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        titulo_safe = promo_data.get('titulo', 'promocao').replace(' ', '_')[:30]
-        filename = f"promocao_{titulo_safe}_{timestamp}.xlsx"
-        
-        # Upload para Blob Storage
-        blob_url = self.blob_adapter.upload_excel_file(
-            excel_buffer.read(),
-            filename,
-            promo_data.get('promo_id')
-        )
-        
-        return blob_url
+        return wb
 
 
 # Instâncias globais
 blob_adapter = BlobStorageAdapter()
+async_blob_adapter = AsyncBlobStorageAdapter()
+close_on_exit(async_blob_adapter, "Blob Storage")
 excel_service_azure = ExcelServiceAzure()
@@ -0,0 +1,37 @@
+"""
+Ciclo de vida dos clientes assíncronos do Azure SDK (Cosmos DB e Blob Storage)
+
+Cada adapter mantém um cliente por event loop. Quando o loop muda, o cliente
+antigo é fechado (close_stale_client); no fim do processo, close_on_exit fecha
+o cliente global. O worker do Azure Functions não tem hook assíncrono de
+shutdown, então o fechamento final roda no atexit, num loop próprio.
+"""
+import atexit
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def close_stale_client(client, name: str):
+    """Fecha o cliente do loop anterior (sessão aiohttp e connector)"""
+    try:
+        await client.close()
+        logger.debug(f"Cliente {name} do loop anterior fechado")
+    except Exception as e:
+        # O loop antigo já pode ter fechado os sockets: o cliente é descartado de qualquer forma
+        logger.warning(f"⚠️ Cliente {name} do loop anterior não fechou de forma limpa: {e}")
+
+
+def close_on_exit(adapter, name: str):
+    """Registra o fechamento do cliente do adapter no encerramento do processo"""
+    def close():
+        if adapter._loop is None:
+            return
+        try:
+            asyncio.run(adapter.close())
+            logger.info(f"🔌 Cliente {name} fechado no encerramento")
+        except Exception as e:
+            logger.warning(f"⚠️ Erro ao fechar cliente {name} no encerramento: {e}")
+
+    atexit.register(close)
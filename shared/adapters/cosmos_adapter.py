@@ -1,76 +1,296 @@
 """
 Cosmos DB Adapter - Substitui SQLite por Azure Cosmos DB
 Compatível com Python 3.11 e Azure Functions
+
+Usa o SDK assíncrono (azure.cosmos.aio): as chamadas não bloqueiam o event loop
+do worker, então requests concorrentes no mesmo worker rodam em paralelo.
 """
 import os
+import asyncio
 import logging
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
 from datetime import datetime
-from azure.cosmos import CosmosClient, PartitionKey, exceptions
+from azure.cosmos import PartitionKey, exceptions
+from azure.cosmos.aio import CosmosClient
+
+from shared.adapters.client_lifecycle import close_on_exit, close_stale_client
+from shared.adapters.cosmos_metrics import ChargeHook, RequestChargeMeter, RequestUnitBudget
+from src.services.storage import PROMOTION_SUMMARY_FIELDS
 
 logger = logging.getLogger(__name__)
 
+# Layout de particionamento: todos os containers usam o path /partitionKey
+#   sessions, messages, promo_states -> session_id (cada conversa na sua partição lógica)
+#     (as trocas recentes ficam embutidas no documento da sessão; messages é o layout
+#      antigo, lido só para converter sessões criadas antes disso)
+#   promotions                       -> ano-mês do período (YYYY-MM)
+#   promotion_ids                    -> promo_id (índice promo_id -> partição de promotions)
+#   aggregates                       -> tipo agregado (contagens mantidas pelo change feed)
+# messages e promo_states ficavam numa partição só ("active" / sem chave) e foram
+# para containers novos; migrate_cosmos_partitions.py copia os dados antigos.
+CONTAINERS = {
+    "sessions": os.environ.get("COSMOS_SESSIONS_CONTAINER", "sessions"),
+    "messages": os.environ.get("COSMOS_MESSAGES_CONTAINER", "messages_v2"),
+    "promo_states": os.environ.get("COSMOS_PROMO_STATES_CONTAINER", "promo_states_v2"),
+    "promotions": os.environ.get("COSMOS_PROMOTIONS_CONTAINER", "promotions"),
+    "promotion_ids": os.environ.get("COSMOS_PROMOTION_IDS_CONTAINER", "promotion_ids"),
+    "aggregates": os.environ.get("COSMOS_AGGREGATES_CONTAINER", "aggregates"),
+}
+# Sessões: o TTL conta a partir da última escrita, então expira 30 dias após a última troca
+SESSION_TTL_SECONDS = 2592000
+
+# Documentos de agregado (um por tipo) mantidos por cosmos_aggregates.ChangeFeedAggregator
+AGGREGATE_KINDS = ("messages", "promotions")
+PARTITION_KEY_PATH = "/partitionKey"
+# Resultado de save_promotions quando o promo_id já foi gravado por outra sessão
+PROMOTION_CONFLICT_ERROR = "promo_id já usado por outra sessão"
+
+# Listagem paginada do histórico: só as colunas de resumo (as mesmas de todo StorageBackend),
+# ordem estável (created_at, id). ORDER BY em duas propriedades exige o índice composto
+# abaixo no container promotions.
+PROMOTION_PAGE_QUERY = (
+    f"SELECT {', '.join(f'c.{field}' for field in PROMOTION_SUMMARY_FIELDS)} FROM c "
+    "ORDER BY c.created_at DESC, c.id DESC"
+)
+PROMOTION_COMPOSITE_INDEXES = [
+    [{"path": "/created_at", "order": "descending"}, {"path": "/id", "order": "descending"}]
+]
+INDEXING_POLICIES = {
+    "promotions": {
+        "indexingMode": "consistent",
+        "automatic": True,
+        "includedPaths": [{"path": "/*"}],
+        "excludedPaths": [{"path": '/"_etag"/?'}],
+        "compositeIndexes": PROMOTION_COMPOSITE_INDEXES,
+    },
+}
+
+# Orçamento de RU/s no cliente (0 desabilita): suaviza rajadas antes de virarem 429
+COSMOS_RU_BUDGET = float(os.environ.get("COSMOS_RU_BUDGET", "0"))
+COSMOS_RU_BURST_SECONDS = float(os.environ.get("COSMOS_RU_BURST_SECONDS", "1"))
+COSMOS_BULK_RESERVE = float(os.environ.get("COSMOS_BULK_RESERVE", "0.5"))  # Fração da rajada reservada ao chat
+
 
 class CosmosDBAdapter:
     """Adapter para Azure Cosmos DB - substitui LocalDatabase"""
     
-    def __init__(self):
-        """Inicializa conexão com Cosmos DB usando variáveis de ambiente"""
+    # Limite de operações por chamada de patch do Cosmos DB
+    MAX_PATCH_OPERATIONS = 10
+    # promo_id -> partição (imutável depois de gravada), mantido em LRU por worker
+    PROMOTION_PARTITION_CACHE_SIZE = 2048
+    # Limite de operações por transactional batch e partições gravadas em paralelo
+    MAX_BATCH_OPERATIONS = 100
+    BULK_PARTITION_CONCURRENCY = 4
+    # Trocas embutidas no documento da sessão e sessões conhecidas (LRU) por worker
+    MAX_SESSION_TURNS = 20
+    SESSION_CACHE_SIZE = 4096
+    # Tentativas do patch com corte quando outro worker mudou o array antes (412)
+    SESSION_PATCH_ATTEMPTS = 3
+    
+    def __init__(
+        self,
+        client_factory: Optional[Callable[[], CosmosClient]] = None,
+        budget: Optional[RequestUnitBudget] = None
+    ):
+        """
+        Inicializa conexão com Cosmos DB usando variáveis de ambiente
+        
+        Args:
+            client_factory: Cria o cliente (testes usam um cliente fake); por padrão
+                CosmosClient assíncrono com COSMOS_DB_ENDPOINT/COSMOS_DB_KEY
+            budget: Orçamento de RU/s; por padrão COSMOS_RU_BUDGET
+        """
         self.endpoint = os.environ.get("COSMOS_DB_ENDPOINT")
         self.key = os.environ.get("COSMOS_DB_KEY")
         self.database_name = "PromoAgente"
+        self.client = None
+        self.database = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._promotion_partitions: "OrderedDict[str, str]" = OrderedDict()
+        self._sessions: "OrderedDict[str, Optional[int]]" = OrderedDict()  # session_id -> trocas no array
+        self.metrics = RequestChargeMeter()
+        self.budget = budget or RequestUnitBudget(COSMOS_RU_BUDGET, COSMOS_RU_BURST_SECONDS, COSMOS_BULK_RESERVE)
         
-        if not self.endpoint or not self.key:
-            logger.warning("⚠️ Cosmos DB credentials não configuradas. Usando modo local.")
-            self.client = None
-            self.database = None
-            return
+        if client_factory is None:
+            if not self.endpoint or not self.key:
+                logger.warning("⚠️ Cosmos DB credentials não configuradas. Usando modo local.")
+                return
+            client_factory = lambda: CosmosClient(self.endpoint, self.key)
+        self._client_factory = client_factory
         
         try:
-            self.client = CosmosClient(self.endpoint, self.key)
-            self.database = self.client.get_database_client(self.database_name)
-            
-            # Containers
-            self.sessions_container = self.database.get_container_client("sessions")
-            self.messages_container = self.database.get_container_client("messages")
-            self.promo_states_container = self.database.get_container_client("promo_states")
-            self.promotions_container = self.database.get_container_client("promotions")
-            
+            # O cliente só abre conexões no primeiro request, dentro do event loop do worker
+            self._bind(client_factory())
             logger.info("✅ Cosmos DB conectado com sucesso!")
             
         except Exception as e:
             logger.error(f"❌ Erro ao conectar Cosmos DB: {e}")
             self.client = None
     
+    def _bind(self, client):
+        """Associa o cliente e os proxies dos containers"""
+        self.client = client
+        self.database = self.client.get_database_client(self.database_name)
+        
+        # Containers
+        self.sessions_container = self.database.get_container_client(CONTAINERS["sessions"])
+        self.messages_container = self.database.get_container_client(CONTAINERS["messages"])
+        self.promo_states_container = self.database.get_container_client(CONTAINERS["promo_states"])
+        self.promotions_container = self.database.get_container_client(CONTAINERS["promotions"])
+        self.promotion_ids_container = self.database.get_container_client(CONTAINERS["promotion_ids"])
+        self.aggregates_container = self.database.get_container_client(CONTAINERS["aggregates"])
+    
+    async def _ready(self):
+        """
+        Garante um cliente vivo no event loop atual
+        
+        Um cliente por worker, compartilhado entre invocações. Se o loop mudou
+        (ex: asyncio.run em scripts/testes), a sessão HTTP antiga não serve mais:
+        um cliente novo é criado e o antigo é fechado (senão a sessão aiohttp e
+        o connector dele ficam abertos até o fim do processo).
+        """
+        if not self.client:
+            raise RuntimeError("Cosmos DB não configurado")
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        if self._loop is not None:
+            logger.info("🔄 Event loop mudou, recriando cliente Cosmos DB")
+            stale = self.client
+            self._bind(self._client_factory())
+            await close_stale_client(stale, "Cosmos DB")
+        self._loop = loop
+    
     async def initialize(self):
         """Inicialização assíncrona (compatibilidade com código existente)"""
         if not self.client:
             logger.warning("⚠️ Cosmos DB não inicializado")
             return False
         
+        await self._ready()
         logger.info("✅ Cosmos DB pronto para uso")
         return True
     
+    async def ensure_containers(self) -> bool:
+        """
+        Cria os containers do layout atual que ainda não existem (deploy/migração)
+        
+        Containers já existentes recebem a política de índice de INDEXING_POLICIES
+        se ainda não tiverem os índices compostos (a reindexação roda no servidor).
+        """
+        try:
+            await self._ready()
+            for kind, name in CONTAINERS.items():
+                policy = INDEXING_POLICIES.get(kind)
+                extra = {"indexing_policy": policy} if policy else {}
+                container = await self._call(
+                    "containers.create", self.database.create_container_if_not_exists,
+                    id=name, partition_key=PartitionKey(path=PARTITION_KEY_PATH), **extra
+                )
+                if not policy:
+                    continue
+                properties = await self._call("containers.read", container.read)
+                if properties.get("indexingPolicy", {}).get("compositeIndexes") != policy["compositeIndexes"]:
+                    logger.info(f"🗂️ Atualizando política de índice de {name}")
+                    await self._call(
+                        "containers.replace", self.database.replace_container,
+                        container=container, partition_key=PartitionKey(path=PARTITION_KEY_PATH),
+                        indexing_policy=policy
+                    )
+            return True
+        
+        except Exception as e:
+            logger.error(f"Erro ao criar containers: {e}")
+            return False
+    
+    def get_stats(self) -> Dict:
+        """RU consumido (por operação e por minuto) e estado do orçamento de RU/s"""
+        return {"request_units": self.metrics.get_stats(), "budget": self.budget.get_stats()}
+    
+    async def close(self):
+        """Fecha as conexões HTTP do cliente (fim do worker/script)"""
+        if self.client and self._loop is not None:
+            await self.client.close()
+            self._loop = None
+    
+    async def _call(self, operation: str, method, **kwargs):
+        """
+        Executa uma chamada do SDK dentro do orçamento de RU, registrando o custo
+        
+        O RU vem do x-ms-request-charge (response_hook em sucesso, headers da
+        exceção em erro); um 429 segura as próximas chamadas pelo retry-after.
+        """
+        await self.budget.acquire()
+        hook = ChargeHook()
+        try:
+            result = await method(response_hook=hook, **kwargs)
+        except (exceptions.CosmosHttpResponseError, exceptions.CosmosBatchOperationError) as e:
+            charge, retry_after = self.metrics.record_error(operation, e)
+            self.budget.consume(charge)
+            if retry_after is not None:
+                logger.warning(f"⏳ Cosmos DB throttling em {operation} (retry-after {retry_after:.2f}s)")
+                self.budget.throttled(retry_after)
+            raise
+        self.metrics.record(operation, hook.charge)
+        self.budget.consume(hook.charge)
+        return result
+    
+    async def _query(self, operation: str, container, query: str, parameters: Optional[List[Dict]] = None,
+                     partition_key: Optional[str] = None) -> List:
+        """
+        Executa uma query e junta os itens
+        
+        Com partition_key a query fica numa partição lógica; sem ela o SDK
+        assíncrono faz fan-out em todas (use só para listagens/administração).
+        """
+        async def collect(**kwargs):
+            return [item async for item in container.query_items(query=query, parameters=parameters, **kwargs)]
+        
+        kwargs = {"partition_key": partition_key} if partition_key is not None else {}
+        return await self._call(operation, collect, **kwargs)
+    
     # ========== SESSIONS ==========
     
+    def _remember_session(self, session_id: str, turns: Optional[int]):
+        """Registra que a sessão existe (e quantas trocas o array tinha na última leitura/escrita)"""
+        self._sessions[session_id] = turns
+        self._sessions.move_to_end(session_id)
+        if len(self._sessions) > self.SESSION_CACHE_SIZE:
+            self._sessions.popitem(last=False)
+    
+    @staticmethod
+    def _session_document(session_id: str, user_agent: str = None, turns: Optional[List[Dict]] = None) -> Dict:
+        now = datetime.utcnow().isoformat()
+        return {
+            "id": session_id,
+            "partitionKey": session_id,
+            "session_id": session_id,
+            "created_at": now,
+            "last_activity": now,
+            "user_agent": user_agent or "unknown",
+            "turns": turns or [],
+            "turn_count": len(turns or []),
+            "ttl": SESSION_TTL_SECONDS
+        }
+    
     async def create_session(self, session_id: str, user_agent: str = None) -> bool:
-        """Cria uma nova sessão"""
+        """Cria uma nova sessão (sessões já vistas neste worker não vão ao Cosmos)"""
+        if session_id in self._sessions:
+            return True
         try:
-            session = {
-                "id": session_id,
-                "partitionKey": "session",
-                "created_at": datetime.utcnow().isoformat(),
-                "last_activity": datetime.utcnow().isoformat(),
-                "user_agent": user_agent or "unknown",
-                "ttl": 86400  # 24 horas
-            }
-            
-            self.sessions_container.create_item(session)
+            await self._ready()
+            await self._call(
+                "sessions.create", self.sessions_container.create_item,
+                body=self._session_document(session_id, user_agent)
+            )
+            self._remember_session(session_id, 0)
             logger.info(f"Session criada: {session_id}")
             return True
             
         except exceptions.CosmosResourceExistsError:
             logger.debug(f"Session já existe: {session_id}")
+            self._remember_session(session_id, None)
             return True
         except Exception as e:
             logger.error(f"Erro ao criar session: {e}")
@@ -79,55 +299,160 @@ class CosmosDBAdapter:
     # ========== MESSAGES ==========
     
     async def save_message(self, session_id: str, user_message: str, ai_response: str) -> bool:
-        """Salva uma mensagem no histórico"""
+        """Acrescenta uma troca ao documento da sessão (um patch; cria a sessão se não existe)"""
         try:
-            message = {
-                "id": f"msg_{datetime.utcnow().timestamp()}",
-                "session_id": session_id,
+            turn = {
                 "user_message": user_message,
                 "ai_response": ai_response,
-                "timestamp": datetime.utcnow().isoformat(),
-                "ttl": 2592000  # 30 dias
+                "timestamp": datetime.utcnow().isoformat()
             }
             
-            self.messages_container.create_item(message)
+            await self._ready()
+            await self._append_turn(session_id, turn)
             return True
             
         except Exception as e:
             logger.error(f"Erro ao salvar mensagem: {e}")
             return False
     
+    async def _append_turn(self, session_id: str, turn: Dict, retry: bool = True):
+        """Acrescenta a troca ao documento da sessão (cria o documento se não existe)"""
+        try:
+            document = await self._patch_turn(session_id, turn)
+        except exceptions.CosmosResourceNotFoundError:
+            # Sessão nova (ou expirada pelo TTL): o documento já nasce com a troca
+            try:
+                document = await self._call(
+                    "sessions.create", self.sessions_container.create_item,
+                    body=self._session_document(session_id, turns=[turn])
+                )
+            except exceptions.CosmosResourceExistsError:
+                if not retry:
+                    raise
+                self._sessions.pop(session_id, None)
+                return await self._append_turn(session_id, turn, retry=False)
+        except exceptions.CosmosHttpResponseError as e:
+            # 400: sessão do layout antigo, sem /turns - converte e repete
+            if e.status_code != 400 or not retry:
+                raise
+            await self._upgrade_legacy_session(session_id)
+            return await self._append_turn(session_id, turn, retry=False)
+        
+        self._remember_session(session_id, len(document.get('turns') or []))
+    
+    async def _patch_turn(self, session_id: str, turn: Dict) -> Dict:
+        """
+        Patch: add no fim do array, remove do início o que passar de MAX_SESSION_TURNS
+        
+        turn_count sobe com incr, atômico entre workers. O corte depende do tamanho
+        do array na última leitura/escrita deste worker, então o patch que remove só
+        vale se o array ainda tem esse tamanho (filtro condicional): se outro worker
+        mudou o array (412), relê o documento e recalcula. Sem tamanho conhecido (ou
+        depois de SESSION_PATCH_ATTEMPTS conflitos) o turno entra sem corte e um
+        patch seguinte corta - nunca sai troca a mais.
+        """
+        operations = [{"op": "add", "path": "/turns/-", "value": turn}]
+        fields = [
+            {"op": "set", "path": "/last_activity", "value": turn["timestamp"]},
+            {"op": "incr", "path": "/turn_count", "value": 1}
+        ]
+        
+        for _ in range(self.SESSION_PATCH_ATTEMPTS):
+            known = self._sessions.get(session_id)
+            excess = max(0, known + 1 - self.MAX_SESSION_TURNS) if known is not None else 0
+            if not excess:
+                break
+            removals = [{"op": "remove", "path": "/turns/0"}] * min(excess, self.MAX_PATCH_OPERATIONS - 3)
+            try:
+                return await self._call(
+                    "sessions.patch", self.sessions_container.patch_item,
+                    item=session_id, partition_key=session_id, patch_operations=operations + removals + fields,
+                    filter_predicate=f"FROM c WHERE ARRAY_LENGTH(c.turns) = {known}"
+                )
+            except exceptions.CosmosAccessConditionFailedError:
+                document = await self._call(
+                    "sessions.read", self.sessions_container.read_item, item=session_id, partition_key=session_id
+                )
+                self._remember_session(session_id, len(document.get('turns') or []))
+        
+        return await self._call(
+            "sessions.patch", self.sessions_container.patch_item,
+            item=session_id, partition_key=session_id, patch_operations=operations + fields
+        )
+    
+    async def _upgrade_legacy_session(self, session_id: str) -> List[Dict]:
+        """
+        Sessão criada antes das trocas embutidas: copia as últimas mensagens do
+        container messages para o array (uma vez; depois tudo é point read)
+        """
+        query = f"""
+            SELECT TOP {self.MAX_SESSION_TURNS} *
+            FROM c
+            WHERE c.session_id = @session_id
+            ORDER BY c.timestamp DESC
+        """
+        parameters = [{"name": "@session_id", "value": session_id}]
+        items = await self._query("messages.query", self.messages_container, query, parameters, partition_key=session_id)
+        turns = [
+            {
+                "user_message": item.get('user_message', ''),
+                "ai_response": item.get('ai_response', ''),
+                "timestamp": item.get('timestamp')
+            }
+            for item in reversed(items)  # Ordem cronológica
+        ]
+        
+        try:
+            document = await self._call(
+                "sessions.patch", self.sessions_container.patch_item,
+                item=session_id, partition_key=session_id,
+                patch_operations=[
+                    {"op": "set", "path": "/turns", "value": turns},
+                    {"op": "set", "path": "/turn_count", "value": 0},  # Já contadas no layout antigo
+                    {"op": "set", "path": "/ttl", "value": SESSION_TTL_SECONDS}
+                ],
+                filter_predicate="FROM c WHERE NOT IS_DEFINED(c.turns)"
+            )
+        except exceptions.CosmosAccessConditionFailedError:
+            # Outra chamada converteu antes (e pode já ter acrescentado trocas)
+            document = await self._call(
+                "sessions.read", self.sessions_container.read_item, item=session_id, partition_key=session_id
+            )
+        
+        self._remember_session(session_id, len(document.get('turns') or []))
+        return document.get('turns') or []
+    
     async def get_recent_messages(self, session_id: str, limit: int = 20) -> List[Dict]:
-        """Busca mensagens recentes de uma sessão"""
+        """Mensagens das últimas `limit` trocas (até MAX_SESSION_TURNS), com um point read"""
         try:
-            query = f"""
-                SELECT TOP {limit} *
-                FROM c
-                WHERE c.session_id = @session_id
-                ORDER BY c.timestamp DESC
-            """
-            
-            parameters = [{"name": "@session_id", "value": session_id}]
+            await self._ready()
+            try:
+                document = await self._call(
+                    "sessions.read", self.sessions_container.read_item,
+                    item=session_id, partition_key=session_id
+                )
+            except exceptions.CosmosResourceNotFoundError:
+                return []
             
-            items = list(self.messages_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
+            if 'turns' in document:
+                turns = document['turns']
+                self._remember_session(session_id, len(turns))
+            else:
+                turns = await self._upgrade_legacy_session(session_id)
             
             # Converte para formato esperado pelo código
             messages = []
-            for item in reversed(items):  # Ordem cronológica
-                if item.get('user_message'):
+            for turn in (turns[-limit:] if limit else []):
+                if turn.get('user_message'):
                     messages.append({
                         "role": "user",
-                        "content": item['user_message']
+                        "content": turn['user_message']
                     })
-                if item.get('ai_response'):
+                if turn.get('ai_response'):
                     messages.append({
                         "role": "assistant",
-                        "content": item['ai_response'],
-                        "timestamp": item.get('timestamp')
+                        "content": turn['ai_response'],
+                        "timestamp": turn.get('timestamp')
                     })
             
             return messages
@@ -137,14 +462,17 @@ class CosmosDBAdapter:
             return []
     
     async def get_message_count(self) -> int:
-        """Retorna total de mensagens (para health check)"""
+        """
+        Retorna total de trocas gravadas nas sessões (para health check)
+        
+        Cross-partition: use só em administração; o StatusFunction lê o agregado
+        (get_aggregates), mantido pelo change feed.
+        """
         try:
-            query = "SELECT VALUE COUNT(1) FROM c"
-            result = list(self.messages_container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
-            return result[0] if result else 0
+            query = "SELECT VALUE SUM(c.turn_count) FROM c"
+            await self._ready()
+            result = await self._query("sessions.count", self.sessions_container, query)
+            return (result[0] or 0) if result else 0
             
         except Exception as e:
             logger.warning(f"Erro ao contar mensagens: {e}")
@@ -157,7 +485,8 @@ class CosmosDBAdapter:
         try:
             promo_state = {
                 "id": session_id,
-                "partitionKey": "active",
+                "partitionKey": session_id,
+                "session_id": session_id,
                 "promo_id": state_dict.get('promo_id'),
                 "status": state_dict.get('status', 'draft'),
                 "completion": state_dict.get('completion', 0),
@@ -167,19 +496,59 @@ class CosmosDBAdapter:
                 "ttl": 604800  # 7 dias
             }
             
-            self.promo_states_container.upsert_item(promo_state)
+            await self._ready()
+            await self._call("promo_states.upsert", self.promo_states_container.upsert_item, body=promo_state)
             return True
             
         except Exception as e:
             logger.error(f"Erro ao salvar promo_state: {e}")
             return False
     
+    async def update_promo_state_fields(self, session_id: str, fields: Dict) -> bool:
+        """
+        Atualiza só os campos alterados de um estado (patch), sem regravar o documento
+        
+        Returns:
+            bool: False se o patch não se aplica (documento inexistente, limite de
+            operações do Cosmos) - o chamador deve então salvar o estado completo
+        """
+        operations = [
+            {"op": "set", "path": f"/data/{name}", "value": value}
+            for name, value in fields.items()
+        ]
+        # Campos espelhados no topo do documento
+        for name in ('promo_id', 'status'):
+            if name in fields:
+                operations.append({"op": "set", "path": f"/{name}", "value": fields[name]})
+        operations.append({"op": "set", "path": "/updated_at", "value": datetime.utcnow().isoformat()})
+        
+        if len(operations) > self.MAX_PATCH_OPERATIONS:
+            return False
+        
+        try:
+            await self._ready()
+            await self._call(
+                "promo_states.patch", self.promo_states_container.patch_item,
+                item=session_id,
+                partition_key=session_id,
+                patch_operations=operations
+            )
+            return True
+        
+        except exceptions.CosmosResourceNotFoundError:
+            return False
+        except Exception as e:
+            logger.error(f"Erro ao atualizar campos do promo_state: {e}")
+            return False
+    
     async def get_promo_state(self, session_id: str) -> Optional[Dict]:
         """Recupera o estado de uma promoção"""
         try:
-            item = self.promo_states_container.read_item(
+            await self._ready()
+            item = await self._call(
+                "promo_states.read", self.promo_states_container.read_item,
                 item=session_id,
-                partition_key="active"
+                partition_key=session_id
             )
             return item.get('data') if item else None
             
@@ -192,9 +561,11 @@ class CosmosDBAdapter:
     async def delete_promo_state(self, session_id: str) -> bool:
         """Remove o estado de uma promoção"""
         try:
-            self.promo_states_container.delete_item(
+            await self._ready()
+            await self._call(
+                "promo_states.delete", self.promo_states_container.delete_item,
                 item=session_id,
-                partition_key="active"
+                partition_key=session_id
             )
             return True
             
@@ -208,10 +579,8 @@ class CosmosDBAdapter:
         """Lista todos os estados de promoções"""
         try:
             query = "SELECT c.data FROM c"
-            items = list(self.promo_states_container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
+            await self._ready()
+            items = await self._query("promo_states.list", self.promo_states_container, query)
             return [item['data'] for item in items]
             
         except Exception as e:
@@ -221,32 +590,153 @@ class CosmosDBAdapter:
     # ========== PROMOTIONS (FINALIZADAS) ==========
     
     async def save_promotion(self, state_dict: Dict) -> bool:
-        """Salva uma promoção finalizada"""
+        """Salva uma promoção finalizada (idempotente: promo_id já gravado é mantido)"""
+        promo_id = state_dict.get('promo_id')
         try:
             # Partition key baseado em ano-mês para otimizar queries
             periodo_inicio = state_dict.get('periodo_inicio', '')
-            partition_key = self._extract_year_month(periodo_inicio)
-            
-            promotion = {
-                "id": state_dict.get('promo_id'),
-                "partitionKey": partition_key,
-                **state_dict,  # Todos os campos do state_dict
-                "created_at": state_dict.get('created_at', datetime.utcnow().isoformat()),
-                "sent_at": datetime.utcnow().isoformat()
-            }
-            
-            # Remove campos desnecessários
-            promotion.pop('completion', None)
-            promotion.pop('metadata', None)
+            await self._ready()
+            # O índice reserva o promo_id primeiro: id só é único por partição no Cosmos,
+            # e um reenvio com outro período deve cair na partição já registrada
+            partition_key = await self._claim_promotion_partition(
+                promo_id, self._extract_year_month(periodo_inicio)
+            )
             
-            self.promotions_container.create_item(promotion)
-            logger.info(f"Promoção salva: {state_dict.get('promo_id')}")
+            await self._call(
+                "promotions.create", self.promotions_container.create_item,
+                body=self._promotion_document(state_dict, partition_key)
+            )
+            logger.info(f"Promoção salva: {promo_id}")
             return True
             
+        except exceptions.CosmosResourceExistsError:
+            if not await self._same_promotion_owner(state_dict, partition_key):
+                logger.error(f"Promoção não salva, {PROMOTION_CONFLICT_ERROR}: {promo_id}")
+                return False
+            logger.debug(f"Promoção já existe: {promo_id}")
+            return True
         except Exception as e:
             logger.error(f"Erro ao salvar promotion: {e}")
             return False
     
+    async def save_promotions(self, promotions: List[Dict]) -> List[Dict]:
+        """
+        Salva várias promoções: um transactional batch por partição (ano-mês)
+        
+        Cada batch é atômico; partições diferentes são gravadas em paralelo (até
+        BULK_PARTITION_CONCURRENCY) e podem falhar de forma independente, por isso
+        o resultado é por item.
+        
+        Returns:
+            List[Dict]: Um resultado por promoção, na ordem recebida:
+            {"promo_id", "status": "inserted" | "exists" | "failed"}
+        """
+        results = [{"promo_id": promo.get('promo_id'), "status": "inserted"} for promo in promotions]
+        pending = {}
+        for result, promo in zip(results, promotions):
+            if not result["promo_id"]:
+                result.update(status="failed", error="promo_id ausente")
+            elif result["promo_id"] not in pending:
+                pending[result["promo_id"]] = (result, promo)
+            elif pending[result["promo_id"]][1].get('session_id') == promo.get('session_id'):
+                result["status"] = "exists"
+            else:
+                result.update(status="failed", error=PROMOTION_CONFLICT_ERROR)
+        if not pending:
+            return results
+        
+        try:
+            await self._ready()
+        except Exception as e:
+            logger.error(f"Erro ao salvar promotions em lote: {e}")
+            for result, _ in pending.values():
+                result.update(status="failed", error=str(e))
+            return results
+        
+        semaphore = asyncio.Semaphore(self.BULK_PARTITION_CONCURRENCY)
+        by_partition: Dict[str, List[tuple]] = {}
+        
+        async def claim(result, promo):
+            async with semaphore:
+                try:
+                    partition_key = await self._claim_promotion_partition(
+                        result["promo_id"], self._extract_year_month(promo.get('periodo_inicio', ''))
+                    )
+                    by_partition.setdefault(partition_key, []).append((result, promo))
+                except Exception as e:
+                    result.update(status="failed", error=str(e))
+        
+        async def write(partition_key, items):
+            async with semaphore:
+                await self._write_promotion_batch(partition_key, items)
+        
+        await asyncio.gather(*(claim(result, promo) for result, promo in pending.values()))
+        await asyncio.gather(*(
+            write(partition_key, items[start:start + self.MAX_BATCH_OPERATIONS])
+            for partition_key, items in by_partition.items()
+            for start in range(0, len(items), self.MAX_BATCH_OPERATIONS)
+        ))
+        
+        failed = sum(1 for result in results if result["status"] == "failed")
+        logger.info(f"Promoções em lote: {len(results) - failed} ok, {failed} com erro ({len(by_partition)} partição(ões))")
+        return results
+    
+    async def _write_promotion_batch(self, partition_key: str, items: List[tuple]):
+        """Grava um transactional batch; promoções já existentes saem do batch e ele é reenviado"""
+        while items:
+            operations = [("create", (self._promotion_document(promo, partition_key),)) for _, promo in items]
+            try:
+                await self._call(
+                    "promotions.batch", self.promotions_container.execute_item_batch,
+                    batch_operations=operations, partition_key=partition_key
+                )
+                return
+            except exceptions.CosmosBatchOperationError as e:
+                status_code = (e.operation_responses or [{}])[e.error_index].get("statusCode")
+                if status_code != 409:
+                    for result, _ in items:
+                        result.update(status="failed", error=str(e))
+                    logger.error(f"Erro no batch de promotions ({partition_key}): {e}")
+                    return
+                failed_result, failed_promo = items[e.error_index]
+                if await self._same_promotion_owner(failed_promo, partition_key):
+                    failed_result["status"] = "exists"
+                else:
+                    failed_result.update(status="failed", error=PROMOTION_CONFLICT_ERROR)
+                items = items[:e.error_index] + items[e.error_index + 1:]
+            except Exception as e:
+                for result, _ in items:
+                    result.update(status="failed", error=str(e))
+                logger.error(f"Erro no batch de promotions ({partition_key}): {e}")
+                return
+    
+    async def _same_promotion_owner(self, promotion: Dict, partition_key: str) -> bool:
+        """promo_id já gravado: reenvio da mesma sessão (True) ou colisão com outra (False)"""
+        try:
+            existing = await self._call(
+                "promotions.read", self.promotions_container.read_item,
+                item=promotion.get('promo_id'), partition_key=partition_key
+            )
+            return existing.get('session_id') == promotion.get('session_id')
+        except Exception as e:
+            logger.error(f"Erro ao conferir promoção existente {promotion.get('promo_id')}: {e}")
+            return False
+    
+    @staticmethod
+    def _promotion_document(state_dict: Dict, partition_key: str) -> Dict:
+        promotion = {
+            "id": state_dict.get('promo_id'),
+            "partitionKey": partition_key,
+            **state_dict,  # Todos os campos do state_dict
+            "created_at": state_dict.get('created_at', datetime.utcnow().isoformat()),
+            "sent_at": datetime.utcnow().isoformat()
+        }
+        
+        # Remove campos desnecessários
+        promotion.pop('completion', None)
+        promotion.pop('metadata', None)
+        return promotion
+    
     async def get_promotions(self, limit: int = 50) -> List[Dict]:
         """Lista promoções finalizadas"""
         try:
@@ -256,10 +746,8 @@ class CosmosDBAdapter:
                 ORDER BY c.created_at DESC
             """
             
-            items = list(self.promotions_container.query_items(
-                query=query,
-                enable_cross_partition_query=True
-            ))
+            await self._ready()
+            items = await self._query("promotions.list", self.promotions_container, query)
             
             return items
             
@@ -267,25 +755,139 @@ class CosmosDBAdapter:
             logger.error(f"Erro ao listar promotions: {e}")
             return []
     
+    async def get_promotions_page(self, page_size: int = 20, cursor: Optional[str] = None) -> Dict:
+        """
+        Lista promoções finalizadas (mais recentes primeiro) uma página por vez
+        
+        Usa o continuation token do SDK como cursor: cada página lê só page_size
+        documentos (projeção de resumo), independente do tamanho do container.
+        
+        Returns:
+            Dict: {"promotions": [colunas de resumo], "next_cursor": str ou None}
+        """
+        async def first_page(**kwargs):
+            pages = self.promotions_container.query_items(
+                query=PROMOTION_PAGE_QUERY, max_item_count=page_size, **kwargs
+            ).by_page(cursor)
+            async for page in pages:
+                return [item async for item in page], pages.continuation_token
+            return [], None
+        
+        try:
+            await self._ready()
+            items, next_cursor = await self._call("promotions.page", first_page)
+            return {"promotions": items, "next_cursor": next_cursor}
+            
+        except Exception as e:
+            logger.error(f"Erro ao paginar promotions: {e}")
+            return {"promotions": [], "next_cursor": None}
+    
     async def get_promotion_by_id(self, promo_id: str) -> Optional[Dict]:
-        """Busca uma promoção por ID"""
+        """
+        Busca uma promoção por ID
+        
+        Com a partição em cache é um único point read (1 RU); senão o índice
+        promotion_ids resolve a partição com outro point read. A query
+        cross-partition só roda para promoções gravadas antes do índice, e o
+        resultado alimenta o índice para as próximas leituras.
+        """
         try:
-            # Como não sabemos o partition key, fazemos query cross-partition
+            await self._ready()
+            partition_key = await self._promotion_partition(promo_id)
+            if partition_key is not None:
+                try:
+                    return await self._call(
+                        "promotions.read", self.promotions_container.read_item,
+                        item=promo_id, partition_key=partition_key
+                    )
+                except exceptions.CosmosResourceNotFoundError:
+                    return None
+            
             query = "SELECT * FROM c WHERE c.id = @promo_id"
             parameters = [{"name": "@promo_id", "value": promo_id}]
+            items = await self._query("promotions.query_by_id", self.promotions_container, query, parameters)
+            if not items:
+                return None
             
-            items = list(self.promotions_container.query_items(
-                query=query,
-                parameters=parameters,
-                enable_cross_partition_query=True
-            ))
-            
-            return items[0] if items else None
+            await self._claim_promotion_partition(promo_id, items[0]["partitionKey"])
+            return items[0]
             
         except Exception as e:
             logger.error(f"Erro ao buscar promotion: {e}")
             return None
     
+    async def _promotion_partition(self, promo_id: str) -> Optional[str]:
+        """Partição de uma promoção: LRU local, depois point read no índice"""
+        partition_key = self._promotion_partitions.get(promo_id)
+        if partition_key is not None:
+            self._promotion_partitions.move_to_end(promo_id)
+            return partition_key
+        
+        try:
+            entry = await self._call(
+                "promotion_ids.read", self.promotion_ids_container.read_item,
+                item=promo_id, partition_key=promo_id
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return None
+        self._remember_promotion_partition(promo_id, entry["period"])
+        return entry["period"]
+    
+    async def _claim_promotion_partition(self, promo_id: str, partition_key: str) -> str:
+        """Registra promo_id -> partição no índice; se já registrado, vale a partição existente"""
+        try:
+            await self._call("promotion_ids.create", self.promotion_ids_container.create_item, body={
+                "id": promo_id,
+                "partitionKey": promo_id,
+                "period": partition_key
+            })
+        except exceptions.CosmosResourceExistsError:
+            partition_key = await self._promotion_partition(promo_id) or partition_key
+        self._remember_promotion_partition(promo_id, partition_key)
+        return partition_key
+    
+    def _remember_promotion_partition(self, promo_id: str, partition_key: str):
+        self._promotion_partitions[promo_id] = partition_key
+        self._promotion_partitions.move_to_end(promo_id)
+        if len(self._promotion_partitions) > self.PROMOTION_PARTITION_CACHE_SIZE:
+            self._promotion_partitions.popitem(last=False)
+    
+    # ========== AGGREGATES ==========
+    
+    async def get_aggregates(self) -> Dict:
+        """
+        Contagens de messages e promotions mantidas pelo change feed
+        
+        Um point read por tipo no lugar de COUNT cross-partition. Tipo ainda não
+        processado (ChangeFeedAggregator nunca rodou) fica de fora do resultado.
+        
+        Returns:
+            Dict: {"messages": {"total", "by_month", ...}, "promotions": {"total",
+            "by_status", "by_month", "by_mecanica", "by_segment", ...}}
+        """
+        async def read(kind: str) -> Optional[Dict]:
+            try:
+                return await self._call(
+                    "aggregates.read", self.aggregates_container.read_item, item=kind, partition_key=kind
+                )
+            except exceptions.CosmosResourceNotFoundError:
+                return None
+        
+        try:
+            await self._ready()
+            documents = await asyncio.gather(*(read(kind) for kind in AGGREGATE_KINDS))
+            return {
+                kind: {
+                    key: value for key, value in document.items()
+                    if key not in ("id", "partitionKey", "continuation", "pending_marks", "epoch") and not key.startswith("_")
+                }
+                for kind, document in zip(AGGREGATE_KINDS, documents) if document
+            }
+            
+        except Exception as e:
+            logger.warning(f"Erro ao ler agregados: {e}")
+            return {}
+    
     # ========== HELPERS ==========
     
     def _extract_year_month(self, date_str: str) -> str:
@@ -308,3 +910,4 @@ class CosmosDBAdapter:
 
 # Instância global (singleton)
 cosmos_adapter = CosmosDBAdapter()
+close_on_exit(cosmos_adapter, "Cosmos DB")
@@ -0,0 +1,279 @@
+"""
+Agregados do Cosmos DB mantidos pelo change feed
+Em vez de COUNT cross-partition a cada consulta, um processador lê o change feed
+de sessions (trocas embutidas) e promotions e atualiza documentos de agregado
+pequenos (um por tipo) no container aggregates; StatusFunction e relatórios fazem
+só um point read.
+
+- Incremental: cada execução lê apenas as mudanças desde o último continuation token.
+- Exatamente uma vez: as contagens e o continuation token ficam no mesmo documento,
+  gravado por página com a condição de etag; se outra instância avançou antes (412),
+  a página é descartada e a leitura recomeça do token gravado.
+- Primeira execução: o change feed desde o início traz os documentos existentes,
+  então o agregado já nasce com o histórico (sem backfill separado).
+
+promotions só recebem inserts (create_item), por isso cada documento conta uma vez.
+Sessões mudam a cada troca e o change feed entrega só a última versão: o próprio
+documento da sessão guarda em counted_turns quantas trocas já entraram no agregado,
+e o processador soma a diferença para turn_count. Assim o agregado não cresce com o
+número de sessões (fica longe do limite de 2 MB por documento).
+
+Marcar counted_turns é uma escrita em outro container, então não entra na gravação
+com etag do agregado: as marcas da página ficam em pending_marks (no máximo uma
+página) junto com o continuation e são aplicadas antes da leitura seguinte. O patch
+é condicional (só aumenta a marca) e pode ser repetido por qualquer instância; a
+sessão marcada volta no change feed com diferença zero. A marca vale para uma época
+do agregado (counted_epoch): reset cria uma época nova e as marcas antigas deixam de
+contar. O change feed não entrega exclusões, então trocas expiradas continuam
+contadas: messages.total é o total de trocas gravadas.
+
+Roda localmente contra o Cosmos DB Emulator ou o fake dos testes
+(update_cosmos_aggregates.py) e no Azure pela AggregatesFunction (timer).
+"""
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from azure.core import MatchConditions
+from azure.cosmos import exceptions
+
+from shared.adapters.cosmos_adapter import AGGREGATE_KINDS, CONTAINERS
+from shared.adapters.cosmos_metrics import bulk_operations
+
+logger = logging.getLogger(__name__)
+
+UNKNOWN = "indefinido"
+# Época dos agregados gravados antes das marcas nas sessões (menor que qualquer data ISO)
+LEGACY_EPOCH = "0"
+
+
+def _month(value: Optional[str]) -> Optional[str]:
+    return value[:7] if value and len(value) >= 7 else None
+
+
+def _count(counts: Dict[str, int], value: Optional[str], amount: int = 1):
+    value = str(value or "").strip() or UNKNOWN
+    counts[value] = counts.get(value, 0) + amount
+
+
+# tipo (AGGREGATE_KINDS) -> container (chave de CONTAINERS) cujo change feed alimenta o agregado
+AGGREGATE_SOURCES: Dict[str, str] = {
+    "messages": "sessions",
+    "promotions": "promotions",
+}
+
+# dimensão -> extrator do valor na promoção
+PROMOTION_DIMENSIONS: Dict[str, Callable[[Dict], Optional[str]]] = {
+    "status": lambda doc: doc.get('status'),
+    "month": lambda doc: doc.get('partitionKey'),  # Ano-mês do período (partição)
+    "mecanica": lambda doc: doc.get('mecanica'),
+    "segment": lambda doc: doc.get('segmentacao'),
+}
+
+
+def empty_aggregate(kind: str) -> Dict:
+    """Documento de agregado zerado de um tipo"""
+    aggregate = {"id": kind, "partitionKey": kind, "total": 0, "continuation": None, "updated_at": None}
+    if kind == "messages":
+        # pending_marks: session_id -> turn_count já somado, ainda não marcado na sessão
+        aggregate.update(by_month={}, pending_marks={}, epoch=datetime.utcnow().isoformat())
+    else:
+        for dimension in PROMOTION_DIMENSIONS:
+            aggregate[f"by_{dimension}"] = {}
+    return aggregate
+
+
+def apply_promotion(aggregate: Dict, document: Dict) -> bool:
+    """Soma uma promoção nova às contagens"""
+    aggregate["total"] += 1
+    for dimension, extract in PROMOTION_DIMENSIONS.items():
+        _count(aggregate[f"by_{dimension}"], extract(document))
+    return True
+
+
+def apply_session(aggregate: Dict, document: Dict) -> bool:
+    """Soma as trocas da sessão que ainda não foram contadas e agenda a marca no documento"""
+    turn_count = document.get('turn_count') or 0
+    counted = (document.get('counted_turns') or 0) if document.get('counted_epoch') == aggregate["epoch"] else 0
+    new = turn_count - counted
+    if new <= 0:
+        return False  # Só a marca de counted_turns (ou outro campo) mudou
+    aggregate["total"] += new
+    # As novas são as últimas do array; as que já saíram dele ficam no mês da última atividade
+    months = [_month(turn.get('timestamp')) for turn in (document.get('turns') or [])[-new:]]
+    months += [_month(document.get('last_activity'))] * (new - len(months))
+    for month in months:
+        _count(aggregate["by_month"], month)
+    aggregate["pending_marks"][document['id']] = turn_count
+    return True
+
+
+def apply_document(aggregate: Dict, kind: str, document: Dict) -> bool:
+    """Soma um documento do change feed às contagens do agregado (False se não havia nada novo)"""
+    if kind == "messages":
+        return apply_session(aggregate, document)
+    return apply_promotion(aggregate, document)
+
+
+class ChangeFeedAggregator:
+    """Processa o change feed de sessions e promotions e atualiza os agregados"""
+
+    # Patches de counted_turns em paralelo ao aplicar as marcas de uma página
+    MARK_CONCURRENCY = 8
+
+    def __init__(self, adapter, page_size: int = 500, interval_seconds: int = 60):
+        self.adapter = adapter
+        self.page_size = page_size
+        self.interval_seconds = interval_seconds
+        self.last_report: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def _aggregates(self):
+        return self.adapter.database.get_container_client(CONTAINERS["aggregates"])
+
+    async def run_once(self, kinds: Optional[List[str]] = None) -> Dict:
+        """Aplica todas as mudanças pendentes e retorna quantos documentos entraram por tipo"""
+        started = datetime.utcnow()
+        await self.adapter._ready()
+        processed = {}
+        # Reprocessamento em massa (ex: primeira execução) não disputa RU com o chat
+        with bulk_operations():
+            for kind in kinds or list(AGGREGATE_KINDS):
+                processed[kind] = await self._process(kind)
+
+        self.last_report = {
+            "ran_at": started.isoformat(),
+            "duration_ms": round((datetime.utcnow() - started).total_seconds() * 1000, 1),
+            "processed": processed
+        }
+        if any(processed.values()):
+            logger.info(f"📈 Agregados atualizados: {processed}")
+        return self.last_report
+
+    async def reset(self, kinds: Optional[List[str]] = None):
+        """Zera os agregados: a próxima execução recontará desde o início do change feed"""
+        await self.adapter._ready()
+        for kind in kinds or list(AGGREGATE_KINDS):
+            await self.adapter._call("aggregates.upsert", self._aggregates.upsert_item, body=empty_aggregate(kind))
+
+    async def _process(self, kind: str) -> int:
+        source = self.adapter.database.get_container_client(CONTAINERS[AGGREGATE_SOURCES[kind]])
+        aggregate = await self._load(kind)
+        processed = 0
+        while True:
+            # Marcas da página anterior antes da próxima leitura: a sessão que voltar
+            # no change feed já vem com counted_turns e não é contada de novo
+            if aggregate.get("pending_marks"):
+                await self._apply_marks(source, aggregate["epoch"], aggregate["pending_marks"])
+            documents, continuation = await self._read_page(kind, source, aggregate["continuation"])
+            if not documents and continuation == aggregate["continuation"]:
+                return processed
+
+            if kind == "messages":
+                aggregate["pending_marks"] = {}
+            counted = sum(1 for document in documents if apply_document(aggregate, kind, document))
+            aggregate["continuation"] = continuation
+            aggregate["updated_at"] = datetime.utcnow().isoformat()
+            try:
+                aggregate = await self._store(aggregate)
+                processed += counted
+            except (exceptions.CosmosAccessConditionFailedError, exceptions.CosmosResourceExistsError):
+                # Outra instância gravou antes: descarta a página e segue do token dela
+                logger.info(f"🔁 Agregado {kind} atualizado por outra instância, recarregando")
+                aggregate = await self._load(kind)
+            if not documents:
+                return processed
+
+    async def _apply_marks(self, source, epoch: str, marks: Dict[str, int]):
+        """Grava counted_turns nas sessões já somadas (idempotente: nunca volta a marca nem a época)"""
+        semaphore = asyncio.Semaphore(self.MARK_CONCURRENCY)
+
+        async def mark(session_id: str, turn_count: int):
+            async with semaphore:
+                try:
+                    await self.adapter._call(
+                        "sessions.mark", source.patch_item,
+                        item=session_id, partition_key=session_id,
+                        patch_operations=[
+                            {"op": "set", "path": "/counted_epoch", "value": epoch},
+                            {"op": "set", "path": "/counted_turns", "value": turn_count}
+                        ],
+                        filter_predicate=(
+                            f"FROM c WHERE NOT IS_DEFINED(c.counted_epoch) OR c.counted_epoch < '{epoch}'"
+                            f" OR (c.counted_epoch = '{epoch}' AND c.counted_turns < {int(turn_count)})"
+                        )
+                    )
+                except (exceptions.CosmosResourceNotFoundError, exceptions.CosmosAccessConditionFailedError):
+                    pass  # Sessão expirou ou já foi marcada (por esta ou outra instância)
+
+        await asyncio.gather(*(mark(session_id, turn_count) for session_id, turn_count in marks.items()))
+
+    async def _load(self, kind: str) -> Dict:
+        try:
+            aggregate = await self.adapter._call(
+                "aggregates.read", self._aggregates.read_item, item=kind, partition_key=kind
+            )
+        except exceptions.CosmosResourceNotFoundError:
+            return empty_aggregate(kind)
+        if kind == "messages" and "epoch" not in aggregate:
+            # Layout antigo (mapa de sessões no agregado): vira marcas no documento de cada sessão
+            sessions = aggregate.pop("sessions", None) or {}
+            aggregate["pending_marks"] = {session_id: seen[0] for session_id, seen in sessions.items()}
+            aggregate["epoch"] = LEGACY_EPOCH
+        return aggregate
+
+    async def _store(self, aggregate: Dict) -> Dict:
+        """Grava o agregado só se ninguém o alterou desde a leitura (etag; o primeiro é criado)"""
+        body = {key: value for key, value in aggregate.items() if not key.startswith("_")}
+        if "_etag" not in aggregate:
+            return await self.adapter._call("aggregates.create", self._aggregates.create_item, body=body)
+        return await self.adapter._call(
+            "aggregates.replace", self._aggregates.replace_item,
+            item=aggregate["id"], body=body, etag=aggregate["_etag"], match_condition=MatchConditions.IfNotModified
+        )
+
+    async def _read_page(self, kind: str, source, continuation: Optional[str]) -> Tuple[List[Dict], Optional[str]]:
+        """Lê uma página do change feed; o próximo token é o continuation_token do paginador"""
+        async def read(response_hook):
+            options = {} if continuation else {"start_time": "Beginning"}
+            pages = source.query_items_change_feed(
+                max_item_count=self.page_size, response_hook=response_hook, **options
+            ).by_page(continuation)
+            async for page in pages:
+                return [item async for item in page], pages.continuation_token or continuation
+            return [], continuation
+
+        return await self.adapter._call(f"{kind}.change_feed", read)
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Erro ao processar change feed: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Agenda o processamento periódico no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"📈 ChangeFeedAggregator iniciado (intervalo {self.interval_seconds}s)")
+
+    async def stop(self):
+        """Cancela o processamento periódico"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval_seconds,
+            "last_report": self.last_report
+        }
@@ -0,0 +1,206 @@
+"""
+Cosmos Metrics - Consumo de RU por operação e orçamento de RU/s no cliente
+
+- RequestChargeMeter: soma o x-ms-request-charge de cada resposta por tipo de
+  operação e por minuto, e registra os 429 com o retry-after recebido.
+- RequestUnitBudget: token bucket em RU. Cada chamada espera haver saldo e depois
+  desconta o custo real (o saldo pode ficar negativo: a dívida atrasa as próximas).
+  Operações em massa (bulk_operations()) só consomem acima de uma reserva, então
+  um job pesado não esgota o orçamento do chat interativo.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+REQUEST_CHARGE_HEADER = "x-ms-request-charge"
+RETRY_AFTER_HEADER = "x-ms-retry-after-ms"
+
+# Marca as chamadas feitas por jobs em massa (migração, importação, reprocessamento)
+bulk_priority: ContextVar[bool] = ContextVar("cosmos_bulk_priority", default=False)
+
+
+@contextmanager
+def bulk_operations():
+    """Chamadas ao Cosmos dentro do bloco cedem a vez ao tráfego interativo"""
+    token = bulk_priority.set(True)
+    try:
+        yield
+    finally:
+        bulk_priority.reset(token)
+
+
+class ChargeHook:
+    """response_hook do SDK: acumula o RU das respostas de uma chamada (queries têm várias páginas)"""
+
+    __slots__ = ('charge',)
+
+    def __init__(self):
+        self.charge = 0.0
+
+    def __call__(self, headers: Mapping[str, str], *args):
+        self.charge += _charge(headers)
+
+
+def _charge(headers: Optional[Mapping[str, str]]) -> float:
+    try:
+        return float((headers or {}).get(REQUEST_CHARGE_HEADER) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RequestChargeMeter:
+    """Agrega RU, requisições e throttling por operação e por minuto (janela limitada)"""
+
+    def __init__(self, window_minutes: int = 60):
+        self.operations: Dict[str, Dict] = {}
+        self._minutes: deque = deque(maxlen=window_minutes)  # [minuto, ru, requisições, 429s]
+
+    def _minute(self) -> list:
+        minute = datetime.utcnow().strftime("%Y-%m-%dT%H:%M")
+        if not self._minutes or self._minutes[-1][0] != minute:
+            self._minutes.append([minute, 0.0, 0, 0])
+        return self._minutes[-1]
+
+    def record(self, operation: str, charge: float, status_code: Optional[int] = None,
+               retry_after_ms: Optional[float] = None):
+        stats = self.operations.get(operation)
+        if stats is None:
+            stats = self.operations[operation] = {
+                "requests": 0, "ru_total": 0.0, "ru_max": 0.0, "errors": 0, "throttled": 0, "last_retry_after_ms": None
+            }
+        stats["requests"] += 1
+        stats["ru_total"] += charge
+        stats["ru_max"] = max(stats["ru_max"], charge)
+
+        minute = self._minute()
+        minute[1] += charge
+        minute[2] += 1
+
+        if status_code is not None and status_code >= 400:
+            stats["errors"] += 1
+        if status_code == 429:
+            stats["throttled"] += 1
+            stats["last_retry_after_ms"] = retry_after_ms
+            minute[3] += 1
+
+    def record_error(self, operation: str, error: Exception) -> Tuple[float, Optional[float]]:
+        """Registra uma resposta de erro; retorna (RU cobrado, retry-after em segundos se for 429)"""
+        headers = getattr(error, 'headers', None) or {}
+        status_code = getattr(error, 'status_code', None)
+        retry_after_ms = None
+        if status_code == 429:
+            try:
+                retry_after_ms = float(headers.get(RETRY_AFTER_HEADER) or 0) or None
+            except (TypeError, ValueError):
+                retry_after_ms = None
+        charge = _charge(headers)
+        self.record(operation, charge, status_code, retry_after_ms)
+        if status_code != 429:
+            return charge, None
+        return charge, (retry_after_ms or 0) / 1000
+
+    def get_stats(self) -> Dict:
+        total_ru = sum(stats["ru_total"] for stats in self.operations.values())
+        return {
+            "total_ru": round(total_ru, 2),
+            "requests": sum(stats["requests"] for stats in self.operations.values()),
+            "throttled": sum(stats["throttled"] for stats in self.operations.values()),
+            "ru_last_minute": round(self._minutes[-1][1], 2) if self._minutes else 0.0,
+            "operations": {
+                operation: {
+                    **stats,
+                    "ru_total": round(stats["ru_total"], 2),
+                    "ru_avg": round(stats["ru_total"] / stats["requests"], 2) if stats["requests"] else 0.0,
+                }
+                for operation, stats in sorted(self.operations.items())
+            },
+            "per_minute": [
+                {"minute": minute, "ru": round(ru, 2), "requests": requests, "throttled": throttled}
+                for minute, ru, requests, throttled in self._minutes
+            ],
+        }
+
+
+class RequestUnitBudget:
+    """
+    Token bucket de RU/s no cliente
+
+    Desabilitado com ru_per_second <= 0. A capacidade (rajada) é ru_per_second *
+    burst_seconds; operações em massa esperam o saldo passar de bulk_reserve da
+    capacidade, as interativas só precisam de saldo positivo.
+    """
+
+    def __init__(self, ru_per_second: float, burst_seconds: float = 1.0, bulk_reserve: float = 0.5):
+        self.rate = max(float(ru_per_second), 0.0)
+        self.capacity = self.rate * burst_seconds
+        self.bulk_reserve = bulk_reserve
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        return now
+
+    async def acquire(self):
+        """Espera haver saldo (e o fim de um retry-after pendente) antes de uma chamada"""
+        if not self.enabled:
+            return
+        floor = self.capacity * self.bulk_reserve if bulk_priority.get() else 0.0
+        started = None
+        while True:
+            now = self._refill()
+            if now < self._blocked_until:
+                delay = self._blocked_until - now
+            elif self.tokens > floor:
+                break
+            else:
+                delay = (floor - self.tokens) / self.rate + 0.001
+            if started is None:
+                started = now
+                self.waits += 1
+            await asyncio.sleep(delay)
+        if started is not None:
+            self.wait_seconds += time.monotonic() - started
+
+    def consume(self, charge: float):
+        """Desconta o custo real de uma chamada já feita"""
+        if self.enabled:
+            self._refill()
+            self.tokens -= charge
+
+    def throttled(self, retry_after_seconds: float):
+        """O servidor respondeu 429: zera o saldo e segura todas as chamadas pelo retry-after"""
+        if not self.enabled:
+            return
+        now = self._refill()
+        self.tokens = min(self.tokens, 0.0)
+        self._blocked_until = max(self._blocked_until, now + retry_after_seconds)
+
+    def get_stats(self) -> Dict:
+        if self.enabled:
+            self._refill()
+        return {
+            "enabled": self.enabled,
+            "ru_per_second": self.rate,
+            "capacity": round(self.capacity, 2),
+            "available": round(self.tokens, 2),
+            "bulk_reserve": self.bulk_reserve,
+            "waits": self.waits,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
@@ -0,0 +1,172 @@
+"""
+Migração de particionamento do Cosmos DB
+Copia messages e promo_states do layout antigo (tudo numa partição lógica:
+"active" ou sem chave) para os containers novos, particionados por session_id,
+e preenche o índice promotion_ids (promo_id -> partição) das promoções existentes
+
+- Retomável: o continuation token de cada container vai para um checkpoint em JSON
+  após cada página; rodar de novo continua de onde parou.
+- Idempotente: usa create_item, então documento já copiado (ou já gravado pelo app
+  no layout novo) é mantido - pode rodar de novo depois do deploy sem sobrescrever nada.
+- Throttling: concorrência limitada, backoff respeitando o retry-after dos 429 e
+  prioridade de massa no orçamento de RU do adapter (o chat continua com folga).
+
+sessions e promotions não precisam de cópia: o container sessions já era
+particionado por session_id e continua o mesmo. As sessões antigas guardam o próprio
+ttl do layout antigo (24h por item, não o SESSION_TTL_SECONDS de 30 dias das novas),
+então as que não voltam expiram sozinhas; a que recebe uma troca é convertida no
+primeiro acesso (trocas copiadas de messages, já migrado, e ttl de 30 dias). promotions
+já eram particionadas por ano-mês (só ganham o índice).
+"""
+import os
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from azure.cosmos import exceptions
+
+from shared.adapters.cosmos_adapter import CONTAINERS
+from shared.adapters.cosmos_metrics import bulk_operations
+
+logger = logging.getLogger(__name__)
+
+# Campos de sistema do Cosmos que não podem ser regravados
+SYSTEM_FIELDS = ('_rid', '_self', '_etag', '_attachments', '_ts')
+
+
+def _clean(item: Dict) -> Dict:
+    return {key: value for key, value in item.items() if key not in SYSTEM_FIELDS}
+
+
+def message_document(item: Dict) -> Optional[Dict]:
+    """Mensagem no layout novo (partição = session_id)"""
+    if not item.get('session_id'):
+        return None
+    return {**_clean(item), "partitionKey": item['session_id']}
+
+
+def promo_state_document(item: Dict) -> Optional[Dict]:
+    """Estado no layout novo (partição = session_id, que também é o id)"""
+    session_id = item.get('session_id') or item.get('id')
+    if not session_id:
+        return None
+    return {**_clean(item), "partitionKey": session_id, "session_id": session_id}
+
+
+def promotion_lookup_document(item: Dict) -> Optional[Dict]:
+    """Entrada do índice promotion_ids para uma promoção existente"""
+    if not item.get('id') or not item.get('partitionKey'):
+        return None
+    return {"id": item['id'], "partitionKey": item['id'], "period": item['partitionKey']}
+
+
+# tipo (chave de CONTAINERS do destino) -> (container de origem, transformação)
+MIGRATIONS: Dict[str, tuple] = {
+    "messages": ("messages", message_document),
+    "promo_states": ("promo_states", promo_state_document),
+    "promotion_ids": (CONTAINERS["promotions"], promotion_lookup_document),
+}
+
+
+class PartitionMigration:
+    """Copia os containers do layout antigo para o novo, com checkpoint por página"""
+
+    def __init__(
+        self,
+        adapter,
+        checkpoint_path: str = "cosmos_migration_checkpoint.json",
+        page_size: int = 100,
+        concurrency: int = 8,
+        max_retries: int = 8
+    ):
+        self.adapter = adapter
+        self.checkpoint_path = checkpoint_path
+        self.page_size = page_size
+        self.max_retries = max_retries
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.throttled = 0
+        self.checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self) -> Dict:
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_checkpoint(self):
+        # Grava num temporário e renomeia: uma interrupção nunca deixa o checkpoint corrompido
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.checkpoint, f, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    async def run(self, kinds: Optional[List[str]] = None) -> Dict:
+        """Migra os tipos pedidos (todos por padrão) e retorna o progresso de cada um"""
+        await self.adapter.initialize()
+        if not await self.adapter.ensure_containers():
+            raise RuntimeError("Não foi possível criar os containers do layout novo")
+
+        with bulk_operations():
+            for kind in kinds or list(MIGRATIONS):
+                source_name, transform = MIGRATIONS[kind]
+                if source_name == CONTAINERS[kind]:
+                    raise ValueError(f"Origem e destino de {kind} são o mesmo container ({source_name})")
+                await self._migrate(kind, source_name, transform)
+
+        return {**self.checkpoint, "throttled": self.throttled, "request_units": self.adapter.metrics.get_stats()["total_ru"]}
+
+    async def _migrate(self, kind: str, source_name: str, transform: Callable[[Dict], Optional[Dict]]):
+        progress = self.checkpoint.setdefault(kind, {
+            "continuation": None, "copied": 0, "skipped": 0, "invalid": 0, "done": False
+        })
+        if progress["done"]:
+            logger.info(f"⏭️ {kind}: já migrado")
+            return
+
+        source = self.adapter.database.get_container_client(source_name)
+        target = self.adapter.database.get_container_client(CONTAINERS[kind])
+        logger.info(f"📦 Migrando {kind}: {source_name} -> {CONTAINERS[kind]}")
+
+        pages = source.query_items(query="SELECT * FROM c", max_item_count=self.page_size).by_page(
+            progress["continuation"]
+        )
+        async for page in pages:
+            documents = [transform(item) async for item in page]
+            results = await asyncio.gather(*(self._copy(target, doc) for doc in documents if doc))
+
+            progress["copied"] += results.count("copied")
+            progress["skipped"] += results.count("skipped")
+            progress["invalid"] += documents.count(None)
+            progress["continuation"] = pages.continuation_token
+            progress["updated_at"] = datetime.utcnow().isoformat()
+            self._save_checkpoint()
+            logger.info(f"   {kind}: {progress['copied']} copiados, {progress['skipped']} já existiam")
+
+        progress["done"] = True
+        self._save_checkpoint()
+        logger.info(f"✅ {kind} migrado")
+
+    async def _copy(self, target, document: Dict) -> str:
+        async with self._semaphore:
+            try:
+                await self._with_backoff(lambda: self.adapter._call("migration.create", target.create_item, body=document))
+                return "copied"
+            except exceptions.CosmosResourceExistsError:
+                return "skipped"
+
+    async def _with_backoff(self, operation):
+        """Repete a operação em 429 (além das retentativas do SDK), esperando o retry-after"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await operation()
+            except exceptions.CosmosHttpResponseError as e:
+                if e.status_code != 429 or attempt == self.max_retries:
+                    raise
+                self.throttled += 1
+                headers = getattr(e, 'headers', None) or {}
+                retry_after_ms = headers.get('x-ms-retry-after-ms')
+                delay = float(retry_after_ms) / 1000 if retry_after_ms else min(0.1 * 2 ** attempt, 5.0)
+                logger.warning(f"⏳ Throttling (429), aguardando {delay:.2f}s")
+                await asyncio.sleep(delay)
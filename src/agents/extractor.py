@@ -107,6 +107,7 @@ IMPORTANTE:
                 
                 # Armazena TODAS no metadata
                 state.metadata['multiple_promotions'] = extracted_data
+                state.touch('metadata')
                 
                 # Preenche o state principal com a PRIMEIRA promoção
                 first_promo = extracted_data[0]
@@ -159,15 +160,10 @@ IMPORTANTE:
         else:
             enhanced_text = text
         
-        original_dict = state.to_dict()
+        # Identifica campos que foram atualizados pelo controle de alterações do PromoState
+        revision = state.revision
         updated_state = await self.extract(enhanced_text, state)
-        updated_dict = updated_state.to_dict()
-        
-        # Identifica campos que foram atualizados
-        updated_fields = []
-        for key in original_dict.keys():
-            if original_dict[key] != updated_dict[key]:
-                updated_fields.append(key)
+        updated_fields = updated_state.fields_changed_since(revision)
         
         return updated_state, updated_fields
     
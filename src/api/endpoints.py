@@ -1,5 +1,7 @@
-from fastapi import APIRouter, Response, Body, Query
-from fastapi.responses import HTMLResponse, JSONResponse
+import json
+import logging
+from fastapi import APIRouter, Response, Body, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from src.api.models import ChatResponse
 from src.core.agent_logic import promo_agente
 from src.services.email_service import enviar_email
@@ -7,6 +9,7 @@ from datetime import datetime
 from typing import Annotated, Optional
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 HOME_HTML = """
 <html>
@@ -60,13 +63,17 @@ async def get_logo():
 # ========== NOVOS ENDPOINTS PARA PROMOÇÕES ==========
 
 @router.get("/promotions")
-async def list_promotions(limit: int = Query(50, description="Número máximo de promoções")):
-    """Lista todas as promoções finalizadas"""
+async def list_promotions(
+    limit: int = Query(50, ge=1, description="Número máximo de promoções por página"),
+    cursor: Optional[str] = Query(None, description="next_cursor da página anterior")
+):
+    """Lista as promoções finalizadas (mais recentes primeiro), paginadas por cursor e só com os campos de resumo"""
     try:
-        promotions = await promo_agente.local_db.get_promotions(limit=limit)
+        page = await promo_agente.local_db.get_promotions_page(page_size=limit, cursor=cursor)
         return {
-            "promotions": promotions,
-            "count": len(promotions)
+            "promotions": page["promotions"],
+            "count": len(page["promotions"]),
+            "next_cursor": page["next_cursor"]
         }
     except Exception as e:
         return JSONResponse(
@@ -75,6 +82,84 @@ async def list_promotions(limit: int = Query(50, description="Número máximo de
         )
 
 
+@router.get("/promotions/search")
+async def search_promotions(
+    q: str = Query(..., min_length=1, description="Texto a buscar em título, descrição, condições, recompensas e produtos"),
+    limit: int = Query(20, ge=1, le=100, description="Tamanho da página"),
+    offset: int = Query(0, ge=0, description="Deslocamento da página")
+):
+    """Busca textual (FTS5) nas promoções finalizadas, ordenada por relevância"""
+    try:
+        result = await promo_agente.local_db.search_promotions(q, limit=limit, offset=offset)
+        return {
+            "query": q,
+            "promotions": result["results"],
+            "count": len(result["results"]),
+            "total": result["total"],
+            "limit": limit,
+            "offset": offset
+        }
+    except Exception as e:
+        return JSONResponse(
+            {"error": f"Erro ao buscar promoções: {str(e)}"},
+            status_code=500
+        )
+
+
+@router.get("/promotions/export.ndjson")
+async def export_promotions_ndjson():
+    """Exporta todas as promoções como NDJSON (uma por linha), em streaming"""
+    async def generate():
+        async for promo in promo_agente.local_db.iter_promotions():
+            yield json.dumps(promo, ensure_ascii=False) + "\n"
+    
+    # Sem Content-Length: o corpo sai com Transfer-Encoding: chunked
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="promotions.ndjson"'}
+    )
+
+
+@router.post("/promotions/import")
+async def import_promotions_ndjson(request: Request):
+    """
+    Importa promoções de um corpo NDJSON (mesmo formato do export)
+    Lê o corpo em streaming e é idempotente por promo_id
+    """
+    invalid_lines = 0
+    
+    async def records():
+        nonlocal invalid_lines
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    invalid_lines += 1
+        if buffer.strip():
+            try:
+                yield json.loads(buffer)
+            except ValueError:
+                invalid_lines += 1
+    
+    try:
+        stats = await promo_agente.local_db.import_promotions(records())
+        stats["invalid"] = invalid_lines
+        return {"status": "success", **stats}
+    except Exception as e:
+        logger.error(f"Erro ao importar promoções: {e}")
+        return JSONResponse(
+            {"error": f"Erro ao importar promoções: {str(e)}"},
+            status_code=500
+        )
+
+
 @router.get("/promotions/{promo_id}")
 async def get_promotion(promo_id: str):
     """Busca uma promoção específica por ID"""
@@ -111,6 +196,22 @@ async def get_promotion_state(session_id: str):
         )
 
 
+@router.get("/promotion-state/{session_id}/history")
+async def get_promotion_state_history(
+    session_id: str,
+    limit: int = Query(200, ge=1, le=1000, description="Número máximo de alterações")
+):
+    """Histórico de alterações por campo do estado (modo event-sourced)"""
+    try:
+        events = await promo_agente.local_db.get_promo_state_events(session_id, limit=limit)
+        return {"session_id": session_id, "events": events}
+    except Exception as e:
+        return JSONResponse(
+            {"error": f"Erro ao obter histórico: {str(e)}"},
+            status_code=500
+        )
+
+
 @router.post("/promotion-state/{session_id}/validate")
 async def validate_promotion(session_id: str):
     """Valida uma promoção"""
@@ -30,6 +30,10 @@ def create_app() -> FastAPI:
         await promo_agente.initialize()
         # asyncio.create_task(promo_agente.start_periodic_extraction())
 
+    @app.on_event("shutdown")
+    async def shutdown_event():
+        await promo_agente.shutdown()
+
     # Health check para Railway
     @app.get("/health")
     async def health_check():
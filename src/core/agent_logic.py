@@ -12,8 +12,13 @@ from openai import AsyncOpenAI
 
 from src.core.config import OPENAI_API_KEY, OPENAI_MODEL, logger
 from src.core.config import EXTRACTION_PROMPT_PATH, VALIDATION_PROMPT_PATH, SUMMARIZATION_PROMPT_PATH
+from src.core.config import RETENTION_ENABLED, SESSION_SWEEP_ENABLED
 from src.services.database import LocalDatabase
+from src.services.retention import RetentionWorker
+from src.services.session_sweeper import SessionSweeper
 from src.core.memory_manager import MemoryManager
+from src.core.promo_state import new_promo_id
+from src.core.session_locks import SessionLockRegistry
 from src.core.orchestrator import Orchestrator
 from src.agents.extractor import ExtractorAgent
 from src.agents.validator import ValidatorAgent
@@ -36,6 +41,11 @@ class PromoAgenteLocal:
         # Database e Memory
         self.local_db = LocalDatabase()
         self.memory_manager: Optional[MemoryManager] = None
+        self.retention_worker = RetentionWorker(self.local_db)
+        
+        # Turnos da mesma sessão rodam em série; sessões diferentes em paralelo
+        self.session_locks = SessionLockRegistry()
+        self.session_sweeper: Optional[SessionSweeper] = None
         
         # Agents especializados
         self.extractor: Optional[ExtractorAgent] = None
@@ -52,8 +62,10 @@ class PromoAgenteLocal:
         """Inicializa todos os componentes do sistema"""
         logger.info("🚀 Inicializando PromoAgente Local...")
         
-        # 1. Inicializa database
+        # 1. Inicializa database (e a retenção de messages/system_logs)
         await self.local_db.initialize()
+        if RETENTION_ENABLED:
+            self.retention_worker.start()
         
         # 2. Inicializa OpenAI
         await self._init_openai()
@@ -65,6 +77,15 @@ class PromoAgenteLocal:
         self.memory_manager = MemoryManager(self.local_db)
         logger.info("✅ MemoryManager inicializado")
         
+        # Sessões ociosas saem da memória; sessões com turno em andamento não são tocadas
+        self.session_sweeper = SessionSweeper(
+            self.memory_manager,
+            self.local_db,
+            is_busy=self.session_locks.is_active
+        )
+        if SESSION_SWEEP_ENABLED:
+            self.session_sweeper.start()
+        
         # 5. Inicializa Agents especializados
         if self.openai_client:
             self.extractor = ExtractorAgent(
@@ -104,6 +125,14 @@ class PromoAgenteLocal:
         
         logger.info("✅ PromoAgente Local inicializado com sucesso!")
 
+    async def shutdown(self):
+        """Encerra as tarefas de background"""
+        await self.retention_worker.stop()
+        if self.session_sweeper:
+            await self.session_sweeper.stop()
+        await self.local_db.close()
+        logger.info("👋 PromoAgente Local encerrado")
+
     async def _init_openai(self) -> bool:
         """Inicializa cliente OpenAI"""
         try:
@@ -173,22 +202,30 @@ class PromoAgenteLocal:
             }
 
         try:
-            # Usa o orchestrator para processar a mensagem
-            result = await self.orchestrator.handle_message(message, session_id)
-            
-            # PROTEÇÃO: Verifica se result é válido antes de usar
-            if not result or not isinstance(result, dict):
-                result = {
-                    "response": "Erro ao processar mensagem - resposta inválida",
-                    "status": "error"
-                }
-            
-            # Salva a interação no banco
-            await self.local_db.save_message(
-                session_id,
-                message,
-                result.get('response', '')
-            )
+            # Um turno por vez na sessão: dois requests não intercalam extração e save do mesmo estado
+            async with self.session_locks.lock(session_id):
+                # Todas as escritas do turno (estado, promoções, mensagem) vão em um único commit
+                async with self.memory_manager.unit_of_work() as uow:
+                    # Usa o orchestrator para processar a mensagem
+                    result = await self.orchestrator.handle_message(message, session_id)
+                    
+                    # PROTEÇÃO: Verifica se result é válido antes de usar
+                    if not result or not isinstance(result, dict):
+                        result = {
+                            "response": "Erro ao processar mensagem - resposta inválida",
+                            "status": "error"
+                        }
+                    
+                    # Turno com erro não deixa estado parcial gravado
+                    if result.get('status') == 'error':
+                        uow.rollback()
+                    
+                    # Salva a interação no banco
+                    await self.memory_manager.save_message(
+                        session_id,
+                        message,
+                        result.get('response', '')
+                    )
             
             # Adiciona metadados
             result['session_id'] = session_id
@@ -235,7 +272,8 @@ class PromoAgenteLocal:
         """Reseta uma promoção"""
         if not self.orchestrator:
             return False
-        return await self.orchestrator.reset_state(session_id)
+        async with self.session_locks.lock(session_id):
+            return await self.orchestrator.reset_state(session_id)
 
     async def list_promotions(self) -> list:
         """Lista todas as promoções"""
@@ -258,7 +296,7 @@ class PromoAgenteLocal:
             if state and state.is_complete():
                 # Gera um promo_id se não existir
                 if not state.promo_id:
-                    state.promo_id = f"promo_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+                    state.promo_id = new_promo_id()
                 
                 # Salva na tabela de promoções
                 await self.local_db.save_promotion(state.to_dict())
@@ -296,6 +334,10 @@ class PromoAgenteLocal:
             'sqlite_db': True,
             'messages_stored': messages_stored,
             'promotions_count': promo_count,
+            'state_cache': self.memory_manager.get_cache_stats() if self.memory_manager else None,
+            'retention': self.retention_worker.get_stats(),
+            'session_locks': self.session_locks.get_stats(),
+            'session_sweeper': self.session_sweeper.get_stats() if self.session_sweeper else None,
             'python_version': sys.version,
             'environment': os.getenv('ENVIRONMENT', 'development'),
         }
@@ -47,6 +47,40 @@ PORT = int(os.getenv('PORT', 7000))
 DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 ENVIRONMENT = os.getenv('ENVIRONMENT', 'development')
 
+# Configurações de persistência (serialização de promo_states.state_data)
+STATE_CODEC = os.getenv('STATE_CODEC', 'orjson')  # json, orjson ou msgpack
+STATE_COMPRESS_THRESHOLD = int(os.getenv('STATE_COMPRESS_THRESHOLD', '4096'))  # bytes; 0 desativa
+STATE_COMPRESS_LEVEL = int(os.getenv('STATE_COMPRESS_LEVEL', '6'))
+
+# Cache de PromoStates em memória (MemoryManager) - 0 desativa o limite
+STATE_CACHE_MAX_ENTRIES = int(os.getenv('STATE_CACHE_MAX_ENTRIES', '1000'))
+STATE_CACHE_TTL_SECONDS = int(os.getenv('STATE_CACHE_TTL_SECONDS', '1800'))
+# Revalida o cache contra escritas de outros workers (data_version + versão do estado)
+STATE_CACHE_REVALIDATE = os.getenv('STATE_CACHE_REVALIDATE', 'True').lower() == 'true'
+STATE_CAS_MAX_RETRIES = int(os.getenv('STATE_CAS_MAX_RETRIES', '3'))  # merges após conflito de versão
+# Modo event-sourced do SQLite: cada save grava só os campos alterados em promo_state_events,
+# com snapshot completo a cada N eventos ou mudança de status
+STATE_EVENT_SOURCING = os.getenv('STATE_EVENT_SOURCING', 'False').lower() == 'true'
+STATE_SNAPSHOT_EVERY = int(os.getenv('STATE_SNAPSHOT_EVERY', '50'))
+# Turnos recentes mantidos em memória por sessão (histórico enviado aos agentes)
+RECENT_HISTORY_TURNS = int(os.getenv('RECENT_HISTORY_TURNS', '10'))
+
+# Sessões ociosas: saem da memória após SESSION_IDLE_SECONDS sem acesso (com flush do que
+# estiver pendente); rascunhos parados há SESSION_ARCHIVE_AFTER_DAYS vão para promo_states_archive
+SESSION_SWEEP_ENABLED = os.getenv('SESSION_SWEEP_ENABLED', 'True').lower() == 'true'
+SESSION_SWEEP_INTERVAL_SECONDS = int(os.getenv('SESSION_SWEEP_INTERVAL_SECONDS', '300'))
+SESSION_IDLE_SECONDS = int(os.getenv('SESSION_IDLE_SECONDS', '900'))
+SESSION_ARCHIVE_AFTER_DAYS = int(os.getenv('SESSION_ARCHIVE_AFTER_DAYS', '7'))  # 0 desativa o arquivamento
+
+# Retenção do SQLite (messages/system_logs) - 0 desativa a regra
+RETENTION_ENABLED = os.getenv('RETENTION_ENABLED', 'True').lower() == 'true'
+RETENTION_INTERVAL_SECONDS = int(os.getenv('RETENTION_INTERVAL_SECONDS', '3600'))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '500'))
+RETENTION_MESSAGES_DAYS = int(os.getenv('RETENTION_MESSAGES_DAYS', '30'))  # mesmo TTL do Cosmos
+RETENTION_MESSAGES_COMPLETED_HOURS = int(os.getenv('RETENTION_MESSAGES_COMPLETED_HOURS', '0'))  # sessões concluídas
+RETENTION_SYSTEM_LOGS_DAYS = int(os.getenv('RETENTION_SYSTEM_LOGS_DAYS', '14'))
+RETENTION_VACUUM_PAGES = int(os.getenv('RETENTION_VACUUM_PAGES', '2000'))  # 0 = todas
+
 # Configurações dos Agents
 # Usar caminhos absolutos baseados na raiz do projeto
 try:
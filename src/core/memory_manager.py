@@ -1,10 +1,20 @@
 """
 MemoryManager - Gerencia a persistência do estado de promoções
 """
+import asyncio
 import json
 import logging
-from typing import Optional, Dict
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Callable, Optional, Dict, List
 from src.core.promo_state import PromoState
+from src.core.state_cache import StateCache
+from src.core.unit_of_work import UnitOfWork, current_unit_of_work
+from src.core.config import (
+    STATE_CACHE_MAX_ENTRIES, STATE_CACHE_TTL_SECONDS, STATE_CACHE_REVALIDATE, STATE_CAS_MAX_RETRIES,
+    RECENT_HISTORY_TURNS
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,53 +22,233 @@ logger = logging.getLogger(__name__)
 class MemoryManager:
     """Gerencia o estado das promoções em memória e database"""
     
-    def __init__(self, database):
+    def __init__(
+        self,
+        database,
+        cache_max_entries: int = STATE_CACHE_MAX_ENTRIES,
+        cache_ttl_seconds: int = STATE_CACHE_TTL_SECONDS,
+        revalidate: bool = STATE_CACHE_REVALIDATE,
+        max_cas_retries: int = STATE_CAS_MAX_RETRIES,
+        history_turns: int = RECENT_HISTORY_TURNS
+    ):
         self.database = database
-        self._cache: Dict[str, PromoState] = {}
+        self._cache = StateCache(cache_max_entries, cache_ttl_seconds, on_evict=self._drop_history)
+        # Últimos turnos de cada sessão em cache: cada turno é a lista de mensagens user/assistant.
+        # Só existe enquanto o estado da sessão está no cache e sai junto com ele.
+        self.history_turns = history_turns
+        self._history: Dict[str, deque] = {}
+        self._history_stats = {"hits": 0, "misses": 0}
+        # Cargas em andamento: corrotinas que pedem a mesma sessão aguardam a mesma leitura
+        self._loading: Dict[str, asyncio.Future] = {}
+        # Coerência entre workers: só para backends com versão por estado (SQLite)
+        self._versioned = hasattr(database, 'compare_and_swap_promo_state')
+        self.revalidate = revalidate and self._versioned
+        self.max_cas_retries = max_cas_retries
+        self._coherence = {"revalidations": 0, "refreshes": 0, "conflicts": 0}
     
     async def load(self, session_id: str) -> PromoState:
         """Carrega o estado de uma promoção pela session_id"""
         # Verifica cache primeiro
-        if session_id in self._cache:
+        state = self._cache.get(session_id)
+        if state is not None and self.revalidate:
+            state = await self._revalidate(state)
+        if state is not None:
             logger.debug(f"PromoState carregado do cache: {session_id}")
-            return self._cache[session_id]
+            return state
+        
+        pending = self._loading.get(session_id)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._loading[session_id] = future
+        try:
+            state = await self._load_from_database(session_id)
+            self._cache.put(session_id, state)
+            future.set_result(state)
+            return state
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita "Future exception was never retrieved" quando ninguém mais aguardava
+            future.exception()
+            raise
+        finally:
+            del self._loading[session_id]
+    
+    async def _load_from_database(self, session_id: str) -> PromoState:
+        # Lê o data_version antes do estado: um commit entre as duas leituras força nova checagem
+        data_version = await self.database.data_version() if self.revalidate else None
         
         # Tenta carregar do banco
         try:
-            state_data = await self.database.get_promo_state(session_id)
+            if self._versioned:
+                stored = await self.database.get_promo_state_with_version(session_id)
+                state_data, version = stored if stored else (None, 0)
+            else:
+                state_data, version = await self.database.get_promo_state(session_id), 0
+            if not state_data and await self._restore_archived(session_id):
+                return await self._load_from_database(session_id)
             if state_data:
                 state = PromoState.from_dict(state_data)
-                self._cache[session_id] = state
+                state.mark_clean()
+                state.version = version
+                state.validated_at = data_version
                 logger.info(f"PromoState carregado do database: {session_id}")
                 return state
         except Exception as e:
             logger.warning(f"Erro ao carregar PromoState do database: {e}")
         
         # Se não existe, cria um novo
-        state = PromoState(session_id=session_id)
-        self._cache[session_id] = state
         logger.info(f"Novo PromoState criado: {session_id}")
+        state = PromoState(session_id=session_id)
+        state.validated_at = data_version
+        return state
+    
+    async def _restore_archived(self, session_id: str) -> bool:
+        """Sessão arquivada por ociosidade volta para promo_states na primeira mensagem"""
+        restore = getattr(self.database, 'restore_archived_promo_state', None)
+        if restore is None or not await restore(session_id):
+            return False
+        logger.info(f"PromoState restaurado do arquivo: {session_id}")
+        return True
+    
+    async def _revalidate(self, state: PromoState) -> Optional[PromoState]:
+        """
+        Confere se o estado em cache ainda é o gravado no banco
+        
+        Se o data_version não mudou desde a última checagem, nenhum processo gravou nada
+        e o cache vale sem consultar a tabela. Senão compara só a versão do estado; se outro
+        worker gravou, recarrega (ou faz merge, se há alterações locais pendentes).
+        
+        Returns:
+            Optional[PromoState]: Estado válido, ou None se foi removido por outro worker
+        """
+        data_version = await self.database.data_version()
+        if data_version is not None and data_version == state.validated_at:
+            return state
+        
+        self._coherence["revalidations"] += 1
+        stored_version = await self.database.get_promo_state_version(state.session_id)
+        if stored_version is None or stored_version == state.version:
+            state.validated_at = data_version
+            return state
+        
+        self._coherence["refreshes"] += 1
+        self._drop_history(state.session_id)
+        stored = await self.database.get_promo_state_with_version(state.session_id)
+        if stored is None:
+            if state.is_dirty():
+                # Removido por outro worker, mas há alterações locais: volta a ser um estado novo
+                state.version = 0
+                state.validated_at = data_version
+                return state
+            logger.info(f"PromoState removido por outro worker: {state.session_id}")
+            self._cache.pop(state.session_id)
+            return None
+        
+        state_data, version = stored
+        if state.is_dirty():
+            pending = state.rebase(state_data, version)
+            logger.info(f"PromoState atualizado por outro worker, merge local: {state.session_id} (pendentes: {pending})")
+        else:
+            state = PromoState.from_dict(state_data)
+            state.mark_clean()
+            state.version = version
+            self._cache.put(state.session_id, state)
+            logger.info(f"PromoState atualizado por outro worker, recarregado: {state.session_id}")
+        state.validated_at = data_version
         return state
     
     async def save(self, state: PromoState) -> bool:
-        """Salva o estado de uma promoção"""
-        try:
-            state.update_timestamp()
-            self._cache[state.session_id] = state
-            
-            # Persiste no database
-            await self.database.save_promo_state(state.session_id, state.to_dict())
-            logger.info(f"PromoState salvo: {state.session_id}")
+        """
+        Salva o estado de uma promoção
+        
+        Dentro de uma unit of work a escrita fica pendente até o commit do turno.
+        Estados sem alterações não são regravados. Se o backend suporta atualização
+        parcial (update_promo_state_fields), só os campos alterados são enviados.
+        """
+        self._cache.put(state.session_id, state)
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            uow.register_state(state)
             return True
+        
+        try:
+            return await self._persist_state(state)
         except Exception as e:
             logger.error(f"Erro ao salvar PromoState: {e}")
             return False
     
+    async def _persist_state(self, state: PromoState) -> bool:
+        changed = state.changed_fields()
+        if not changed:
+            logger.debug(f"PromoState sem alterações, nada a salvar: {state.session_id}")
+            return True
+        
+        state.update_timestamp()
+        
+        if self._versioned:
+            return await self._compare_and_swap(state, changed)
+        
+        # Persiste no database
+        saved = False
+        update_fields = getattr(self.database, 'update_promo_state_fields', None)
+        if update_fields and state.is_persisted():
+            fields = {name: getattr(state, name) for name in changed}
+            fields['updated_at'] = state.updated_at
+            saved = await update_fields(state.session_id, fields)
+        if not saved:
+            saved = await self.database.save_promo_state(state.session_id, state.to_dict())
+        
+        if saved is False:
+            logger.error(f"Database não salvou o PromoState: {state.session_id}")
+            return False
+        
+        state.mark_clean()
+        logger.info(f"PromoState salvo: {state.session_id} (campos: {', '.join(changed)})")
+        return True
+    
+    async def _compare_and_swap(self, state: PromoState, changed: list) -> bool:
+        """Grava com checagem de versão; em conflito faz merge com o que foi gravado e tenta de novo"""
+        for _ in range(self.max_cas_retries + 1):
+            new_version = await self.database.compare_and_swap_promo_state(
+                state.session_id, state.to_dict(), state.version, state.changed_fields()
+            )
+            if new_version is None:
+                logger.error(f"Database não salvou o PromoState: {state.session_id}")
+                return False
+            if new_version:
+                state.version = new_version
+                state.mark_clean()
+                logger.info(f"PromoState salvo: {state.session_id} v{new_version} (campos: {', '.join(changed)})")
+                return True
+            await self._merge_stored(state)
+        
+        logger.error(f"PromoState não salvo após {self.max_cas_retries} conflitos de versão: {state.session_id}")
+        return False
+    
+    async def _merge_stored(self, state: PromoState):
+        """Conflito de versão: traz o que outro worker gravou mantendo as alterações locais"""
+        self._coherence["conflicts"] += 1
+        stored = await self.database.get_promo_state_with_version(state.session_id)
+        if stored is None:
+            state.version = 0
+        else:
+            pending = state.rebase(*stored)
+            logger.warning(f"Conflito de versão no PromoState {state.session_id}, merge com v{state.version} (locais: {pending})")
+    
     async def delete(self, session_id: str) -> bool:
         """Remove o estado de uma promoção"""
         try:
-            if session_id in self._cache:
-                del self._cache[session_id]
+            self._cache.pop(session_id)
+            
+            uow = current_unit_of_work.get()
+            if uow is not None:
+                uow.register_delete(session_id)
+                return True
             
             await self.database.delete_promo_state(session_id)
             logger.info(f"PromoState deletado: {session_id}")
@@ -67,6 +257,215 @@ class MemoryManager:
             logger.error(f"Erro ao deletar PromoState: {e}")
             return False
     
+    async def save_message(self, session_id: str, user_message: str, ai_response: str):
+        """Registra uma interação de chat (pendente até o commit se houver unit of work)"""
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            uow.register_message(session_id, user_message, ai_response)
+            return
+        seq = await self.database.save_message(session_id, user_message, ai_response)
+        self._record_turn(session_id, user_message, ai_response, seq)
+    
+    # ========== HISTÓRICO RECENTE ==========
+    
+    async def get_recent_history(self, session_id: str, limit: int = RECENT_HISTORY_TURNS) -> List[Dict]:
+        """
+        Mensagens dos últimos `limit` turnos da sessão, em ordem cronológica
+        
+        Lê do buffer em memória; só vai ao database na primeira leitura da sessão
+        (ou quando limit passa do tamanho do buffer).
+        """
+        turns = self._history.get(session_id)
+        if turns is not None and limit <= self.history_turns:
+            self._history_stats["hits"] += 1
+            return self._flatten(list(turns)[-limit:] if limit else [])
+        
+        self._history_stats["misses"] += 1
+        messages = await self.database.get_recent_messages(session_id, limit=max(limit, self.history_turns))
+        grouped = self._group_turns(messages or [])
+        if session_id in self._cache and self.history_turns:
+            self._history[session_id] = deque(grouped, maxlen=self.history_turns)
+        return self._flatten(grouped[-limit:] if limit else [])
+    
+    def _record_turn(self, session_id: str, user_message: str, ai_response: str, seq):
+        """
+        Acrescenta um turno recém-gravado ao buffer (se a sessão já tem buffer)
+        
+        seq é o retorno do save_message do database: o número do turno (SQLite),
+        True (backends sem seq) ou None/False se a mensagem não foi gravada.
+        """
+        turns = self._history.get(session_id)
+        if turns is None or seq is None or seq is False:
+            return
+        seq = seq if type(seq) is int else None
+        last_seq = turns[-1][0].get('seq') if turns else None
+        if seq is not None and last_seq is not None and seq != last_seq + 1:
+            # Outro processo gravou turnos no meio: recarrega do database na próxima leitura
+            self._drop_history(session_id)
+            return
+        
+        turn = []
+        if user_message:
+            turn.append({"role": "user", "content": str(user_message), "seq": seq})
+        if ai_response:
+            turn.append({
+                "role": "assistant", "content": str(ai_response),
+                "timestamp": datetime.utcnow().isoformat(), "seq": seq
+            })
+        if turn:
+            turns.append(turn)
+    
+    def _drop_history(self, session_id: str):
+        self._history.pop(session_id, None)
+    
+    @staticmethod
+    def _group_turns(messages: List[Dict]) -> List[List[Dict]]:
+        """Agrupa mensagens user/assistant em turnos (pelo seq, ou user abrindo um turno novo)"""
+        turns: List[List[Dict]] = []
+        for msg in messages:
+            if not msg or not isinstance(msg, dict):
+                continue
+            if turns:
+                previous = turns[-1][-1]
+                if msg.get('seq') is not None:
+                    same_turn = msg.get('seq') == previous.get('seq')
+                else:
+                    same_turn = msg.get('role') == 'assistant' and previous.get('role') == 'user'
+                if same_turn:
+                    turns[-1].append(msg)
+                    continue
+            turns.append([msg])
+        return turns
+    
+    @staticmethod
+    def _flatten(turns) -> List[Dict]:
+        return [dict(msg) for turn in turns for msg in turn]
+    
+    async def save_promotion(self, promotion: Dict) -> bool:
+        """Salva uma promoção finalizada (pendente até o commit se houver unit of work)"""
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            uow.register_promotion(promotion)
+            return True
+        return await self.database.save_promotion(promotion)
+    
+    async def save_promotions(self, promotions: List[Dict]) -> List[Dict]:
+        """
+        Salva várias promoções finalizadas de uma vez (campanhas divididas por mês)
+        
+        Returns:
+            List[Dict]: Resultado por promoção ({"promo_id", "status"}); dentro de uma
+            unit of work o status é "pending" até o commit, que grava todas juntas
+        """
+        uow = current_unit_of_work.get()
+        if uow is not None:
+            for promotion in promotions:
+                uow.register_promotion(promotion)
+            return [{"promo_id": promotion.get('promo_id'), "status": "pending"} for promotion in promotions]
+        return await self._save_promotions(promotions)
+    
+    async def _save_promotions(self, promotions: List[Dict]) -> List[Dict]:
+        if hasattr(self.database, 'save_promotions'):
+            return await self.database.save_promotions(promotions)
+        results = []
+        for promotion in promotions:
+            saved = await self.database.save_promotion(promotion)
+            results.append({"promo_id": promotion.get('promo_id'), "status": "inserted" if saved else "failed"})
+        return results
+    
+    # ========== UNIT OF WORK ==========
+    
+    @asynccontextmanager
+    async def unit_of_work(self):
+        """
+        Agrupa as escritas feitas dentro do bloco em um único commit no final
+        
+        Exceções dentro do bloco (ou uow.rollback()) descartam as escritas pendentes
+        e tiram do cache as sessões afetadas, que voltam ao último estado confirmado.
+        Blocos aninhados reutilizam a unit of work externa.
+        """
+        outer = current_unit_of_work.get()
+        if outer is not None:
+            yield outer
+            return
+        
+        uow = UnitOfWork()
+        token = current_unit_of_work.set(uow)
+        try:
+            yield uow
+        except BaseException:
+            uow.rollback()
+            raise
+        finally:
+            current_unit_of_work.reset(token)
+            for session_id in uow.discarded_sessions:
+                self._cache.pop(session_id)
+        
+        await self._commit(uow)
+    
+    async def _commit(self, uow: UnitOfWork):
+        """Persiste as escritas pendentes, em uma transação quando o backend suporta"""
+        if uow.is_empty():
+            return
+        
+        dirty = [state for state in uow.states.values() if state.is_dirty()]
+        for state in dirty:
+            state.update_timestamp()
+        
+        apply = getattr(self.database, 'apply_unit_of_work', None)
+        try:
+            if apply is not None:
+                for _ in range(self.max_cas_retries + 1):
+                    result = await apply(
+                        states=[(state.to_dict(), state.version, state.changed_fields()) for state in dirty],
+                        deleted=list(uow.deleted),
+                        messages=uow.messages,
+                        promotions=uow.promotions
+                    )
+                    if result is None:
+                        raise RuntimeError("transação da unit of work não foi confirmada")
+                    if result.get("promotion_conflicts"):
+                        # Repetir não resolve: o promo_id pertence a outra sessão
+                        raise RuntimeError(f"promo_id já usado por outra sessão: {result['promotion_conflicts']}")
+                    if not result["conflicts"]:
+                        break
+                    for state in dirty:
+                        if state.session_id in result["conflicts"]:
+                            await self._merge_stored(state)
+                else:
+                    raise RuntimeError(f"conflitos de versão persistentes: {result['conflicts']}")
+                
+                for state in dirty:
+                    state.version = result["versions"].get(state.session_id, state.version)
+                    state.mark_clean()
+                for (session_id, user_message, ai_response), seq in zip(uow.messages, result["seqs"]):
+                    self._record_turn(session_id, user_message, ai_response, seq)
+            else:
+                # Backend sem transação: aplica na ordem, sem atomicidade
+                for session_id in uow.deleted:
+                    await self.database.delete_promo_state(session_id)
+                for state in dirty:
+                    if not await self._persist_state(state):
+                        raise RuntimeError(f"PromoState não salvo: {state.session_id}")
+                for session_id, user_message, ai_response in uow.messages:
+                    seq = await self.database.save_message(session_id, user_message, ai_response)
+                    self._record_turn(session_id, user_message, ai_response, seq)
+                if uow.promotions:
+                    results = await self._save_promotions(uow.promotions)
+                    failed = [r["promo_id"] for r in results if r["status"] == "failed"]
+                    if failed:
+                        raise RuntimeError(f"Promoções não gravadas no commit: {failed}")
+        except Exception:
+            # O cache pode ter estados que não chegaram ao banco
+            for session_id in uow.touched_sessions():
+                self._cache.pop(session_id)
+            raise
+        
+        logger.info(
+            f"Unit of work confirmada: {len(dirty)} estado(s), {len(uow.deleted)} exclusão(ões), "
+            f"{len(uow.messages)} mensagem(ns), {len(uow.promotions)} promoção(ões)"
+        )
+    
     async def list_all(self) -> list:
         """Lista todos os estados de promoções"""
         try:
@@ -76,7 +475,51 @@ class MemoryManager:
             logger.error(f"Erro ao listar PromoStates: {e}")
             return []
     
+    async def sweep_idle(self, idle_seconds: float, is_busy: Optional[Callable[[str], bool]] = None) -> Dict:
+        """
+        Tira da memória as sessões sem acesso há mais de idle_seconds
+        
+        Alterações pendentes são gravadas antes; se a gravação falha a sessão fica
+        em memória para não perder nada. A próxima mensagem recarrega do database.
+        
+        Args:
+            is_busy: Retorna True para sessões com turno em andamento (não são tocadas)
+        """
+        report = {"evicted": 0, "flushed": 0, "failed": 0, "skipped": 0}
+        for session_id, state in self._cache.idle_entries(idle_seconds):
+            if session_id in self._loading or (is_busy and is_busy(session_id)):
+                report["skipped"] += 1
+                continue
+            
+            if state.is_dirty():
+                try:
+                    saved = await self._persist_state(state)
+                except Exception as e:
+                    logger.error(f"Erro ao gravar PromoState ocioso {session_id}: {e}")
+                    saved = False
+                if not saved:
+                    report["failed"] += 1
+                    continue
+                report["flushed"] += 1
+            
+            # Durante o flush a sessão pode ter voltado a ser usada
+            if self._cache.peek(session_id) is state and not state.is_dirty():
+                self._cache.pop(session_id)
+                report["evicted"] += 1
+        return report
+    
     def clear_cache(self):
         """Limpa o cache de memória"""
         self._cache.clear()
         logger.info("Cache de PromoStates limpo")
+    
+    def get_cache_stats(self) -> Dict:
+        """Métricas do cache de PromoStates (hits, misses, evictions, bytes, coerência)"""
+        return {
+            **self._cache.get_stats(),
+            "revalidate": self.revalidate,
+            **self._coherence,
+            "history_sessions": len(self._history),
+            "history_hits": self._history_stats["hits"],
+            "history_misses": self._history_stats["misses"],
+        }
@@ -2,8 +2,8 @@
 Orchestrator - Orquestra o fluxo de criação de promoções
 """
 import logging
-from typing import Dict, Optional
-from src.core.promo_state import PromoState
+from typing import Dict, List, Optional
+from src.core.promo_state import PromoState, new_promo_id
 from src.core.memory_manager import MemoryManager
 from src.agents.extractor import ExtractorAgent
 from src.agents.validator import ValidatorAgent
@@ -60,15 +60,9 @@ class Orchestrator:
                     "new_promotion": True
                 }
             
-            # 3. Carrega histórico de conversas (últimas 10 mensagens)
-            conversation_history = await self.memory.database.get_recent_messages(session_id, limit=10)
-            
-            # PROTEÇÃO GLOBAL: Garante que histórico é sempre lista válida sem Nones
-            if conversation_history is None:
-                conversation_history = []
-            else:
-                # Filtra qualquer None que possa existir
-                conversation_history = [msg for msg in conversation_history if msg and isinstance(msg, dict)]
+            # 3. Carrega histórico de conversas (últimos 10 turnos, do buffer em memória da sessão)
+            # O MemoryManager já devolve lista sem Nones
+            conversation_history = await self.memory.get_recent_history(session_id, limit=10)
             
             logger.info(f"Histórico carregado: {len(conversation_history)} mensagens")
             
@@ -552,7 +546,6 @@ class Orchestrator:
             Dict com resposta
         """
         from src.services.excel_service import excel_service
-        from datetime import datetime
         import os
         
         message_lower = message.lower().strip()
@@ -580,16 +573,12 @@ class Orchestrator:
                 # Salva a promoção no banco como finalizada
                 state.status = "completed"
                 if not state.promo_id:
-                    state.promo_id = f"promo_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+                    state.promo_id = new_promo_id()
                 
                 await self.memory.save(state)
                 
-                # Salva todas as promoções no banco
-                if multiple_promos and len(multiple_promos) > 1:
-                    for promo in multiple_promos:
-                        await self.memory.database.save_promotion(promo)
-                else:
-                    await self.memory.database.save_promotion(state.to_dict())
+                # Salva todas as promoções no banco (em lote)
+                await self.memory.save_promotions(self._finalized_promotions(state))
                 
                 return {
                     "response": f"{success_msg}\n\n📊 O arquivo foi salvo em:\n`{abs_filepath}`\n\n💾 As promoções também foram salvas no sistema.\n\n🎉 Tudo pronto! Posso ajudar com outra promoção?",
@@ -609,20 +598,35 @@ class Orchestrator:
             # Usuário não quer exportar
             state.status = "completed"
             if not state.promo_id:
-                state.promo_id = f"promo_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
+                state.promo_id = new_promo_id()
             
             await self.memory.save(state)
             
-            # Salva todas as promoções no banco
-            multiple_promos = state.metadata.get('multiple_promotions', [])
-            if multiple_promos and len(multiple_promos) > 1:
-                for promo in multiple_promos:
-                    await self.memory.database.save_promotion(promo)
-            else:
-                await self.memory.database.save_promotion(state.to_dict())
+            # Salva todas as promoções no banco (em lote)
+            await self.memory.save_promotions(self._finalized_promotions(state))
             
             return {
                 "response": "✅ **Promoções salvas no sistema!**\n\n💾 As promoções foram armazenadas com sucesso sem exportação.\n\n🎉 Tudo pronto! Posso ajudar com outra promoção?",
                 "status": "completed",
                 "state": state.to_dict()
             }
+    
+    @staticmethod
+    def _finalized_promotions(state: PromoState) -> List[Dict]:
+        """
+        Promoções a gravar ao finalizar: as múltiplas do metadata ou o próprio estado
+        
+        As múltiplas vêm do extractor sem promo_id; cada uma recebe um derivado do
+        promo_id do estado, para o lote ser idempotente se o usuário confirmar de novo.
+        """
+        multiple_promos = state.metadata.get('multiple_promotions', [])
+        if not multiple_promos or len(multiple_promos) <= 1:
+            return [state.to_dict()]
+        return [
+            {
+                **promo,
+                "promo_id": promo.get('promo_id') or f"{state.promo_id}_{index:02d}",
+                "session_id": promo.get('session_id') or state.session_id
+            }
+            for index, promo in enumerate(multiple_promos, start=1)
+        ]
@@ -2,12 +2,48 @@
 PromoState - Gerencia o estado de uma promoção durante a criação
 """
 from typing import Optional, List, Dict
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields, MISSING
 from datetime import datetime
+import copy
 import json
+import uuid
 
 
-@dataclass
+# Campos cuja alteração torna o estado "sujo" (updated_at muda a cada save e não conta)
+TRACKED_FIELDS = (
+    'session_id', 'promo_id', 'titulo', 'mecanica', 'descricao', 'segmentacao',
+    'periodo_inicio', 'periodo_fim', 'condicoes', 'recompensas', 'produtos',
+    'categorias', 'clientes_alvo', 'volume_minimo', 'desconto_percentual',
+    'margem_esperada', 'roi_estimado', 'created_at', 'status', 'metadata'
+)
+# Campos mutáveis: alterações in-place não passam por __setattr__
+MUTABLE_FIELDS = ('produtos', 'categorias', 'clientes_alvo', 'metadata')
+# Campos obrigatórios, na ordem em que missing_fields os reporta
+REQUIRED_FIELDS = (
+    'titulo', 'mecanica', 'descricao', 'segmentacao',
+    'periodo_inicio', 'periodo_fim', 'condicoes', 'recompensas'
+)
+_TRACKED = frozenset(TRACKED_FIELDS)
+_REQUIRED = frozenset(REQUIRED_FIELDS)
+_MISSING = object()
+_set = object.__setattr__
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
+
+
+def new_promo_id() -> str:
+    """promo_id único entre sessões (o timestamp em segundos colidia entre sessões simultâneas)"""
+    return f"promo_{uuid.uuid4().hex}"
+
+
+def _bookkeeping():
+    """Atributo interno: vira slot, mas fica fora do __init__, do repr e da comparação"""
+    return field(init=False, repr=False, compare=False)
+
+
+@dataclass(slots=True)
 class PromoState:
     """Estado de uma promoção sendo criada"""
     
@@ -35,83 +71,126 @@ class PromoState:
     roi_estimado: Optional[str] = None
     
     # Metadados
-    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
-    updated_at: str = field(default_factory=lambda: datetime.utcnow().isoformat())
+    created_at: str = field(default_factory=_now)
+    updated_at: str = field(default_factory=_now)
     status: str = "draft"  # draft, validating, approved, rejected, sent
     metadata: Dict = field(default_factory=dict)  # Dados adicionais, ex: múltiplas promoções
     
+    # Controle de alterações: revision sobe a cada campo alterado e _changed_at guarda
+    # em qual revision cada campo mudou (ausente = 0). Um estado novo nunca foi persistido: tudo sujo.
+    revision: int = _bookkeeping()
+    _changed_at: Optional[Dict[str, int]] = _bookkeeping()
+    _clean_revision: int = _bookkeeping()
+    _clean_snapshot: Optional[Dict] = _bookkeeping()
+    # Versão gravada no database (0 = ainda não existe lá) e marcador da última
+    # revalidação do cache, usados pelo MemoryManager para detectar escritas de outros workers
+    version: int = _bookkeeping()
+    validated_at: Optional[int] = _bookkeeping()
+    # Cache de missing_fields, zerado quando um campo obrigatório é alterado
+    _missing: Optional[tuple] = _bookkeeping()
+    
+    def __post_init__(self):
+        _set(self, 'revision', 0)
+        _set(self, '_changed_at', None)
+        _set(self, '_clean_revision', -1)
+        _set(self, '_clean_snapshot', None)
+        _set(self, 'version', 0)
+        _set(self, 'validated_at', None)
+        _set(self, '_missing', None)
+    
+    def __setattr__(self, name, value):
+        if name in _TRACKED:
+            # Durante o __init__ o slot ainda está vazio: não conta como alteração
+            current = getattr(self, name, _MISSING)
+            if current is not _MISSING and current != value:
+                self.touch(name)
+        _set(self, name, value)
+    
+    def touch(self, field_name: str):
+        """Marca um campo como alterado (use após mutar listas/metadata in-place)"""
+        revision = self.revision + 1
+        _set(self, 'revision', revision)
+        changed_at = self._changed_at
+        if changed_at is None:
+            changed_at = {}
+            _set(self, '_changed_at', changed_at)
+        changed_at[field_name] = revision
+        if field_name in _REQUIRED:
+            _set(self, '_missing', None)
+    
+    def fields_changed_since(self, revision: int) -> List[str]:
+        """Campos alterados depois de uma revision (ex: durante uma extração)"""
+        changed_at = self._changed_at
+        if not changed_at:
+            return list(TRACKED_FIELDS) if revision < 0 else []
+        return [name for name in TRACKED_FIELDS if changed_at.get(name, 0) > revision]
+    
+    def changed_fields(self) -> List[str]:
+        """Campos alterados desde o último mark_clean (todos, se nunca foi persistido)"""
+        changed = self.fields_changed_since(self._clean_revision)
+        if self._clean_snapshot is not None:
+            for name in MUTABLE_FIELDS:
+                if name not in changed and getattr(self, name) != self._clean_snapshot[name]:
+                    changed.append(name)
+        return changed
+    
+    def is_dirty(self) -> bool:
+        """Verifica se há alterações ainda não persistidas"""
+        return bool(self.changed_fields())
+    
+    def is_persisted(self) -> bool:
+        """Verifica se o estado já foi gravado/carregado do database alguma vez"""
+        return self._clean_snapshot is not None
+    
+    def mark_clean(self):
+        """Registra que o estado atual está persistido"""
+        object.__setattr__(self, '_clean_revision', self.revision)
+        object.__setattr__(
+            self, '_clean_snapshot', {name: copy.deepcopy(getattr(self, name)) for name in MUTABLE_FIELDS}
+        )
+    
+    def rebase(self, stored: Dict, version: int) -> List[str]:
+        """
+        Adota a versão gravada por outro processo mantendo as alterações locais pendentes
+        
+        Campos alterados localmente prevalecem; os demais passam a ter o valor gravado.
+        
+        Returns:
+            List[str]: Campos locais que continuam pendentes após o merge
+        """
+        if self._clean_snapshot is None:
+            # Estado novo: só conta como alteração local o que foi preenchido depois de criado
+            local = set(self.fields_changed_since(0))
+            local.update(name for name in MUTABLE_FIELDS if getattr(self, name))
+        else:
+            local = set(self.changed_fields())
+        
+        other = PromoState.from_dict(stored)
+        for name in TRACKED_FIELDS + ('updated_at',):
+            if name not in local:
+                object.__setattr__(self, name, getattr(other, name))
+        _set(self, '_missing', None)
+        
+        object.__setattr__(self, '_clean_revision', max(self._clean_revision, 0))
+        object.__setattr__(
+            self, '_clean_snapshot', {name: copy.deepcopy(getattr(other, name)) for name in MUTABLE_FIELDS}
+        )
+        object.__setattr__(self, 'version', version)
+        return self.changed_fields()
+    
     def missing_fields(self) -> List[str]:
         """Retorna lista de campos obrigatórios faltantes"""
-        required = {
-            'titulo': self.titulo,
-            'mecanica': self.mecanica,
-            'descricao': self.descricao,
-            'segmentacao': self.segmentacao,
-            'periodo_inicio': self.periodo_inicio,
-            'periodo_fim': self.periodo_fim,
-            'condicoes': self.condicoes,
-            'recompensas': self.recompensas
-        }
-        
-        missing = [field for field, value in required.items() if not value]
-        return missing
+        if self._missing is None:
+            self._missing = tuple(name for name in REQUIRED_FIELDS if not getattr(self, name))
+        return list(self._missing)
     
     def is_complete(self) -> bool:
         """Verifica se todos os campos obrigatórios estão preenchidos"""
-        return len(self.missing_fields()) == 0
-    
-    def to_dict(self) -> Dict:
-        """Converte o estado para dicionário"""
-        return {
-            'session_id': self.session_id,
-            'promo_id': self.promo_id,
-            'titulo': self.titulo,
-            'mecanica': self.mecanica,
-            'descricao': self.descricao,
-            'segmentacao': self.segmentacao,
-            'periodo_inicio': self.periodo_inicio,
-            'periodo_fim': self.periodo_fim,
-            'condicoes': self.condicoes,
-            'recompensas': self.recompensas,
-            'produtos': self.produtos,
-            'categorias': self.categorias,
-            'clientes_alvo': self.clientes_alvo,
-            'volume_minimo': self.volume_minimo,
-            'desconto_percentual': self.desconto_percentual,
-            'margem_esperada': self.margem_esperada,
-            'roi_estimado': self.roi_estimado,
-            'created_at': self.created_at,
-            'updated_at': self.updated_at,
-            'status': self.status,
-            'metadata': self.metadata
-        }
-    
-    @classmethod
-    def from_dict(cls, data: Dict) -> 'PromoState':
-        """Cria um PromoState a partir de um dicionário"""
-        return cls(
-            session_id=data.get('session_id', ''),
-            promo_id=data.get('promo_id'),
-            titulo=data.get('titulo'),
-            mecanica=data.get('mecanica'),
-            descricao=data.get('descricao'),
-            segmentacao=data.get('segmentacao'),
-            periodo_inicio=data.get('periodo_inicio'),
-            periodo_fim=data.get('periodo_fim'),
-            condicoes=data.get('condicoes'),
-            recompensas=data.get('recompensas'),
-            produtos=data.get('produtos', []),
-            categorias=data.get('categorias', []),
-            clientes_alvo=data.get('clientes_alvo', []),
-            volume_minimo=data.get('volume_minimo'),
-            desconto_percentual=data.get('desconto_percentual'),
-            margem_esperada=data.get('margem_esperada'),
-            roi_estimado=data.get('roi_estimado'),
-            created_at=data.get('created_at', datetime.utcnow().isoformat()),
-            updated_at=data.get('updated_at', datetime.utcnow().isoformat()),
-            status=data.get('status', 'draft'),
-            metadata=data.get('metadata', {})
-        )
+        if self._missing is None:
+            self.missing_fields()
+        return not self._missing
+    
+    # to_dict/from_dict são gerados a partir de FIELD_NAMES logo abaixo da classe
     
     def to_json(self) -> str:
         """Converte o estado para JSON"""
@@ -123,6 +202,50 @@ class PromoState:
     
     def get_completion_percentage(self) -> float:
         """Retorna o percentual de completude dos campos obrigatórios"""
-        total_required = 8  # Total de campos obrigatórios
-        missing = len(self.missing_fields())
-        return ((total_required - missing) / total_required) * 100
+        if self._missing is None:
+            self.missing_fields()
+        total_required = len(REQUIRED_FIELDS)
+        return ((total_required - len(self._missing)) / total_required) * 100
+
+
+# Campos persistidos, na ordem de declaração (exclui os atributos internos)
+FIELD_NAMES = tuple(f.name for f in fields(PromoState) if f.init)
+
+
+def _compile(name: str, source: str, namespace: Dict):
+    exec(source, namespace)
+    return namespace[name]
+
+
+def _build_to_dict():
+    items = ", ".join(f"{name!r}: self.{name}" for name in FIELD_NAMES)
+    to_dict = _compile("to_dict", f"def to_dict(self):\n    return {{{items}}}\n", {})
+    to_dict.__doc__ = "Converte o estado para dicionário"
+    return to_dict
+
+
+def _build_from_dict():
+    """
+    from_dict sem passar pelo __init__/__setattr__: grava os slots direto e
+    aplica os mesmos defaults do dataclass para chaves ausentes
+    """
+    namespace = {"_set": _set}
+    lines = ["def from_dict(cls, data):", "    self = cls.__new__(cls)", "    get = data.get"]
+    for f in fields(PromoState):
+        if not f.init:
+            continue
+        if f.default_factory is not MISSING:
+            namespace[f"_factory_{f.name}"] = f.default_factory
+            value = f"data[{f.name!r}] if {f.name!r} in data else _factory_{f.name}()"
+        else:
+            namespace[f"_default_{f.name}"] = f.default
+            value = f"get({f.name!r}, _default_{f.name})"
+        lines.append(f"    _set(self, {f.name!r}, {value})")
+    lines += ["    self.__post_init__()", "    return self"]
+    from_dict = _compile("from_dict", "\n".join(lines) + "\n", namespace)
+    from_dict.__doc__ = "Cria um PromoState a partir de um dicionário"
+    return classmethod(from_dict)
+
+
+PromoState.to_dict = _build_to_dict()
+PromoState.from_dict = _build_from_dict()
@@ -0,0 +1,87 @@
+"""
+SessionLocks - Serializa os turnos de uma mesma sessão sem lock global
+"""
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+class _SessionEntry:
+    """Lock de uma sessão e quantas corrotinas o seguram ou aguardam"""
+
+    __slots__ = ('lock', 'users')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class SessionLockRegistry:
+    """
+    Um asyncio.Lock por session_id, criado sob demanda
+
+    Turnos da mesma sessão rodam um de cada vez, na ordem de chegada; sessões
+    diferentes não compartilham nada. A entrada é removida assim que ninguém mais
+    a usa, então o registro só guarda sessões com turno em andamento ou na fila.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _SessionEntry] = {}
+        self.acquisitions = 0
+        self.contended = 0  # Aquisições que precisaram esperar outro turno
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth = 0
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Aguarda a vez da sessão e segura o lock durante o bloco"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            entry = self._entries[session_id] = _SessionEntry()
+        entry.users += 1
+        self.max_queue_depth = max(self.max_queue_depth, entry.users - 1)
+
+        started = time.monotonic()
+        try:
+            if entry.lock.locked():
+                self.contended += 1
+                logger.debug(f"Turno aguardando a sessão {session_id} ({entry.users - 1} na frente)")
+            async with entry.lock:
+                waited = time.monotonic() - started
+                self.acquisitions += 1
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+                yield
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._entries[session_id]
+
+    def queue_depth(self, session_id: str) -> int:
+        """Turnos aguardando a sessão (sem contar o que está em execução)"""
+        entry = self._entries.get(session_id)
+        return max(entry.users - 1, 0) if entry else 0
+
+    def is_active(self, session_id: str) -> bool:
+        """Verifica se há turno em andamento (ou na fila) para a sessão"""
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        waiting = sum(entry.users - 1 for entry in self._entries.values() if entry.users > 1)
+        return {
+            "active_sessions": len(self._entries),
+            "waiting_turns": waiting,
+            "max_queue_depth": self.max_queue_depth,
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": round(self.total_wait_seconds / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+            "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+        }
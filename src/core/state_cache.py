@@ -0,0 +1,155 @@
+"""
+StateCache - Cache LRU com TTL para os PromoStates em memória
+"""
+import sys
+import time
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.core.promo_state import PromoState
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_size(obj, _seen: Optional[set] = None) -> int:
+    """Estimativa (recursiva) do tamanho em bytes de dicts/listas/strings"""
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_estimate_size(k, _seen) + _estimate_size(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(_estimate_size(item, _seen) for item in obj)
+    elif hasattr(obj, '__dict__'):
+        size += _estimate_size(vars(obj), _seen)
+    elif hasattr(type(obj), '__slots__'):
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                value = getattr(obj, name, None)
+                if value is not None:
+                    size += _estimate_size(value, _seen)
+    return size
+
+
+class StateCache:
+    """
+    Cache limitado por tamanho (LRU) e por tempo (TTL)
+
+    Todas as operações são síncronas e não cedem o event loop, então são
+    atômicas entre corrotinas sem precisar de lock.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1000,
+        ttl_seconds: float = 1800,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Args:
+            max_entries: Máximo de estados em memória (0 = sem limite)
+            ttl_seconds: Tempo de vida de uma entrada desde a última escrita (0 = sem expiração)
+            on_evict: Chamado com o session_id sempre que uma entrada sai do cache
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        # session_id -> (estado, momento da última escrita, momento do último acesso)
+        self._entries: "OrderedDict[str, Tuple[PromoState, float, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[PromoState]:
+        """Retorna o estado em cache (e o marca como recente) ou None"""
+        entry = self._entries.get(session_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        state, stored_at, _ = entry
+        now = time.monotonic()
+        if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+            del self._entries[session_id]
+            self.expirations += 1
+            self._evicted(session_id)
+            self.misses += 1
+            return None
+
+        self._entries[session_id] = (state, stored_at, now)
+        self._entries.move_to_end(session_id)
+        self.hits += 1
+        return state
+
+    def put(self, session_id: str, state: PromoState):
+        """Insere/atualiza um estado e remove os menos usados se passar do limite"""
+        now = time.monotonic()
+        self._entries[session_id] = (state, now, now)
+        self._entries.move_to_end(session_id)
+        while self.max_entries and len(self._entries) > self.max_entries:
+            evicted_id, _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._evicted(evicted_id)
+            logger.debug(f"PromoState removido do cache (LRU): {evicted_id}")
+
+    def peek(self, session_id: str) -> Optional[PromoState]:
+        """Retorna o estado sem contar como acesso (não mexe na ordem LRU nem nas métricas)"""
+        entry = self._entries.get(session_id)
+        return entry[0] if entry else None
+
+    def pop(self, session_id: str) -> Optional[PromoState]:
+        entry = self._entries.pop(session_id, None)
+        if entry is None:
+            return None
+        self._evicted(session_id)
+        return entry[0]
+
+    def idle_entries(self, idle_seconds: float) -> List[Tuple[str, PromoState]]:
+        """
+        Sessões sem acesso há mais de idle_seconds
+
+        A ordem LRU garante que as ociosas estão no começo: para no primeiro acesso recente.
+        """
+        cutoff = time.monotonic() - idle_seconds
+        idle = []
+        for session_id, (state, _, last_used) in self._entries.items():
+            if last_used > cutoff:
+                break
+            idle.append((session_id, state))
+        return idle
+
+    def clear(self):
+        for session_id in list(self._entries):
+            self._evicted(session_id)
+        self._entries.clear()
+
+    def _evicted(self, session_id: str):
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict:
+        """Métricas do cache (a estimativa de bytes percorre as entradas)"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "bytes_estimate": sum(_estimate_size(state) for state, _, _ in self._entries.values()),
+        }
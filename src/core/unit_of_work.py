@@ -0,0 +1,56 @@
+"""
+UnitOfWork - Agrupa as escritas de um turno de chat para um único commit
+"""
+import contextvars
+from typing import Dict, List, Optional, Set, Tuple
+
+from src.core.promo_state import PromoState
+
+
+class UnitOfWork:
+    """Escritas pendentes de um turno: estados, exclusões, mensagens e promoções"""
+
+    def __init__(self):
+        self.states: Dict[str, PromoState] = {}
+        self.deleted: Set[str] = set()
+        self.messages: List[Tuple[str, str, str]] = []
+        self.promotions: List[Dict] = []
+        self.rolled_back = False
+        self.discarded_sessions: Set[str] = set()
+
+    def register_state(self, state: PromoState):
+        self.states[state.session_id] = state
+
+    def register_delete(self, session_id: str):
+        self.states.pop(session_id, None)
+        self.deleted.add(session_id)
+
+    def register_message(self, session_id: str, user_message: str, ai_response: str):
+        self.messages.append((session_id, user_message, ai_response))
+
+    def register_promotion(self, promotion: Dict):
+        self.promotions.append(promotion)
+
+    def touched_sessions(self) -> Set[str]:
+        return set(self.states) | self.deleted
+
+    def rollback(self):
+        """
+        Descarta as escritas de estado/promoções registradas até aqui
+        O MemoryManager remove do cache as sessões afetadas no fim do bloco,
+        para que o próximo load leia o último estado confirmado.
+        """
+        self.rolled_back = True
+        self.discarded_sessions |= self.touched_sessions()
+        self.states.clear()
+        self.deleted.clear()
+        self.promotions.clear()
+
+    def is_empty(self) -> bool:
+        return not (self.states or self.deleted or self.messages or self.promotions)
+
+
+# Unit of work ativa na task atual (cada requisição roda em seu próprio contexto)
+current_unit_of_work: contextvars.ContextVar[Optional[UnitOfWork]] = contextvars.ContextVar(
+    'current_unit_of_work', default=None
+)
@@ -1,17 +1,128 @@
 import aiosqlite
+import asyncio
 import logging
 import json
-from typing import List, Dict, Optional
+import os
+from typing import List, Dict, Optional, Tuple, AsyncIterator, AsyncIterable
 from datetime import datetime
+from src.services.state_codec import StateCodec, state_codec
+from src.services.storage import PROMOTION_SUMMARY_FIELDS
+from src.core.config import STATE_EVENT_SOURCING, STATE_SNAPSHOT_EVERY
 
 logger = logging.getLogger(__name__)
 
+# Colunas gravadas em promotions (o id autoincremento fica de fora)
+PROMOTION_COLUMNS = (
+    'promo_id', 'session_id', 'titulo', 'mecanica', 'descricao', 'segmentacao',
+    'periodo_inicio', 'periodo_fim', 'condicoes', 'recompensas', 'produtos',
+    'categorias', 'volume_minimo', 'desconto_percentual', 'status', 'created_at', 'sent_at'
+)
+PROMOTION_COLUMNS_SQL = ", ".join(PROMOTION_COLUMNS)
+PROMOTION_PLACEHOLDERS_SQL = ", ".join("?" for _ in PROMOTION_COLUMNS)
+# Idempotente por promo_id: a linha existente é mantida (quem grava confere o session_id dela)
+PROMOTION_INSERT_SQL = f"INSERT OR IGNORE INTO promotions ({PROMOTION_COLUMNS_SQL}) VALUES ({PROMOTION_PLACEHOLDERS_SQL})"
+# promo_ids por consulta IN: builds antigos do SQLite aceitam no máximo 999 parâmetros
+PROMOTION_LOOKUP_CHUNK = 500
+PROMOTION_CONFLICT_ERROR = "promo_id já usado por outra sessão"
+
+# Listagem paginada por keyset (created_at, id): cada página é um seek no índice,
+# custo constante mesmo com a tabela grande (OFFSET teria que pular as anteriores)
+PROMOTION_PAGE_SQL = f"""SELECT id, {", ".join(PROMOTION_SUMMARY_FIELDS)} FROM promotions
+    {{where}} ORDER BY created_at DESC, id DESC LIMIT ?"""
+
+# Toda escrita de estado incrementa version (base do compare-and-swap entre workers).
+# Gravar state_data é um snapshot: os eventos até event_seq já estão incluídos nele.
+PROMO_STATE_UPSERT_SQL = '''INSERT INTO promo_states
+    (session_id, promo_id, state_data, created_at, updated_at, status, version)
+    VALUES (?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (session_id) DO UPDATE SET
+        promo_id = excluded.promo_id,
+        state_data = excluded.state_data,
+        updated_at = excluded.updated_at,
+        status = excluded.status,
+        version = promo_states.version + 1,
+        snapshot_seq = promo_states.event_seq'''
+PROMO_STATE_INSERT_SQL = '''INSERT INTO promo_states
+    (session_id, promo_id, state_data, created_at, updated_at, status, version)
+    VALUES (?, ?, ?, ?, ?, ?, 1)
+    ON CONFLICT (session_id) DO NOTHING'''
+PROMO_STATE_CAS_SQL = '''UPDATE promo_states
+    SET promo_id = ?, state_data = ?, updated_at = ?, status = ?, version = version + 1,
+        snapshot_seq = event_seq
+    WHERE session_id = ? AND version = ?'''
+# Modo event-sourced: só avança a versão/event_seq, sem reescrever state_data
+PROMO_STATE_APPEND_SQL = '''UPDATE promo_states
+    SET promo_id = ?, updated_at = ?, status = ?, version = version + 1, event_seq = event_seq + ?
+    WHERE session_id = ? AND version = ?'''
+PROMO_STATE_SELECT_SQL = '''SELECT session_id, state_data, version, updated_at, snapshot_seq, event_seq
+    FROM promo_states'''
+
+PROMO_STATE_EVENTS_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS promo_state_events (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT,
+    created_at TEXT,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;'''
+
+MESSAGES_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    user_message TEXT,
+    ai_response TEXT,
+    timestamp TEXT,
+    agno_version TEXT,
+    PRIMARY KEY (session_id, seq),
+    FOREIGN KEY (session_id) REFERENCES sessions (id)
+) WITHOUT ROWID;'''
+
+PROMO_STATES_ARCHIVE_TABLE_SQL = '''CREATE TABLE IF NOT EXISTS promo_states_archive (
+    session_id TEXT PRIMARY KEY,
+    promo_id TEXT,
+    state_data TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    status TEXT,
+    archived_at TEXT
+);'''
+# Estados que não são arquivados por ociosidade (promoção já concluída)
+ARCHIVE_EXCLUDED_STATUSES = ('completed', 'sent')
+
+# Tabelas sujeitas à política de retenção -> (coluna de timestamp do corte, chave primária)
+RETENTION_TABLES = {
+    'messages': ('timestamp', 'session_id, seq'),
+    'system_logs': ('timestamp', 'id'),
+}
+
+# Colunas de promotions indexadas na busca textual (ordem = índice da coluna no FTS5)
+PROMOTION_SEARCH_COLUMNS = ('titulo', 'descricao', 'condicoes', 'recompensas', 'produtos')
+# Pesos do bm25 por coluna: título pesa mais que o restante do texto
+PROMOTION_SEARCH_WEIGHTS = (10.0, 4.0, 2.0, 2.0, 3.0)
+
+
 class LocalDatabase:
-    def __init__(self, db_path: str = "promoagente_local.db"):
+    def __init__(
+        self,
+        db_path: str = "promoagente_local.db",
+        codec: Optional[StateCodec] = None,
+        event_sourcing: bool = STATE_EVENT_SOURCING,
+        snapshot_every: int = STATE_SNAPSHOT_EVERY
+    ):
         self.db_path = db_path
+        self.codec = codec or state_codec
+        self.event_sourcing = event_sourcing
+        self.snapshot_every = snapshot_every
+        self.fts_enabled: bool = False
+        # Conexão persistente só para ler PRAGMA data_version (o valor é por conexão)
+        self._probe_db: Optional[aiosqlite.Connection] = None
 
     async def initialize(self):
         async with aiosqlite.connect(self.db_path) as db:
+            # Libera páginas de forma incremental após expurgos (só tem efeito em bancos novos;
+            # bancos existentes precisam de um VACUUM único, ver enable_incremental_vacuum)
+            await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            
             # Tabela de sessões
             await db.execute(
                 '''CREATE TABLE IF NOT EXISTS sessions (
@@ -22,18 +133,9 @@ class LocalDatabase:
                 );'''
             )
             
-            # Tabela de mensagens
-            await db.execute(
-                '''CREATE TABLE IF NOT EXISTS messages (
-                    id TEXT PRIMARY KEY,
-                    session_id TEXT,
-                    user_message TEXT,
-                    ai_response TEXT,
-                    timestamp TEXT,
-                    agno_version TEXT,
-                    FOREIGN KEY (session_id) REFERENCES sessions (id)
-                );'''
-            )
+            # Tabela de mensagens: log append-only por sessão, chave (session_id, seq)
+            await self._migrate_legacy_messages(db)
+            await db.execute(MESSAGES_TABLE_SQL)
             
             # Tabela de logs do sistema
             await db.execute(
@@ -46,6 +148,14 @@ class LocalDatabase:
                 );'''
             )
             
+            # Índices para o corte da retenção
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)"
+            )
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_system_logs_timestamp ON system_logs (timestamp)"
+            )
+            
             # NOVA: Tabela de estados de promoções
             await db.execute(
                 '''CREATE TABLE IF NOT EXISTS promo_states (
@@ -55,9 +165,22 @@ class LocalDatabase:
                     created_at TEXT,
                     updated_at TEXT,
                     status TEXT,
+                    version INTEGER NOT NULL DEFAULT 1,
                     FOREIGN KEY (session_id) REFERENCES sessions (id)
                 );'''
             )
+            await self._add_missing_column(db, 'promo_states', 'version', 'INTEGER NOT NULL DEFAULT 1')
+            # Log de alterações por campo: state_data é o snapshot até snapshot_seq,
+            # eventos com seq > snapshot_seq são reaplicados na leitura
+            await self._add_missing_column(db, 'promo_states', 'event_seq', 'INTEGER NOT NULL DEFAULT 0')
+            await self._add_missing_column(db, 'promo_states', 'snapshot_seq', 'INTEGER NOT NULL DEFAULT 0')
+            await db.execute(PROMO_STATE_EVENTS_TABLE_SQL)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_promo_states_updated_at ON promo_states (updated_at)"
+            )
+            
+            # Arquivo frio de rascunhos abandonados (ver archive_idle_promo_states)
+            await db.execute(PROMO_STATES_ARCHIVE_TABLE_SQL)
             
             # NOVA: Tabela de promoções finalizadas
             await db.execute(
@@ -83,11 +206,115 @@ class LocalDatabase:
                     FOREIGN KEY (session_id) REFERENCES sessions (id)
                 );'''
             )
+            # Ordem da listagem paginada (get_promotions_page)
+            await db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_promotions_created_at ON promotions (created_at DESC, id DESC)"
+            )
+            
+            # NOVA: Índice full-text das promoções (FTS5)
+            self.fts_enabled = await self._create_search_index(db)
             
             await db.commit()
         logger.info("✅ SQLite inicializado com sucesso!")
         return True
 
+    async def _migrate_legacy_messages(self, db):
+        """Converte a tabela messages antiga (id 'msg_<timestamp>') para a chave (session_id, seq)"""
+        if not await self._has_legacy_messages(db):
+            return
+        
+        # Uma só transação: se qualquer passo falhar, a tabela antiga fica intacta e a
+        # migração é refeita no próximo initialize (sem messages_legacy órfã)
+        await db.execute("BEGIN IMMEDIATE")
+        if not await self._has_legacy_messages(db):
+            await db.rollback()  # Outro processo migrou enquanto esperávamos o lock
+            return
+        logger.info("🔄 Migrando messages para chave (session_id, seq)...")
+        try:
+            await db.execute("ALTER TABLE messages RENAME TO messages_legacy")
+            await db.execute(MESSAGES_TABLE_SQL)
+            await db.execute(
+                """INSERT INTO messages (session_id, seq, user_message, ai_response, timestamp, agno_version)
+                   SELECT COALESCE(session_id, ''),
+                          ROW_NUMBER() OVER (PARTITION BY COALESCE(session_id, '') ORDER BY timestamp, id),
+                          user_message, ai_response, timestamp, agno_version
+                   FROM messages_legacy"""
+            )
+            await db.execute("DROP TABLE messages_legacy")
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"❌ Migração de messages desfeita: {e}")
+            raise
+        logger.info("✅ Migração de messages concluída")
+
+    @staticmethod
+    async def _has_legacy_messages(db) -> bool:
+        """A tabela messages existe e ainda está no layout antigo (sem seq)"""
+        cursor = await db.execute("PRAGMA table_info(messages)")
+        columns = [row[1] for row in await cursor.fetchall()]
+        return bool(columns) and 'seq' not in columns
+
+    @staticmethod
+    async def _add_missing_column(db, table: str, column: str, definition: str):
+        """Adiciona uma coluna em bancos criados antes dela existir"""
+        cursor = await db.execute(f"PRAGMA table_info({table})")
+        if column not in [row[1] for row in await cursor.fetchall()]:
+            await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            logger.info(f"🔧 Coluna {table}.{column} adicionada")
+    
+    async def close(self):
+        """Fecha a conexão persistente usada para checar data_version"""
+        if self._probe_db is not None:
+            await self._probe_db.close()
+            self._probe_db = None
+    
+    async def _create_search_index(self, db) -> bool:
+        """Cria a tabela FTS5 de busca e os triggers que a mantêm em sincronia com promotions"""
+        columns = ", ".join(PROMOTION_SEARCH_COLUMNS)
+        new_values = ", ".join(f"new.{col}" for col in PROMOTION_SEARCH_COLUMNS)
+        old_values = ", ".join(f"old.{col}" for col in PROMOTION_SEARCH_COLUMNS)
+        try:
+            cursor = await db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'promotions_fts'"
+            )
+            already_exists = await cursor.fetchone() is not None
+            
+            # Tabela external-content: o texto fica só em promotions, o FTS guarda apenas o índice
+            await db.execute(
+                f'''CREATE VIRTUAL TABLE IF NOT EXISTS promotions_fts USING fts5(
+                    {columns},
+                    content='promotions',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                );'''
+            )
+            await db.execute(
+                f'''CREATE TRIGGER IF NOT EXISTS promotions_fts_ai AFTER INSERT ON promotions BEGIN
+                    INSERT INTO promotions_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                END;'''
+            )
+            await db.execute(
+                f'''CREATE TRIGGER IF NOT EXISTS promotions_fts_ad AFTER DELETE ON promotions BEGIN
+                    INSERT INTO promotions_fts (promotions_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                END;'''
+            )
+            await db.execute(
+                f'''CREATE TRIGGER IF NOT EXISTS promotions_fts_au AFTER UPDATE ON promotions BEGIN
+                    INSERT INTO promotions_fts (promotions_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO promotions_fts (rowid, {columns}) VALUES (new.id, {new_values});
+                END;'''
+            )
+            
+            # Bancos antigos já têm promoções que os triggers nunca viram
+            if not already_exists:
+                await db.execute("INSERT INTO promotions_fts (promotions_fts) VALUES ('rebuild')")
+                logger.info("🔎 Índice de busca de promoções criado")
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ FTS5 indisponível, busca de promoções desativada: {e}")
+            return False
+
     async def get_message_count(self) -> int:
         """Retorna total de mensagens registradas para monitoramento de saúde."""
         try:
@@ -100,38 +327,77 @@ class LocalDatabase:
             return 0
 
     async def get_recent_messages(self, session_id: str, limit: int = 20) -> List[Dict]:
-        """Buscar mensagens recentes de uma sessão."""
+        """Buscar mensagens recentes de uma sessão (últimas N pela chave, sem ordenar por timestamp)."""
         try:
             async with aiosqlite.connect(self.db_path) as db:
                 db.row_factory = aiosqlite.Row
                 cursor = await db.execute(
-                    "SELECT user_message, ai_response, timestamp FROM messages WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?",
+                    "SELECT seq, user_message, ai_response, timestamp FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
                     (session_id, limit)
                 )
                 rows = await cursor.fetchall()
-                messages = []
-                for row in reversed(rows):  # Inverter para ordem cronológica
-                    # Garante que sempre adiciona dict válido, nunca None
-                    if row and row['user_message']:
-                        messages.append({"role": "user", "content": str(row['user_message'])})
-                    if row and row['ai_response']:
-                        messages.append({"role": "assistant", "content": str(row['ai_response']), "timestamp": str(row['timestamp'])})
-                return messages  # Sempre retorna lista, mesmo que vazia
+                return self._rows_to_messages(reversed(rows))  # Inverter para ordem cronológica
         except Exception as e:
             logger.error(f"Erro ao buscar mensagens: {e}")
             return []
 
-    async def save_message(self, session_id: str, user_message: str, ai_response: str):
-        """Salva uma única interação de chat no banco de dados."""
+    async def get_messages_since(self, session_id: str, after_seq: int = 0, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Busca as mensagens de uma sessão com seq maior que after_seq, em ordem
+        
+        Com after_seq=0 retorna o histórico completo da sessão (um range scan na chave).
+        """
         try:
             async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "INSERT INTO messages (id, session_id, user_message, ai_response, timestamp) VALUES (?, ?, ?, ?, ?)",
-                    (f"msg_{datetime.utcnow().timestamp()}", session_id, user_message, ai_response, datetime.utcnow().isoformat())
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute(
+                    "SELECT seq, user_message, ai_response, timestamp FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                    (session_id, after_seq, -1 if limit is None else limit)
                 )
+                return self._rows_to_messages(await cursor.fetchall())
+        except Exception as e:
+            logger.error(f"Erro ao buscar mensagens: {e}")
+            return []
+
+    async def save_message(self, session_id: str, user_message: str, ai_response: str) -> Optional[int]:
+        """Salva uma única interação de chat no banco de dados e retorna o seq atribuído."""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                # BEGIN IMMEDIATE reserva o lock de escrita antes de ler o último seq,
+                # então inserts concorrentes na mesma sessão nunca recebem o mesmo número
+                await db.execute("BEGIN IMMEDIATE")
+                seq = await self._insert_message(db, session_id, user_message, ai_response)
                 await db.commit()
+                return seq
         except Exception as e:
             logger.error(f"Erro ao salvar mensagem: {e}")
+            return None
+    
+    @staticmethod
+    async def _insert_message(db, session_id: str, user_message: str, ai_response: str) -> int:
+        """Insere a mensagem com o próximo seq da sessão (exige transação já aberta)"""
+        cursor = await db.execute(
+            "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?",
+            (session_id,)
+        )
+        seq = (await cursor.fetchone())[0]
+        await db.execute(
+            "INSERT INTO messages (session_id, seq, user_message, ai_response, timestamp) VALUES (?, ?, ?, ?, ?)",
+            (session_id, seq, user_message, ai_response, datetime.utcnow().isoformat())
+        )
+        return seq
+    
+    @staticmethod
+    def _rows_to_messages(rows) -> List[Dict]:
+        """Converte linhas de messages em mensagens user/assistant"""
+        messages = []
+        for row in rows:
+            # Garante que sempre adiciona dict válido, nunca None
+            if row and row['user_message']:
+                messages.append({"role": "user", "content": str(row['user_message']), "seq": row['seq']})
+            if row and row['ai_response']:
+                messages.append({"role": "assistant", "content": str(row['ai_response']), "timestamp": str(row['timestamp']), "seq": row['seq']})
+        return messages  # Sempre retorna lista, mesmo que vazia
     
     # ========== MÉTODOS PARA PROMO_STATES ==========
     
@@ -139,108 +405,421 @@ class LocalDatabase:
         """Salva ou atualiza o estado de uma promoção"""
         try:
             async with aiosqlite.connect(self.db_path) as db:
-                state_json = json.dumps(state_dict, ensure_ascii=False)
-                await db.execute(
-                    """INSERT OR REPLACE INTO promo_states 
-                       (session_id, promo_id, state_data, created_at, updated_at, status)
-                       VALUES (?, ?, ?, ?, ?, ?)""",
-                    (
-                        session_id,
-                        state_dict.get('promo_id'),
-                        state_json,
-                        state_dict.get('created_at', datetime.utcnow().isoformat()),
-                        state_dict.get('updated_at', datetime.utcnow().isoformat()),
-                        state_dict.get('status', 'draft')
-                    )
-                )
+                await db.execute(PROMO_STATE_UPSERT_SQL, self._promo_state_params(session_id, state_dict))
                 await db.commit()
             return True
         except Exception as e:
             logger.error(f"Erro ao salvar promo_state: {e}")
             return False
     
+    def _promo_state_params(self, session_id: str, state_dict: Dict) -> tuple:
+        return (
+            session_id,
+            state_dict.get('promo_id'),
+            self.codec.encode(state_dict),
+            state_dict.get('created_at', datetime.utcnow().isoformat()),
+            state_dict.get('updated_at', datetime.utcnow().isoformat()),
+            state_dict.get('status', 'draft')
+        )
+    
     async def get_promo_state(self, session_id: str) -> Optional[Dict]:
         """Recupera o estado de uma promoção"""
+        stored = await self.get_promo_state_with_version(session_id)
+        return stored[0] if stored else None
+    
+    async def get_promo_state_with_version(self, session_id: str) -> Optional[Tuple[Dict, int]]:
+        """Recupera o estado de uma promoção (snapshot + eventos posteriores) junto com sua versão"""
         try:
             async with aiosqlite.connect(self.db_path) as db:
                 db.row_factory = aiosqlite.Row
-                cursor = await db.execute(
-                    "SELECT state_data FROM promo_states WHERE session_id = ?",
-                    (session_id,)
-                )
+                cursor = await db.execute(f"{PROMO_STATE_SELECT_SQL} WHERE session_id = ?", (session_id,))
                 row = await cursor.fetchone()
                 if row:
-                    return json.loads(row['state_data'])
+                    return await self._read_state(db, row), row['version']
                 return None
         except Exception as e:
             logger.error(f"Erro ao recuperar promo_state: {e}")
             return None
     
-    async def delete_promo_state(self, session_id: str) -> bool:
-        """Remove o estado de uma promoção"""
+    async def _read_state(self, db, row) -> Dict:
+        """Decodifica o snapshot e reaplica os eventos gravados depois dele"""
+        state = self.codec.decode(row['state_data'])
+        if row['event_seq'] > row['snapshot_seq']:
+            cursor = await db.execute(
+                "SELECT field, value FROM promo_state_events WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (row['session_id'], row['snapshot_seq'])
+            )
+            for field_name, value in await cursor.fetchall():
+                state[field_name] = json.loads(value)
+            state['updated_at'] = row['updated_at']
+        return state
+    
+    async def get_promo_state_version(self, session_id: str) -> Optional[int]:
+        """
+        Lê só a versão de um estado (checagem barata de cache desatualizado)
+        
+        Returns:
+            Optional[int]: Versão gravada, 0 se o estado não existe, None em erro
+        """
         try:
             async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    "DELETE FROM promo_states WHERE session_id = ?",
+                cursor = await db.execute(
+                    "SELECT version FROM promo_states WHERE session_id = ?",
                     (session_id,)
                 )
+                row = await cursor.fetchone()
+                return row[0] if row else 0
+        except Exception as e:
+            logger.error(f"Erro ao ler versão do promo_state: {e}")
+            return None
+    
+    async def data_version(self) -> Optional[int]:
+        """
+        PRAGMA data_version da conexão persistente
+        
+        O valor muda sempre que outra conexão (deste ou de outro processo) faz commit,
+        então enquanto ele não muda nenhum estado em cache pode estar desatualizado.
+        """
+        try:
+            if self._probe_db is None:
+                probe = await aiosqlite.connect(self.db_path)
+                if self._probe_db is None:
+                    self._probe_db = probe
+                else:
+                    # Outra corrotina abriu a conexão enquanto esta esperava: fica uma só
+                    await probe.close()
+            cursor = await self._probe_db.execute("PRAGMA data_version")
+            return (await cursor.fetchone())[0]
+        except Exception as e:
+            logger.warning(f"Erro ao ler data_version: {e}")
+            return None
+    
+    async def compare_and_swap_promo_state(
+        self,
+        session_id: str,
+        state_dict: Dict,
+        expected_version: int,
+        changed_fields: Optional[List[str]] = None
+    ) -> Optional[int]:
+        """
+        Grava o estado somente se a versão no banco ainda for expected_version
+        
+        Args:
+            expected_version: Versão lida pelo chamador (0 = o estado ainda não existe)
+            changed_fields: Campos alterados desde a última gravação; no modo event-sourced
+                só eles são gravados (como eventos), sem reescrever o estado inteiro
+        
+        Returns:
+            Optional[int]: Nova versão; 0 se outro processo gravou antes (conflito); None em erro
+        """
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("BEGIN IMMEDIATE")
+                new_version = await self._compare_and_swap(db, session_id, state_dict, expected_version, changed_fields)
+                await db.commit()
+                return new_version
+        except Exception as e:
+            logger.error(f"Erro ao salvar promo_state (CAS): {e}")
+            return None
+    
+    async def _compare_and_swap(
+        self,
+        db,
+        session_id: str,
+        state_dict: Dict,
+        expected_version: int,
+        changed_fields: Optional[List[str]] = None
+    ) -> int:
+        if expected_version == 0:
+            cursor = await db.execute(PROMO_STATE_INSERT_SQL, self._promo_state_params(session_id, state_dict))
+            return 1 if cursor.rowcount == 1 else 0
+        
+        if self.event_sourcing and changed_fields is not None:
+            return await self._append_events(db, session_id, state_dict, expected_version, changed_fields)
+        
+        _, promo_id, state_blob, _, updated_at, status = self._promo_state_params(session_id, state_dict)
+        cursor = await db.execute(
+            PROMO_STATE_CAS_SQL,
+            (promo_id, state_blob, updated_at, status, session_id, expected_version)
+        )
+        return expected_version + 1 if cursor.rowcount == 1 else 0
+    
+    async def _append_events(
+        self,
+        db,
+        session_id: str,
+        state_dict: Dict,
+        expected_version: int,
+        changed_fields: List[str]
+    ) -> int:
+        """
+        Modo event-sourced: grava um evento por campo alterado (O(alteração))
+        
+        Os eventos são sempre gravados (histórico completo); o snapshot do estado inteiro
+        só é regravado a cada snapshot_every eventos ou quando o status muda.
+        Exige transação já aberta.
+        """
+        updated_at = state_dict.get('updated_at', datetime.utcnow().isoformat())
+        cursor = await db.execute(
+            PROMO_STATE_APPEND_SQL,
+            (state_dict.get('promo_id'), updated_at, state_dict.get('status', 'draft'),
+             len(changed_fields), session_id, expected_version)
+        )
+        if cursor.rowcount != 1:
+            return 0
+        
+        cursor = await db.execute(
+            "SELECT event_seq, snapshot_seq FROM promo_states WHERE session_id = ?", (session_id,)
+        )
+        event_seq, snapshot_seq = await cursor.fetchone()
+        first_seq = event_seq - len(changed_fields) + 1
+        await db.executemany(
+            "INSERT INTO promo_state_events (session_id, seq, field, value, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (session_id, first_seq + i, name, json.dumps(state_dict.get(name), ensure_ascii=False), updated_at)
+                for i, name in enumerate(changed_fields)
+            ]
+        )
+        
+        if 'status' in changed_fields or event_seq - snapshot_seq >= self.snapshot_every:
+            await db.execute(
+                "UPDATE promo_states SET state_data = ?, snapshot_seq = event_seq WHERE session_id = ?",
+                (self.codec.encode(state_dict), session_id)
+            )
+        return expected_version + 1
+    
+    async def get_promo_state_events(self, session_id: str, limit: int = 200) -> List[Dict]:
+        """Histórico de alterações por campo de um estado (modo event-sourced), mais antigas primeiro"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute(
+                    """SELECT seq, field, value, created_at FROM (
+                           SELECT * FROM promo_state_events WHERE session_id = ? ORDER BY seq DESC LIMIT ?
+                       ) ORDER BY seq""",
+                    (session_id, limit)
+                )
+                return [
+                    {"seq": row['seq'], "field": row['field'], "value": json.loads(row['value']), "created_at": row['created_at']}
+                    for row in await cursor.fetchall()
+                ]
+        except Exception as e:
+            logger.error(f"Erro ao buscar eventos do promo_state: {e}")
+            return []
+    
+    async def delete_promo_state(self, session_id: str) -> bool:
+        """Remove o estado de uma promoção (e seu log de eventos)"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await self._delete_promo_states(db, [session_id])
                 await db.commit()
             return True
         except Exception as e:
             logger.error(f"Erro ao deletar promo_state: {e}")
             return False
     
+    @staticmethod
+    async def _delete_promo_states(db, session_ids: List[str]):
+        params = [(session_id,) for session_id in session_ids]
+        await db.executemany("DELETE FROM promo_states WHERE session_id = ?", params)
+        await db.executemany("DELETE FROM promo_state_events WHERE session_id = ?", params)
+    
     async def list_all_promo_states(self) -> List[Dict]:
         """Lista todos os estados de promoções"""
         try:
             async with aiosqlite.connect(self.db_path) as db:
                 db.row_factory = aiosqlite.Row
-                cursor = await db.execute(
-                    "SELECT state_data FROM promo_states ORDER BY updated_at DESC"
-                )
+                cursor = await db.execute(f"{PROMO_STATE_SELECT_SQL} ORDER BY updated_at DESC")
                 rows = await cursor.fetchall()
-                return [json.loads(row['state_data']) for row in rows]
+                return [await self._read_state(db, row) for row in rows]
         except Exception as e:
             logger.error(f"Erro ao listar promo_states: {e}")
             return []
     
+    async def archive_idle_promo_states(self, cutoff: str, batch_size: int = 500) -> int:
+        """
+        Move para promo_states_archive os rascunhos sem atualização desde cutoff
+        
+        O estado é materializado (snapshot + eventos) e o log de eventos é descartado.
+        Cada lote é uma transação curta; restore_archived_promo_state desfaz o arquivamento.
+        
+        Args:
+            cutoff: Timestamp ISO; estados com updated_at anterior são arquivados
+            batch_size: Estados movidos por transação
+        
+        Returns:
+            int: Quantidade de estados arquivados
+        """
+        excluded = ", ".join("?" for _ in ARCHIVE_EXCLUDED_STATUSES)
+        archived = 0
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                while True:
+                    await db.execute("BEGIN IMMEDIATE")
+                    cursor = await db.execute(
+                        f"""SELECT session_id, promo_id, state_data, created_at, updated_at, status,
+                                   snapshot_seq, event_seq
+                            FROM promo_states
+                            WHERE updated_at < ? AND COALESCE(status, 'draft') NOT IN ({excluded})
+                            LIMIT ?""",
+                        (cutoff, *ARCHIVE_EXCLUDED_STATUSES, batch_size)
+                    )
+                    rows = await cursor.fetchall()
+                    if not rows:
+                        await db.rollback()
+                        break
+                    
+                    archived_at = datetime.utcnow().isoformat()
+                    await db.executemany(
+                        """INSERT OR REPLACE INTO promo_states_archive
+                           (session_id, promo_id, state_data, created_at, updated_at, status, archived_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                        [
+                            (row['session_id'], row['promo_id'], self.codec.encode(await self._read_state(db, row)),
+                             row['created_at'], row['updated_at'], row['status'], archived_at)
+                            for row in rows
+                        ]
+                    )
+                    await self._delete_promo_states(db, [row['session_id'] for row in rows])
+                    await db.commit()
+                    archived += len(rows)
+                    if len(rows) < batch_size:
+                        break
+        except Exception as e:
+            logger.error(f"Erro ao arquivar promo_states ociosos: {e}")
+        return archived
+    
+    async def restore_archived_promo_state(self, session_id: str) -> bool:
+        """
+        Traz um estado arquivado de volta para promo_states (True se restaurou)
+        
+        Se a sessão já tem estado atual ele vence e a cópia arquivada fica no arquivo.
+        """
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("BEGIN IMMEDIATE")
+                cursor = await db.execute(
+                    """INSERT INTO promo_states
+                       (session_id, promo_id, state_data, created_at, updated_at, status, version)
+                       SELECT session_id, promo_id, state_data, created_at, updated_at, status, 1
+                       FROM promo_states_archive WHERE session_id = ?
+                       ON CONFLICT (session_id) DO NOTHING""",
+                    (session_id,)
+                )
+                restored = cursor.rowcount == 1
+                if restored:
+                    await db.execute("DELETE FROM promo_states_archive WHERE session_id = ?", (session_id,))
+                else:
+                    # Sessão recriada enquanto arquivada: o estado atual vence e a cópia
+                    # arquivada é mantida (nada é descartado sem ter sido restaurado)
+                    cursor = await db.execute(
+                        "SELECT 1 FROM promo_states_archive WHERE session_id = ?", (session_id,)
+                    )
+                    if await cursor.fetchone():
+                        logger.warning(f"⚠️ Estado arquivado de {session_id} não restaurado: sessão já tem estado atual")
+                await db.commit()
+                return restored
+        except Exception as e:
+            logger.error(f"Erro ao restaurar promo_state arquivado: {e}")
+            return False
+    
+    async def get_archived_count(self) -> int:
+        """Total de estados no arquivo frio"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                cursor = await db.execute("SELECT COUNT(*) FROM promo_states_archive")
+                return (await cursor.fetchone())[0]
+        except Exception as e:
+            logger.warning(f"Erro ao contar promo_states arquivados: {e}")
+            return 0
+    
     # ========== MÉTODOS PARA PROMOTIONS ==========
     
     async def save_promotion(self, state_dict: Dict) -> bool:
-        """Salva uma promoção finalizada"""
+        """
+        Salva uma promoção finalizada (idempotente: promo_id já gravado é mantido)
+        
+        Se o promo_id já pertence a outra sessão nada é gravado e retorna False.
+        """
+        promo_id = state_dict.get('promo_id')
         try:
             async with aiosqlite.connect(self.db_path) as db:
-                await db.execute(
-                    """INSERT INTO promotions 
-                       (promo_id, session_id, titulo, mecanica, descricao, segmentacao,
-                        periodo_inicio, periodo_fim, condicoes, recompensas, produtos,
-                        categorias, volume_minimo, desconto_percentual, status, created_at)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-                    (
-                        state_dict.get('promo_id'),
-                        state_dict.get('session_id'),
-                        state_dict.get('titulo'),
-                        state_dict.get('mecanica'),
-                        state_dict.get('descricao'),
-                        state_dict.get('segmentacao'),
-                        state_dict.get('periodo_inicio'),
-                        state_dict.get('periodo_fim'),
-                        state_dict.get('condicoes'),
-                        state_dict.get('recompensas'),
-                        json.dumps(state_dict.get('produtos', [])),
-                        json.dumps(state_dict.get('categorias', [])),
-                        state_dict.get('volume_minimo'),
-                        state_dict.get('desconto_percentual'),
-                        state_dict.get('status', 'sent'),
-                        state_dict.get('created_at', datetime.utcnow().isoformat())
-                    )
-                )
+                cursor = await db.execute(PROMOTION_INSERT_SQL, self._promotion_params(state_dict))
+                if cursor.rowcount == 0:
+                    owners = await self._promotion_owners(db, [promo_id])
+                    if owners.get(promo_id) != state_dict.get('session_id'):
+                        logger.error(f"Promoção não salva, {PROMOTION_CONFLICT_ERROR}: {promo_id}")
+                        return False
                 await db.commit()
             return True
         except Exception as e:
             logger.error(f"Erro ao salvar promotion: {e}")
             return False
     
+    async def save_promotions(self, promotions: List[Dict]) -> List[Dict]:
+        """
+        Salva várias promoções finalizadas em uma única transação (executemany)
+        
+        Tudo ou nada: em erro nenhuma é gravada. Idempotente como save_promotion;
+        promo_id já gravado por outra sessão sai como "failed".
+        
+        Returns:
+            List[Dict]: Um resultado por promoção, na ordem recebida:
+            {"promo_id", "status": "inserted" | "exists" | "failed"}
+        """
+        results = [{"promo_id": promo.get('promo_id'), "status": "inserted"} for promo in promotions]
+        pending = {}
+        for result, promo in zip(results, promotions):
+            if not result["promo_id"]:
+                result.update(status="failed", error="promo_id ausente")
+            elif result["promo_id"] not in pending:
+                pending[result["promo_id"]] = (result, promo)
+            elif pending[result["promo_id"]][1].get('session_id') == promo.get('session_id'):
+                result["status"] = "exists"
+            else:
+                result.update(status="failed", error=PROMOTION_CONFLICT_ERROR)
+        if not pending:
+            return results
+        
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("BEGIN IMMEDIATE")
+                try:
+                    owners = await self._promotion_owners(db, list(pending))
+                    for promo_id, owner in owners.items():
+                        result, promo = pending.pop(promo_id)
+                        if owner == promo.get('session_id'):
+                            result["status"] = "exists"
+                        else:
+                            result.update(status="failed", error=PROMOTION_CONFLICT_ERROR)
+                    await db.executemany(
+                        PROMOTION_INSERT_SQL, [self._promotion_params(promo) for _, promo in pending.values()]
+                    )
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            return results
+        except Exception as e:
+            logger.error(f"Erro ao salvar promotions em lote: {e}")
+            for result, _ in pending.values():
+                result.update(status="failed", error=str(e))
+            return results
+    
+    @staticmethod
+    async def _promotion_owners(db, promo_ids: List[str]) -> Dict[str, Optional[str]]:
+        """session_id das promoções já gravadas, por promo_id (consulta em blocos de PROMOTION_LOOKUP_CHUNK)"""
+        owners = {}
+        for start in range(0, len(promo_ids), PROMOTION_LOOKUP_CHUNK):
+            chunk = promo_ids[start:start + PROMOTION_LOOKUP_CHUNK]
+            cursor = await db.execute(
+                f"SELECT promo_id, session_id FROM promotions WHERE promo_id IN ({', '.join('?' for _ in chunk)})",
+                chunk
+            )
+            owners.update(await cursor.fetchall())
+        return owners
+    
     async def get_promotions(self, limit: int = 50) -> List[Dict]:
         """Lista promoções finalizadas"""
         try:
@@ -252,17 +831,43 @@ class LocalDatabase:
                     (limit,)
                 )
                 rows = await cursor.fetchall()
-                promotions = []
-                for row in rows:
-                    promo = dict(row)
-                    promo['produtos'] = json.loads(promo['produtos']) if promo['produtos'] else []
-                    promo['categorias'] = json.loads(promo['categorias']) if promo['categorias'] else []
-                    promotions.append(promo)
-                return promotions
+                return [self._row_to_promotion(row) for row in rows]
         except Exception as e:
             logger.error(f"Erro ao listar promotions: {e}")
             return []
     
+    async def get_promotions_page(self, page_size: int = 20, cursor: Optional[str] = None) -> Dict:
+        """
+        Lista promoções finalizadas (mais recentes primeiro) uma página por vez
+        
+        Args:
+            page_size: Promoções por página
+            cursor: next_cursor da página anterior (None para a primeira)
+        
+        Returns:
+            Dict: {"promotions": [colunas de resumo], "next_cursor": str ou None}
+        """
+        try:
+            where, params = "", []
+            if cursor:
+                created_at, last_id = json.loads(cursor)
+                where, params = "WHERE (created_at, id) < (?, ?)", [created_at, last_id]
+            
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                cursor_db = await db.execute(PROMOTION_PAGE_SQL.format(where=where), (*params, page_size + 1))
+                rows = await cursor_db.fetchall()
+            
+            page = rows[:page_size]
+            next_cursor = json.dumps([page[-1]['created_at'], page[-1]['id']]) if len(rows) > page_size else None
+            return {
+                "promotions": [{field: row[field] for field in PROMOTION_SUMMARY_FIELDS} for row in page],
+                "next_cursor": next_cursor
+            }
+        except Exception as e:
+            logger.error(f"Erro ao paginar promotions: {e}")
+            return {"promotions": [], "next_cursor": None}
+    
     async def get_promotion_by_id(self, promo_id: str) -> Optional[Dict]:
         """Busca uma promoção por ID"""
         try:
@@ -274,11 +879,365 @@ class LocalDatabase:
                 )
                 row = await cursor.fetchone()
                 if row:
-                    promo = dict(row)
-                    promo['produtos'] = json.loads(promo['produtos']) if promo['produtos'] else []
-                    promo['categorias'] = json.loads(promo['categorias']) if promo['categorias'] else []
-                    return promo
+                    return self._row_to_promotion(row)
                 return None
         except Exception as e:
             logger.error(f"Erro ao buscar promotion: {e}")
             return None
+    
+    # ========== UNIT OF WORK ==========
+    
+    async def apply_unit_of_work(
+        self,
+        states: List[Tuple[Dict, int, Optional[List[str]]]],
+        deleted: List[str],
+        messages: List[tuple],
+        promotions: List[Dict]
+    ) -> Optional[Dict]:
+        """
+        Aplica todas as escritas de um turno em uma única transação
+        
+        Args:
+            states: Trios (to_dict, versão esperada, campos alterados) a gravar com compare-and-swap
+            deleted: session_ids cujos estados devem ser removidos
+            messages: Tuplas (session_id, user_message, ai_response)
+            promotions: Promoções finalizadas (reenvio do mesmo promo_id pela mesma sessão é ignorado)
+        
+        Returns:
+            Optional[Dict]: {"versions": {session_id: nova versão}, "conflicts": [session_id],
+            "promotion_conflicts": [promo_id já usado por outra sessão], "seqs": [seq de cada
+            mensagem]}. Havendo qualquer conflito nada é gravado. None em erro.
+        """
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("BEGIN IMMEDIATE")
+                try:
+                    if deleted:
+                        await self._delete_promo_states(db, deleted)
+                    versions, conflicts = {}, []
+                    for state_dict, expected_version, changed_fields in states:
+                        session_id = state_dict['session_id']
+                        new_version = await self._compare_and_swap(
+                            db, session_id, state_dict, expected_version, changed_fields
+                        )
+                        if new_version:
+                            versions[session_id] = new_version
+                        else:
+                            conflicts.append(session_id)
+                    if conflicts:
+                        await db.rollback()
+                        return {"versions": {}, "conflicts": conflicts, "promotion_conflicts": []}
+                    
+                    seqs = [
+                        await self._insert_message(db, session_id, user_message, ai_response)
+                        for session_id, user_message, ai_response in messages
+                    ]
+                    if promotions:
+                        cursor = await db.executemany(
+                            PROMOTION_INSERT_SQL, [self._promotion_params(promotion) for promotion in promotions]
+                        )
+                        if cursor.rowcount < len(promotions):
+                            # Alguma foi ignorada: reenvio da mesma sessão ou promo_id de outra sessão
+                            owners = await self._promotion_owners(db, [p.get('promo_id') for p in promotions])
+                            promotion_conflicts = [
+                                p.get('promo_id') for p in promotions if owners.get(p.get('promo_id')) != p.get('session_id')
+                            ]
+                            if promotion_conflicts:
+                                await db.rollback()
+                                return {"versions": {}, "conflicts": [], "promotion_conflicts": promotion_conflicts}
+                    await db.commit()
+                except Exception:
+                    await db.rollback()
+                    raise
+            return {"versions": versions, "conflicts": [], "promotion_conflicts": [], "seqs": seqs}
+        except Exception as e:
+            logger.error(f"Erro ao aplicar unit of work: {e}")
+            return None
+    
+    # ========== EXPORTAÇÃO / IMPORTAÇÃO EM MASSA ==========
+    
+    async def iter_promotions(self, batch_size: int = 500) -> AsyncIterator[Dict]:
+        """
+        Percorre todas as promoções em ordem de id, em memória constante
+        
+        Lê em lotes por keyset (id > último id) em vez de um cursor aberto durante
+        toda a exportação, assim cada lote é uma leitura curta e os writers não
+        ficam bloqueados enquanto o cliente consome o stream.
+        
+        Args:
+            batch_size: Linhas lidas por consulta
+        """
+        last_id = 0
+        async with aiosqlite.connect(self.db_path) as db:
+            db.row_factory = aiosqlite.Row
+            while True:
+                async with db.execute(
+                    "SELECT * FROM promotions WHERE id > ? ORDER BY id LIMIT ?",
+                    (last_id, batch_size)
+                ) as cursor:
+                    rows = await cursor.fetchall()
+                if not rows:
+                    return
+                for row in rows:
+                    yield self._row_to_promotion(row)
+                last_id = rows[-1]['id']
+    
+    async def import_promotions(self, promotions: AsyncIterable[Dict], batch_size: int = 500) -> Dict:
+        """
+        Importa promoções em lotes, idempotente por promo_id
+        
+        Promoções cujo promo_id já existe são ignoradas, então reimportar o mesmo
+        arquivo (ou retomar uma importação interrompida) não duplica dados.
+        promo_id já gravado por outra sessão também não é gravado, mas conta como
+        conflito. Cada lote é gravado em uma transação própria.
+        
+        Args:
+            promotions: Iterável assíncrono de dicts (ex: linhas de um NDJSON)
+            batch_size: Promoções por transação
+            
+        Returns:
+            Dict com contagens 'received', 'inserted', 'skipped' e 'conflicts'
+        """
+        stats = {"received": 0, "inserted": 0, "skipped": 0, "conflicts": 0}
+        
+        async with aiosqlite.connect(self.db_path) as db:
+            async def flush(batch: List[tuple]):
+                cursor = await db.executemany(PROMOTION_INSERT_SQL, batch)
+                # rowcount soma só as linhas inseridas (ignoradas e triggers não contam)
+                inserted = cursor.rowcount
+                conflicts = []
+                if inserted < len(batch):
+                    # params[0] é promo_id e params[1] session_id (ordem de PROMOTION_COLUMNS)
+                    owners = await self._promotion_owners(db, [params[0] for params in batch])
+                    conflicts = [params[0] for params in batch if owners.get(params[0]) != params[1]]
+                    if conflicts:
+                        logger.warning(f"Importação: {len(conflicts)} promo_id(s) já usados por outra sessão: {conflicts[:5]}")
+                await db.commit()
+                stats["inserted"] += inserted
+                stats["conflicts"] += len(conflicts)
+                stats["skipped"] += len(batch) - inserted - len(conflicts)
+            
+            batch = []
+            async for promo in promotions:
+                stats["received"] += 1
+                if not promo.get('promo_id'):
+                    stats["skipped"] += 1
+                    continue
+                batch.append(self._promotion_params(promo))
+                if len(batch) >= batch_size:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+        
+        logger.info(f"Importação de promotions concluída: {stats}")
+        return stats
+    
+    # ========== RETENÇÃO E COMPACTAÇÃO ==========
+    
+    async def purge_expired_rows(
+        self,
+        table: str,
+        cutoff: str,
+        batch_size: int = 500,
+        completed_sessions_only: bool = False
+    ) -> int:
+        """
+        Apaga linhas mais antigas que o corte, em lotes pequenos
+        
+        Cada lote é uma transação curta, e o event loop é liberado entre lotes,
+        para não segurar o lock de escrita enquanto o expurgo avança.
+        
+        Args:
+            table: Tabela em RETENTION_TABLES
+            cutoff: Timestamp ISO; linhas com timestamp anterior são apagadas
+            batch_size: Linhas apagadas por transação
+            completed_sessions_only: Restringe a sessões cujo promo_state está 'completed'
+                (apenas para messages)
+            
+        Returns:
+            int: Total de linhas apagadas
+        """
+        if table not in RETENTION_TABLES:
+            raise ValueError(f"Tabela sem política de retenção: {table}")
+        
+        timestamp_column, key = RETENTION_TABLES[table]
+        where = f"{timestamp_column} < ?"
+        if completed_sessions_only:
+            where += " AND session_id IN (SELECT session_id FROM promo_states WHERE status = 'completed')"
+        
+        deleted = 0
+        async with aiosqlite.connect(self.db_path) as db:
+            while True:
+                cursor = await db.execute(
+                    f"DELETE FROM {table} WHERE ({key}) IN (SELECT {key} FROM {table} WHERE {where} LIMIT ?)",
+                    (cutoff, batch_size)
+                )
+                await db.commit()
+                deleted += cursor.rowcount
+                if cursor.rowcount < batch_size:
+                    break
+                await asyncio.sleep(0)
+        return deleted
+    
+    async def compact(self, max_pages: int = 0) -> Dict:
+        """
+        Devolve ao sistema de arquivos as páginas livres (PRAGMA incremental_vacuum)
+        
+        Args:
+            max_pages: Máximo de páginas liberadas nesta chamada (0 = todas)
+            
+        Returns:
+            Dict com modo de auto_vacuum, páginas livres antes/depois e bytes recuperados
+        """
+        size_before = self._file_size()
+        async with aiosqlite.connect(self.db_path) as db:
+            mode = (await (await db.execute("PRAGMA auto_vacuum")).fetchone())[0]
+            free_before = (await (await db.execute("PRAGMA freelist_count")).fetchone())[0]
+            
+            if mode == 2:
+                # O pragma libera uma página por passo; execute() dá um único passo,
+                # executescript() roda o statement até o fim
+                await db.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+            elif free_before:
+                logger.warning(
+                    f"⚠️ {free_before} páginas livres não recuperáveis: auto_vacuum desativado neste banco "
+                    "(execute enable_incremental_vacuum com o app parado)"
+                )
+            
+            free_after = (await (await db.execute("PRAGMA freelist_count")).fetchone())[0]
+        
+        size_after = self._file_size()
+        return {
+            "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(mode, str(mode)),
+            "free_pages_before": free_before,
+            "free_pages_after": free_after,
+            "reclaimed_bytes": max(size_before - size_after, 0),
+            "db_size_bytes": size_after
+        }
+    
+    async def enable_incremental_vacuum(self) -> bool:
+        """Converte um banco existente para auto_vacuum=INCREMENTAL (VACUUM completo, bloqueante)"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                await db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await db.execute("VACUUM")
+            logger.info("✅ auto_vacuum incremental habilitado")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao habilitar auto_vacuum incremental: {e}")
+            return False
+    
+    def _file_size(self) -> int:
+        try:
+            return os.path.getsize(self.db_path)
+        except OSError:
+            return 0
+    
+    # ========== BUSCA TEXTUAL (FTS5) ==========
+    
+    async def search_promotions(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """
+        Busca promoções finalizadas por texto, ordenadas por relevância (bm25)
+        
+        Args:
+            query: Texto livre digitado pelo usuário
+            limit: Tamanho da página
+            offset: Deslocamento da página
+            
+        Returns:
+            Dict com 'results' (promoções com 'score', 'titulo_highlight' e 'snippet') e 'total'
+        """
+        match = self._build_fts_query(query)
+        if not self.fts_enabled or not match:
+            return {"results": [], "total": 0}
+        
+        weights = ", ".join(str(w) for w in PROMOTION_SEARCH_WEIGHTS)
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute(
+                    "SELECT COUNT(*) FROM promotions_fts WHERE promotions_fts MATCH ?",
+                    (match,)
+                )
+                total = (await cursor.fetchone())[0]
+                
+                cursor = await db.execute(
+                    f"""SELECT p.*,
+                              bm25(promotions_fts, {weights}) AS score,
+                              highlight(promotions_fts, 0, '<mark>', '</mark>') AS titulo_highlight,
+                              snippet(promotions_fts, -1, '<mark>', '</mark>', '…', 16) AS snippet
+                       FROM promotions_fts
+                       JOIN promotions p ON p.id = promotions_fts.rowid
+                       WHERE promotions_fts MATCH ?
+                       ORDER BY score
+                       LIMIT ? OFFSET ?""",
+                    (match, limit, offset)
+                )
+                rows = await cursor.fetchall()
+                return {
+                    "results": [self._row_to_promotion(row) for row in rows],
+                    "total": total
+                }
+        except Exception as e:
+            logger.error(f"Erro ao buscar promotions por texto: {e}")
+            return {"results": [], "total": 0}
+    
+    async def rebuild_search_index(self) -> bool:
+        """Reconstrói o índice FTS5 a partir da tabela promotions"""
+        try:
+            async with aiosqlite.connect(self.db_path) as db:
+                if not await self._create_search_index(db):
+                    return False
+                await db.execute("INSERT INTO promotions_fts (promotions_fts) VALUES ('rebuild')")
+                await db.execute("INSERT INTO promotions_fts (promotions_fts) VALUES ('optimize')")
+                await db.commit()
+            self.fts_enabled = True
+            logger.info("🔎 Índice de busca de promoções reconstruído")
+            return True
+        except Exception as e:
+            logger.error(f"Erro ao reconstruir índice de busca: {e}")
+            return False
+    
+    # ========== HELPERS ==========
+    
+    @staticmethod
+    def _build_fts_query(text: str) -> str:
+        """
+        Converte texto livre em uma expressão MATCH segura
+        Cada palavra vira um termo entre aspas com prefixo (AND implícito),
+        assim operadores e pontuação digitados pelo usuário não quebram a query
+        """
+        terms = [term.replace('"', '') for term in (text or '').split()]
+        return " ".join(f'"{term}"*' for term in terms if term)
+    
+    @staticmethod
+    def _promotion_params(state_dict: Dict) -> tuple:
+        """Monta os parâmetros de INSERT em promotions na ordem de PROMOTION_COLUMNS"""
+        return (
+            state_dict.get('promo_id'),
+            state_dict.get('session_id'),
+            state_dict.get('titulo'),
+            state_dict.get('mecanica'),
+            state_dict.get('descricao'),
+            state_dict.get('segmentacao'),
+            state_dict.get('periodo_inicio'),
+            state_dict.get('periodo_fim'),
+            state_dict.get('condicoes'),
+            state_dict.get('recompensas'),
+            json.dumps(state_dict.get('produtos', [])),
+            json.dumps(state_dict.get('categorias', [])),
+            state_dict.get('volume_minimo'),
+            state_dict.get('desconto_percentual'),
+            state_dict.get('status', 'sent'),
+            state_dict.get('created_at', datetime.utcnow().isoformat()),
+            state_dict.get('sent_at')
+        )
+    
+    @staticmethod
+    def _row_to_promotion(row) -> Dict:
+        """Converte uma linha de promotions em dict, decodificando as listas JSON"""
+        promo = dict(row)
+        promo['produtos'] = json.loads(promo['produtos']) if promo['produtos'] else []
+        promo['categorias'] = json.loads(promo['categorias']) if promo['categorias'] else []
+        return promo
@@ -0,0 +1,131 @@
+"""
+Retention - Expurgo periódico de messages/system_logs e compactação do SQLite
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from src.core.config import (
+    RETENTION_INTERVAL_SECONDS, RETENTION_BATCH_SIZE, RETENTION_MESSAGES_DAYS,
+    RETENTION_MESSAGES_COMPLETED_HOURS, RETENTION_SYSTEM_LOGS_DAYS, RETENTION_VACUUM_PAGES
+)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RetentionPolicy:
+    """Regra de retenção de uma tabela"""
+
+    table: str
+    max_age: Optional[timedelta] = None  # Apaga qualquer linha mais antiga que isso
+    completed_max_age: Optional[timedelta] = None  # Idem, mas só para sessões concluídas
+
+    def rules(self) -> List[tuple]:
+        """Retorna (idade máxima, somente sessões concluídas) para cada regra ativa"""
+        rules = []
+        if self.max_age:
+            rules.append((self.max_age, False))
+        if self.completed_max_age:
+            rules.append((self.completed_max_age, True))
+        return rules
+
+
+def default_policies() -> List[RetentionPolicy]:
+    """Políticas configuradas via variáveis de ambiente"""
+    return [
+        RetentionPolicy(
+            table='messages',
+            max_age=timedelta(days=RETENTION_MESSAGES_DAYS) if RETENTION_MESSAGES_DAYS else None,
+            completed_max_age=(
+                timedelta(hours=RETENTION_MESSAGES_COMPLETED_HOURS) if RETENTION_MESSAGES_COMPLETED_HOURS else None
+            )
+        ),
+        RetentionPolicy(
+            table='system_logs',
+            max_age=timedelta(days=RETENTION_SYSTEM_LOGS_DAYS) if RETENTION_SYSTEM_LOGS_DAYS else None
+        ),
+    ]
+
+
+class RetentionWorker:
+    """Executa as políticas de retenção em background e compacta o banco"""
+
+    def __init__(
+        self,
+        database,
+        policies: Optional[List[RetentionPolicy]] = None,
+        interval_seconds: int = RETENTION_INTERVAL_SECONDS,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        vacuum_pages: int = RETENTION_VACUUM_PAGES
+    ):
+        self.database = database
+        self.policies = policies if policies is not None else default_policies()
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.last_report: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Dict:
+        """Aplica todas as políticas uma vez e compacta o banco"""
+        started = datetime.utcnow()
+        deleted: Dict[str, int] = {}
+
+        for policy in self.policies:
+            for max_age, completed_only in policy.rules():
+                cutoff = (started - max_age).isoformat()
+                count = await self.database.purge_expired_rows(
+                    policy.table,
+                    cutoff,
+                    batch_size=self.batch_size,
+                    completed_sessions_only=completed_only
+                )
+                deleted[policy.table] = deleted.get(policy.table, 0) + count
+
+        compaction = await self.database.compact(self.vacuum_pages)
+
+        self.last_report = {
+            "ran_at": started.isoformat(),
+            "duration_ms": round((datetime.utcnow() - started).total_seconds() * 1000, 1),
+            "deleted": deleted,
+            **compaction
+        }
+        logger.info(
+            f"🧹 Retenção: apagadas {deleted}, recuperados {compaction['reclaimed_bytes']} bytes "
+            f"(banco com {compaction['db_size_bytes']} bytes)"
+        )
+        return self.last_report
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Erro na rotina de retenção: {e}", exc_info=True)
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Agenda a execução periódica no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"🧹 RetentionWorker iniciado (intervalo {self.interval_seconds}s)")
+
+    async def stop(self):
+        """Cancela a execução periódica"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "interval_seconds": self.interval_seconds,
+            "last_report": self.last_report
+        }
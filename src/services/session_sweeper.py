@@ -0,0 +1,101 @@
+"""
+Session Sweeper - Tira da memória sessões ociosas e arquiva rascunhos abandonados
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from src.core.config import (
+    SESSION_SWEEP_INTERVAL_SECONDS, SESSION_IDLE_SECONDS, SESSION_ARCHIVE_AFTER_DAYS, RETENTION_BATCH_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+
+class SessionSweeper:
+    """
+    Varredura periódica das sessões
+
+    - Memória: sessões sem acesso há idle_seconds são gravadas (se há algo pendente)
+      e saem do cache do MemoryManager; a próxima mensagem recarrega do database.
+    - Database: rascunhos sem atualização há archive_after_days vão para o arquivo frio
+      (promo_states_archive) e voltam sozinhos se a conversa for retomada.
+    """
+
+    def __init__(
+        self,
+        memory_manager,
+        database,
+        is_busy: Optional[Callable[[str], bool]] = None,
+        idle_seconds: int = SESSION_IDLE_SECONDS,
+        archive_after_days: int = SESSION_ARCHIVE_AFTER_DAYS,
+        interval_seconds: int = SESSION_SWEEP_INTERVAL_SECONDS,
+        batch_size: int = RETENTION_BATCH_SIZE
+    ):
+        self.memory_manager = memory_manager
+        self.database = database
+        self.is_busy = is_busy
+        self.idle_seconds = idle_seconds
+        self.archive_after_days = archive_after_days
+        self.interval_seconds = interval_seconds
+        self.batch_size = batch_size
+        self.last_report: Optional[Dict] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> Dict:
+        """Executa uma varredura completa"""
+        started = datetime.utcnow()
+        memory = await self.memory_manager.sweep_idle(self.idle_seconds, self.is_busy)
+
+        archived = 0
+        archive = getattr(self.database, 'archive_idle_promo_states', None)
+        if self.archive_after_days and archive is not None:
+            cutoff = (started - timedelta(days=self.archive_after_days)).isoformat()
+            archived = await archive(cutoff, batch_size=self.batch_size)
+
+        self.last_report = {
+            "ran_at": started.isoformat(),
+            "duration_ms": round((datetime.utcnow() - started).total_seconds() * 1000, 1),
+            **memory,
+            "archived": archived
+        }
+        if memory["evicted"] or archived or memory["failed"]:
+            logger.info(
+                f"🧊 Sessões ociosas: {memory['evicted']} fora da memória ({memory['flushed']} gravadas, "
+                f"{memory['failed']} com erro), {archived} arquivadas"
+            )
+        return self.last_report
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Erro na varredura de sessões ociosas: {e}", exc_info=True)
+
+    def start(self):
+        """Agenda a varredura periódica no event loop atual"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"🧊 SessionSweeper iniciado (ociosidade {self.idle_seconds}s, intervalo {self.interval_seconds}s)")
+
+    async def stop(self):
+        """Cancela a varredura periódica"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def get_stats(self) -> Dict:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "idle_seconds": self.idle_seconds,
+            "archive_after_days": self.archive_after_days,
+            "interval_seconds": self.interval_seconds,
+            "last_report": self.last_report
+        }
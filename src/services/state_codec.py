@@ -0,0 +1,132 @@
+"""
+State Codec - Serialização binária dos blobs de promo_states.state_data
+
+Formato gravado: 1 byte de cabeçalho + payload
+    bits 0-6: formato do payload (FORMAT_JSON, FORMAT_MSGPACK)
+    bit 7:    payload comprimido com zlib (FLAG_COMPRESSED)
+
+Linhas antigas (TEXT com JSON puro, começando por '{') continuam legíveis:
+o byte '{' (0x7B) nunca é usado como cabeçalho.
+"""
+import json
+import logging
+import zlib
+from typing import Callable, Dict, Optional, Tuple, Union
+
+from src.core.config import STATE_CODEC, STATE_COMPRESS_THRESHOLD, STATE_COMPRESS_LEVEL
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+FLAG_COMPRESSED = 0x80
+_LEGACY_JSON_PREFIX = ord('{')
+
+
+def _json_dumps(data: Dict) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(payload: bytes) -> Dict:
+    if ORJSON_AVAILABLE:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _orjson_dumps(data: Dict) -> bytes:
+    return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+
+
+def _msgpack_dumps(data: Dict) -> bytes:
+    return msgpack.packb(data, use_bin_type=True)
+
+
+def _msgpack_loads(payload: bytes) -> Dict:
+    return msgpack.unpackb(payload, raw=False)
+
+
+# Codecs de escrita: nome -> (formato do cabeçalho, serializador)
+ENCODERS: Dict[str, Tuple[int, Callable[[Dict], bytes]]] = {
+    'json': (FORMAT_JSON, _json_dumps),
+}
+if ORJSON_AVAILABLE:
+    ENCODERS['orjson'] = (FORMAT_JSON, _orjson_dumps)
+if MSGPACK_AVAILABLE:
+    ENCODERS['msgpack'] = (FORMAT_MSGPACK, _msgpack_dumps)
+
+# Leitura é por formato: JSON gravado por json ou orjson é o mesmo payload
+DECODERS: Dict[int, Callable[[bytes], Dict]] = {
+    FORMAT_JSON: _json_loads,
+}
+if MSGPACK_AVAILABLE:
+    DECODERS[FORMAT_MSGPACK] = _msgpack_loads
+
+
+class StateCodec:
+    """Codifica/decodifica estados de promoção para armazenamento em BLOB"""
+
+    def __init__(
+        self,
+        name: str = STATE_CODEC,
+        compress_threshold: Optional[int] = STATE_COMPRESS_THRESHOLD,
+        compress_level: int = STATE_COMPRESS_LEVEL
+    ):
+        """
+        Args:
+            name: Codec de escrita ('json', 'orjson' ou 'msgpack')
+            compress_threshold: Tamanho em bytes a partir do qual o payload é comprimido
+                (None ou 0 desativa a compressão)
+            compress_level: Nível do zlib (1-9)
+        """
+        if name not in ENCODERS:
+            logger.warning(f"⚠️ Codec de estado '{name}' indisponível, usando 'json'")
+            name = 'json'
+        self.name = name
+        self.format, self._dumps = ENCODERS[name]
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def encode(self, data: Dict) -> bytes:
+        """Serializa o estado em bytes com cabeçalho de formato"""
+        payload = self._dumps(data)
+        header = self.format
+        if self.compress_threshold and len(payload) >= self.compress_threshold:
+            payload = zlib.compress(payload, self.compress_level)
+            header |= FLAG_COMPRESSED
+        return bytes((header,)) + payload
+
+    def decode(self, blob: Union[bytes, str]) -> Dict:
+        """Desserializa um blob gravado por encode() ou uma linha JSON legada"""
+        if isinstance(blob, str):
+            return json.loads(blob)
+        if not blob:
+            raise ValueError("Blob de estado vazio")
+
+        header = blob[0]
+        if header == _LEGACY_JSON_PREFIX:
+            return _json_loads(blob)
+
+        decoder = DECODERS.get(header & ~FLAG_COMPRESSED)
+        if decoder is None:
+            raise ValueError(f"Formato de estado desconhecido: 0x{header:02x}")
+
+        payload = blob[1:]
+        if header & FLAG_COMPRESSED:
+            payload = zlib.decompress(payload)
+        return decoder(payload)
+
+
+# Instância padrão, configurada via variáveis de ambiente
+state_codec = StateCodec()
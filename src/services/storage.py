@@ -0,0 +1,187 @@
+"""
+Storage - Contrato assíncrono comum aos backends de persistência
+(LocalDatabase, CosmosDBAdapter) e implementação de referência em memória
+"""
+import copy
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Protocol, runtime_checkable
+
+logger = logging.getLogger(__name__)
+
+# Colunas da listagem paginada de promoções (o suficiente para o histórico)
+PROMOTION_SUMMARY_FIELDS = (
+    'promo_id', 'session_id', 'titulo', 'mecanica', 'segmentacao',
+    'periodo_inicio', 'periodo_fim', 'status', 'created_at', 'sent_at'
+)
+
+
+@runtime_checkable
+class StorageBackend(Protocol):
+    """
+    Métodos que todo backend expõe, com a mesma semântica em todos eles
+
+    - save_message: grava um turno (user + assistant); retorna valor verdadeiro em sucesso
+      (o seq do turno quando o backend numera mensagens) e None/False em erro
+    - get_recent_messages: mensagens dos últimos `limit` turnos em ordem cronológica,
+      como dicts {"role", "content"} (assistant também traz "timestamp")
+    - get_promo_state / list_all_promo_states: devolvem o dict salvo; None se não existe
+    - delete_promo_state: remover algo que não existe também é sucesso
+    - save_promotion: idempotente por promo_id - gravar o mesmo promo_id de novo é
+      sucesso e não altera a promoção já gravada; se o promo_id já pertence a outra
+      sessão (session_id diferente) nada é gravado e retorna False
+    - save_promotions: o mesmo em lote; um resultado por item, na ordem recebida,
+      {"promo_id", "status": "inserted" | "exists" | "failed"} (conflito de sessão
+      é "failed"). No LocalDatabase o lote
+      é atômico; no Cosmos a atomicidade vale por partição (transactional batch)
+    - get_promotions: mais recentes primeiro (created_at)
+    - get_promotions_page: a mesma ordem, paginada e só com PROMOTION_SUMMARY_FIELDS;
+      retorna {"promotions", "next_cursor"}. O cursor é opaco (cada backend tem o seu)
+      e None na última página
+
+    Capacidades opcionais (detectadas com hasattr pelo MemoryManager):
+    update_promo_state_fields, compare_and_swap_promo_state, apply_unit_of_work, data_version.
+    """
+
+    async def initialize(self) -> Optional[bool]: ...
+
+    async def save_message(self, session_id: str, user_message: str, ai_response: str): ...
+
+    async def get_recent_messages(self, session_id: str, limit: int = 20) -> List[Dict]: ...
+
+    async def get_message_count(self) -> int: ...
+
+    async def save_promo_state(self, session_id: str, state_dict: Dict) -> bool: ...
+
+    async def get_promo_state(self, session_id: str) -> Optional[Dict]: ...
+
+    async def delete_promo_state(self, session_id: str) -> bool: ...
+
+    async def list_all_promo_states(self) -> List[Dict]: ...
+
+    async def save_promotion(self, state_dict: Dict) -> bool: ...
+
+    async def save_promotions(self, promotions: List[Dict]) -> List[Dict]: ...
+
+    async def get_promotions(self, limit: int = 50) -> List[Dict]: ...
+
+    async def get_promotions_page(self, page_size: int = 20, cursor: Optional[str] = None) -> Dict: ...
+
+    async def get_promotion_by_id(self, promo_id: str) -> Optional[Dict]: ...
+
+
+class InMemoryStorage:
+    """
+    Backend de referência em memória (testes, benchmarks e desenvolvimento sem banco)
+
+    Guarda cópias dos dicts recebidos, então alterar o objeto depois de salvar
+    não altera o que está "gravado" - igual a um banco de verdade.
+    """
+
+    def __init__(self):
+        self._messages: Dict[str, List[Dict]] = {}
+        self._promo_states: Dict[str, Dict] = {}
+        self._promotions: Dict[str, Dict] = {}
+        self._lock = asyncio.Lock()
+
+    async def initialize(self) -> bool:
+        logger.info("✅ InMemoryStorage pronto para uso")
+        return True
+
+    # ========== MESSAGES ==========
+
+    async def save_message(self, session_id: str, user_message: str, ai_response: str) -> int:
+        async with self._lock:
+            rows = self._messages.setdefault(session_id, [])
+            seq = len(rows) + 1
+            rows.append({
+                "seq": seq,
+                "user_message": user_message,
+                "ai_response": ai_response,
+                "timestamp": datetime.utcnow().isoformat()
+            })
+            return seq
+
+    async def get_recent_messages(self, session_id: str, limit: int = 20) -> List[Dict]:
+        messages = []
+        for row in self._messages.get(session_id, [])[-limit:] if limit else []:
+            if row['user_message']:
+                messages.append({"role": "user", "content": str(row['user_message']), "seq": row['seq']})
+            if row['ai_response']:
+                messages.append({
+                    "role": "assistant", "content": str(row['ai_response']),
+                    "timestamp": row['timestamp'], "seq": row['seq']
+                })
+        return messages
+
+    async def get_message_count(self) -> int:
+        return sum(len(rows) for rows in self._messages.values())
+
+    # ========== PROMO STATES ==========
+
+    async def save_promo_state(self, session_id: str, state_dict: Dict) -> bool:
+        self._promo_states[session_id] = copy.deepcopy(state_dict)
+        return True
+
+    async def get_promo_state(self, session_id: str) -> Optional[Dict]:
+        state = self._promo_states.get(session_id)
+        return copy.deepcopy(state) if state is not None else None
+
+    async def delete_promo_state(self, session_id: str) -> bool:
+        self._promo_states.pop(session_id, None)
+        return True
+
+    async def list_all_promo_states(self) -> List[Dict]:
+        states = sorted(self._promo_states.values(), key=lambda s: s.get('updated_at') or '', reverse=True)
+        return [copy.deepcopy(state) for state in states]
+
+    # ========== PROMOTIONS ==========
+
+    async def save_promotion(self, state_dict: Dict) -> bool:
+        promo_id = state_dict.get('promo_id')
+        if promo_id in self._promotions:
+            if self._promotions[promo_id].get('session_id') != state_dict.get('session_id'):
+                logger.error(f"Promoção não salva, promo_id já usado por outra sessão: {promo_id}")
+                return False
+            logger.debug(f"Promoção já existe, nada a gravar: {promo_id}")
+            return True
+        self._promotions[promo_id] = {
+            **copy.deepcopy(state_dict),
+            "created_at": state_dict.get('created_at', datetime.utcnow().isoformat()),
+            "sent_at": datetime.utcnow().isoformat()
+        }
+        return True
+
+    async def save_promotions(self, promotions: List[Dict]) -> List[Dict]:
+        results = []
+        for promotion in promotions:
+            promo_id = promotion.get('promo_id')
+            if not promo_id:
+                results.append({"promo_id": promo_id, "status": "failed", "error": "promo_id ausente"})
+                continue
+            exists = promo_id in self._promotions
+            if not await self.save_promotion(promotion):
+                results.append({"promo_id": promo_id, "status": "failed", "error": "promo_id já usado por outra sessão"})
+                continue
+            results.append({"promo_id": promo_id, "status": "exists" if exists else "inserted"})
+        return results
+
+    async def get_promotions(self, limit: int = 50) -> List[Dict]:
+        promotions = sorted(self._promotions.values(), key=lambda p: p.get('created_at') or '', reverse=True)
+        return [copy.deepcopy(promotion) for promotion in promotions[:limit]]
+
+    async def get_promotions_page(self, page_size: int = 20, cursor: Optional[str] = None) -> Dict:
+        promotions = sorted(
+            self._promotions.values(), key=lambda p: (p.get('created_at') or '', p['promo_id']), reverse=True
+        )
+        start = int(cursor) if cursor else 0
+        page = promotions[start:start + page_size]
+        return {
+            "promotions": [{field: copy.deepcopy(p.get(field)) for field in PROMOTION_SUMMARY_FIELDS} for p in page],
+            "next_cursor": str(start + page_size) if start + page_size < len(promotions) else None
+        }
+
+    async def get_promotion_by_id(self, promo_id: str) -> Optional[Dict]:
+        promotion = self._promotions.get(promo_id)
+        return copy.deepcopy(promotion) if promotion is not None else None
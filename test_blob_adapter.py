@@ -0,0 +1,387 @@
+"""
+Testes do AsyncBlobStorageAdapter contra um stand-in local compatível com o Azurite
+O stand-in é um servidor HTTP (aiohttp) que implementa o subconjunto da API REST do
+Blob Storage usado no upload (criar container, Put Blob, Put Block, Put Block List)
+e o download por link SAS (Get Blob):
+o SDK real (azure.storage.blob.aio) fala com ele pela connection string do Azurite,
+então o chunking e o paralelismo testados são os do próprio SDK
+
+Uso:
+    python test_blob_adapter.py
+    python -m pytest test_blob_adapter.py
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from urllib.parse import parse_qs, urlparse
+from email.utils import formatdate
+from typing import Dict, List, Tuple
+from xml.etree import ElementTree
+
+import aiohttp
+import azure.functions as func
+from aiohttp import web
+from azure.storage.blob.aio import BlobServiceClient
+
+from shared.adapters import blob_adapter as blob_module
+from shared.adapters.blob_adapter import AsyncBlobStorageAdapter, ExcelServiceAzure, spool_workbook
+
+# Conta e chave padrão do Azurite (públicas, documentadas pela Microsoft)
+ACCOUNT = "devstoreaccount1"
+ACCOUNT_KEY = "Eby8vdM02xNOcqFlqUwJPLlmEtlCDXJ1OUzFT50uSRZ6IFsuFq2UVErCz4I6tq/K1SZFPTOtr/KBHBeksoGMGw=="
+BLOCK_SIZE = 64 * 1024
+SINGLE_PUT_SIZE = 128 * 1024
+
+
+class AzuriteStandIn:
+    """Blob Storage em memória servido por HTTP, com latência por requisição"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.containers: Dict[str, Dict[str, bytes]] = {}
+        self.staged: Dict[Tuple[str, str], Dict[str, bytes]] = {}
+        self.content_types: Dict[Tuple[str, str], str] = {}
+        self.requests: List[str] = []  # put_blob | put_block | put_block_list | create_container | get_blob
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._runner = None
+        self.port = None
+
+    @property
+    def connection_string(self) -> str:
+        return (
+            f"DefaultEndpointsProtocol=http;AccountName={ACCOUNT};AccountKey={ACCOUNT_KEY};"
+            f"BlobEndpoint=http://127.0.0.1:{self.port}/{ACCOUNT};"
+        )
+
+    def client(self) -> BlobServiceClient:
+        return BlobServiceClient.from_connection_string(
+            self.connection_string, max_block_size=BLOCK_SIZE, max_single_put_size=SINGLE_PUT_SIZE
+        )
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    def _response(self, status: int, error_code: str = None) -> web.Response:
+        headers = {
+            "ETag": '"0x8D000000000000"',
+            "Last-Modified": formatdate(usegmt=True),
+            "x-ms-request-id": "00000000-0000-0000-0000-000000000000",
+            "x-ms-version": "2021-08-06",
+            "x-ms-request-server-encrypted": "true",
+        }
+        if error_code:
+            headers["x-ms-error-code"] = error_code
+        return web.Response(status=status, headers=headers)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            return await self._dispatch(request)
+        finally:
+            self.in_flight -= 1
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        account, _, rest = request.path.lstrip("/").partition("/")
+        container, _, blob = rest.partition("/")
+        assert account == ACCOUNT and request.method in ("PUT", "GET"), (request.method, request.path)
+        query = request.query
+
+        if request.method == "GET":
+            # Download anônimo: só com SAS de leitura (a assinatura não é conferida)
+            self.requests.append("get_blob")
+            if "r" not in query.get("sp", "") or "sig" not in query:
+                return self._response(403, "AuthenticationFailed")
+            body = self.containers.get(container, {}).get(blob)
+            if body is None:
+                return self._response(404, "BlobNotFound")
+            response = self._response(200)
+            response.body = body
+            response.headers["Content-Disposition"] = query.get("rscd", "")
+            response.headers["Content-Type"] = query.get("rsct", "application/octet-stream")
+            return response
+
+        if query.get("restype") == "container":
+            self.requests.append("create_container")
+            if container in self.containers:
+                return self._response(409, "ContainerAlreadyExists")
+            self.containers[container] = {}
+            return self._response(201)
+
+        if container not in self.containers:
+            return self._response(404, "ContainerNotFound")
+        key = (container, blob)
+        body = await request.read()
+
+        if query.get("comp") == "block":
+            self.requests.append("put_block")
+            self.staged.setdefault(key, {})[query["blockid"]] = body
+            return self._response(201)
+
+        if query.get("comp") == "blocklist":
+            self.requests.append("put_block_list")
+            staged = self.staged.pop(key, {})
+            ids = [element.text for element in ElementTree.fromstring(body)]
+            self.containers[container][blob] = b"".join(staged[block_id] for block_id in ids)
+            self.content_types[key] = request.headers.get("x-ms-blob-content-type")
+            return self._response(201)
+
+        assert request.headers.get("x-ms-blob-type") == "BlockBlob"
+        self.requests.append("put_blob")
+        self.containers[container][blob] = body
+        self.content_types[key] = request.headers.get("x-ms-blob-content-type")
+        return self._response(201)
+
+    def blob(self, url: str) -> bytes:
+        container, _, blob = url.split(f"/{ACCOUNT}/", 1)[1].partition("/")
+        return self.containers[container][blob]
+
+
+def run_with_stand_in(scenario, latency: float = 0.0):
+    async def main():
+        server = AzuriteStandIn(latency)
+        await server.start()
+        try:
+            return await scenario(server)
+        finally:
+            await server.stop()
+
+    return asyncio.run(main())
+
+
+def test_large_upload_streams_parallel_blocks():
+    payload = os.urandom(BLOCK_SIZE * 12 + 1000)
+
+    async def scenario(server):
+        adapter = AsyncBlobStorageAdapter(client_factory=server.client, max_concurrency=4)
+        with tempfile.SpooledTemporaryFile(max_size=BLOCK_SIZE) as spool:
+            spool.write(payload)
+            spool.seek(0)
+            url = await adapter.upload_stream(spool, "grande.xlsx", length=len(payload))
+        await adapter.close()
+        return server, url
+
+    server, url = run_with_stand_in(scenario, latency=0.01)
+    assert server.blob(url) == payload
+    assert server.requests.count("put_block") == 13 and server.requests.count("put_block_list") == 1
+    assert "put_blob" not in server.requests
+    assert server.max_in_flight > 1, "os blocos deveriam subir em paralelo"
+    assert all(content_type.endswith("spreadsheetml.sheet") for content_type in server.content_types.values())
+
+
+def test_small_file_is_a_single_put_from_disk(tmp_path):
+    path = tmp_path / "pequeno.xlsx"
+    path.write_bytes(b"PK" + os.urandom(1000))
+
+    async def scenario(server):
+        adapter = AsyncBlobStorageAdapter(client_factory=server.client)
+        url = await adapter.upload_excel_from_path(str(path))
+        await adapter.close()
+        return server, url
+
+    server, url = run_with_stand_in(scenario)
+    assert server.blob(url) == path.read_bytes()
+    assert server.requests == ["create_container", "put_blob"]
+
+
+def test_client_is_shared_and_recreated_per_loop():
+    current = {}
+    created = []
+    closed = []
+
+    def factory():
+        client = current["server"].client()
+        close = client.close
+
+        async def tracked_close():
+            closed.append(client)
+            await close()
+
+        client.close = tracked_close
+        created.append(client)
+        return client
+
+    async def first(server):
+        current["server"] = server
+        adapter = AsyncBlobStorageAdapter(client_factory=factory)
+        for name in ("a.xlsx", "b.xlsx"):
+            await adapter.upload_excel_file(b"PK conteudo", name)
+        return adapter, server.requests.count("create_container")
+
+    adapter, container_creates = run_with_stand_in(first)
+    assert len(created) == 1, "uploads no mesmo loop devem reutilizar o cliente"
+    assert container_creates == 1, "o container é garantido uma vez por cliente, não a cada upload"
+
+    async def second(server):
+        current["server"] = server
+        url = await adapter.upload_excel_file(b"PK conteudo", "c.xlsx")
+        await adapter.close()
+        return server.blob(url)
+
+    # Outro asyncio.run: o cliente antigo pertence ao loop anterior
+    assert run_with_stand_in(second) == b"PK conteudo"
+    assert len(created) == 2
+    assert closed == [created[0], created[1]], "o cliente do loop anterior é fechado ao recriar"
+
+
+def test_workbook_upload_does_not_stall_the_event_loop():
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    sheet = workbook.active
+    for row in range(20000):
+        sheet.append([f"Promo {row}", "progressiva", row * 1.5, "varejo", "01/01/2026", "31/01/2026"])
+
+    async def scenario(server):
+        adapter = AsyncBlobStorageAdapter(client_factory=server.client)
+        ticks = 0
+        done = asyncio.Event()
+
+        async def heartbeat():
+            nonlocal ticks
+            while not done.is_set():
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        beat = asyncio.create_task(heartbeat())
+        started = time.perf_counter()
+        url = await adapter.upload_workbook(workbook, "campanha.xlsx")
+        elapsed = time.perf_counter() - started
+        done.set()
+        await beat
+        await adapter.close()
+        return server, url, ticks, elapsed
+
+    server, url, ticks, elapsed = run_with_stand_in(scenario)
+    assert server.blob(url)[:2] == b"PK"
+    assert len(server.blob(url)) > SINGLE_PUT_SIZE and "put_block" in server.requests
+    # Serialização numa thread: o loop continua atendendo outras corrotinas no meio
+    assert ticks >= elapsed / 0.005 / 4, f"{ticks} ticks em {elapsed * 1000:.0f}ms: event loop travado"
+
+
+def test_spool_overflows_to_disk():
+    from openpyxl import Workbook
+
+    workbook = Workbook()
+    for row in range(2000):
+        workbook.active.append([row, f"linha {row}"])
+
+    async def scenario():
+        spool = await spool_workbook(workbook, max_memory=1024)
+        with spool:
+            return spool._rolled, spool.read(2)
+
+    rolled, magic = asyncio.run(scenario())
+    assert rolled and magic == b"PK"
+
+
+def test_unconfigured_adapter_saves_locally(monkeypatch, tmp_path):
+    monkeypatch.delenv("AZURE_STORAGE_CONNECTION_STRING", raising=False)
+    monkeypatch.chdir(tmp_path)
+    adapter = AsyncBlobStorageAdapter()
+    assert adapter.client is None
+    path = asyncio.run(ExcelServiceAzure().generate_promotion_excel_async({"titulo": "Local"}, adapter))
+    with open(path, "rb") as f:
+        assert f.read(2) == b"PK"
+
+
+def test_download_link_is_short_lived_read_only_sas():
+    payload = b"PK" + os.urandom(5000)
+
+    async def scenario(server):
+        adapter = AsyncBlobStorageAdapter(client_factory=server.client)
+        url = await adapter.upload_excel_file(payload, "campanha_20261019.xlsx")
+        link = await adapter.get_download_url(url, expiry_minutes=10)
+        async with aiohttp.ClientSession() as session:
+            async with session.get(link["url"]) as response:
+                body, headers = await response.read(), response.headers
+            async with session.get(url) as response:
+                status_without_sas = response.status
+        await adapter.close()
+        return link, body, headers, status_without_sas
+
+    link, body, headers, status_without_sas = run_with_stand_in(scenario)
+    query = parse_qs(urlparse(link["url"]).query)
+    assert body == payload and status_without_sas == 403
+    assert query["sp"] == ["r"] and "sig" in query
+    assert headers["Content-Disposition"] == 'attachment; filename="campanha_20261019.xlsx"'
+    assert headers["Content-Type"].endswith("spreadsheetml.sheet")
+    assert link["expires_at"] == query["se"][0]
+
+
+def test_local_file_has_no_download_link(monkeypatch, tmp_path):
+    monkeypatch.delenv("AZURE_STORAGE_CONNECTION_STRING", raising=False)
+    monkeypatch.chdir(tmp_path)
+    adapter = AsyncBlobStorageAdapter()
+    path = asyncio.run(adapter.upload_excel_file(b"PK local", "local.xlsx"))
+    assert asyncio.run(adapter.get_download_url(path)) is None
+
+
+def _export_request(delivery: str) -> func.HttpRequest:
+    body = {"promo_data": {"titulo": "Combo Always", "mecanica": "combo"}, "format": "excel", "delivery": delivery}
+    return func.HttpRequest(method="POST", url="/api/export", body=__import__("json").dumps(body).encode())
+
+
+def test_export_streams_binary_workbook():
+    from ExportFunction import main
+
+    response = asyncio.run(main(_export_request("stream")))
+    assert response.status_code == 200
+    assert response.mimetype == blob_module.EXCEL_CONTENT_TYPE
+    assert response.get_body()[:2] == b"PK", "arquivo binário, não JSON com base64"
+    disposition = response.headers["Content-Disposition"]
+    assert disposition.startswith('attachment; filename="combo_always_') and disposition.endswith('.xlsx"')
+
+
+def test_export_returns_link_instead_of_file(monkeypatch):
+    import ExportFunction
+
+    async def scenario(server):
+        adapter = AsyncBlobStorageAdapter(client_factory=server.client)
+        monkeypatch.setattr(ExportFunction, "async_blob_adapter", adapter)
+        response = await ExportFunction.main(_export_request("url"))
+        await adapter.close()
+        return server, response
+
+    server, response = run_with_stand_in(scenario)
+    result = __import__("json").loads(response.get_body())
+    assert response.mimetype == "application/json" and result["delivery"] == "url"
+    assert "excel_base64" not in result and len(response.get_body()) < 1024
+    assert result["download_url"].split("?")[0].endswith(result["filename"])
+    assert server.blob(result["download_url"].split("?")[0])[:2] == b"PK"
+
+
+def test_export_without_blob_storage_points_to_stream(monkeypatch):
+    import ExportFunction
+
+    monkeypatch.setattr(ExportFunction, "async_blob_adapter", type("Unconfigured", (), {"client": None})())
+    result = __import__("json").loads(asyncio.run(ExportFunction.main(_export_request("url"))).get_body())
+    assert result["success"] and result["delivery"] == "stream" and result["filename"].endswith(".xlsx")
+
+
+if __name__ == "__main__":
+    print("🧪 AsyncBlobStorageAdapter (azure.storage.blob.aio) contra stand-in do Azurite")
+    test_large_upload_streams_parallel_blocks()
+    print("  ✅ upload em blocos paralelos a partir de SpooledTemporaryFile")
+    test_small_file_is_a_single_put_from_disk(__import__("pathlib").Path(tempfile.mkdtemp()))
+    print("  ✅ arquivo pequeno em um Put Blob, lido do disco")
+    test_workbook_upload_does_not_stall_the_event_loop()
+    print("  ✅ workbook grande sem travar o event loop")
+    test_download_link_is_short_lived_read_only_sas()
+    print("  ✅ link de download SAS só de leitura, com nome do arquivo")
+    test_export_streams_binary_workbook()
+    print("  ✅ ExportFunction responde o arquivo binário")
+    sys.exit(0)
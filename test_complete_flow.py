@@ -5,7 +5,6 @@ Simula exatamente o que o frontend faz
 import requests
 import json
 from datetime import datetime
-import base64
 
 # URLs
 ORCHESTRATOR_URL = "https://promoagente-func.azurewebsites.net/api/orchestrator"
@@ -59,21 +58,31 @@ def send_message(message: str):
             # Verifica se tem Excel
             if current_state and current_state.get("data"):
                 data = current_state["data"]
-                if "excel_base64" in data:
+                if "excel_export" in data:
+                    export = data["excel_export"]
                     print("\n🎉 EXCEL DETECTADO NO ESTADO!")
-                    print(f"📁 Filename: {data.get('excel_filename')}")
-                    print(f"📦 Base64 length: {len(data.get('excel_base64', ''))} chars")
+                    print(f"📁 Filename: {export.get('filename')}")
+                    print(f"🔗 Link: {'sim, até ' + str(export.get('expires_at')) if export.get('download_url') else 'não (download direto pela API)'}")
                     
-                    # Tenta salvar
+                    # Tenta baixar (como o frontend faz)
                     try:
-                        excel_bytes = base64.b64decode(data["excel_base64"])
+                        if export.get("download_url"):
+                            download = requests.get(export["download_url"], timeout=60)
+                        else:
+                            promo_data = {k: v for k, v in data.items() if k != "excel_export"}
+                            download = requests.post(
+                                ORCHESTRATOR_URL.replace("/orchestrator", "/export"),
+                                json={"promo_data": promo_data, "format": "excel", "delivery": "stream"},
+                                timeout=60
+                            )
+                        download.raise_for_status()
                         filename = f"test_flow_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
                         with open(filename, "wb") as f:
-                            f.write(excel_bytes)
+                            f.write(download.content)
                         print(f"💾 Excel salvo: {filename}")
-                        print(f"💾 Tamanho: {len(excel_bytes)} bytes")
+                        print(f"💾 Tamanho: {len(download.content)} bytes")
                     except Exception as e:
-                        print(f"❌ Erro ao salvar Excel: {e}")
+                        print(f"❌ Erro ao baixar Excel: {e}")
             
             return result
         else:
@@ -126,26 +135,22 @@ if result4:
         
         print("\n🔍 CAMPOS NO ESTADO:")
         for key in data.keys():
-            if key == "excel_base64":
-                print(f"  ✅ {key}: {len(data[key])} caracteres")
-            elif key == "excel_filename":
+            if key == "excel_export":
                 print(f"  ✅ {key}: {data[key]}")
             else:
                 value = str(data[key])[:50]
                 print(f"  - {key}: {value}...")
         
-        if "excel_base64" in data and "excel_filename" in data:
+        if "excel_export" in data and data["excel_export"].get("filename"):
             print("\n🎉 SUCESSO TOTAL!")
             print("✅ Excel gerado")
-            print("✅ Base64 presente")
-            print("✅ Filename presente")
+            print("✅ Referência de download presente (sem base64 no estado)")
             print("✅ Frontend deveria fazer download automático!")
         else:
             print("\n⚠️ PROBLEMA DETECTADO:")
-            if "excel_base64" not in data:
-                print("❌ excel_base64 NÃO está no estado")
-            if "excel_filename" not in data:
-                print("❌ excel_filename NÃO está no estado")
+            print("❌ excel_export NÃO está no estado")
+        if "excel_base64" in data:
+            print("❌ excel_base64 ainda está no estado")
     else:
         print("\n❌ Estado vazio ou sem data")
 else:
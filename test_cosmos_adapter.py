@@ -0,0 +1,892 @@
+"""
+Testes do CosmosDBAdapter contra um Cosmos fake em memória
+O fake imita a superfície assíncrona do azure.cosmos.aio usada pelo adapter
+(create/upsert/read/patch/delete e o subconjunto de SQL das queries), com uma
+latência artificial para verificar que chamadas concorrentes não se serializam
+
+A bateria de conformidade de StorageBackend também roda contra este fake
+(fixture storage_backend do conftest.py)
+
+Uso:
+    python -m pytest test_cosmos_adapter.py
+"""
+import re
+import json
+import copy
+import time
+import uuid
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+import azure.functions as func
+from azure.cosmos import exceptions
+
+from azure.core import MatchConditions
+
+from shared.adapters.cosmos_adapter import CosmosDBAdapter, CONTAINERS
+from shared.adapters.cosmos_aggregates import ChangeFeedAggregator
+from shared.adapters.cosmos_metrics import RequestUnitBudget, bulk_operations
+from shared.adapters.cosmos_migration import PartitionMigration
+
+
+def _matches_filter(document: Dict, predicate: str) -> bool:
+    """Subconjunto do filtro de patch condicional: OR de condições simples ou de grupos (... AND ...)"""
+    assert predicate.startswith("FROM c WHERE "), predicate
+
+    def holds(condition: str) -> bool:
+        undefined = re.fullmatch(r"NOT IS_DEFINED\(c\.(\w+)\)", condition)
+        if undefined:
+            return undefined[1] not in document
+        length = re.fullmatch(r"ARRAY_LENGTH\(c\.(\w+)\) = (\d+)", condition)
+        if length:
+            return isinstance(document.get(length[1]), list) and len(document[length[1]]) == int(length[2])
+        compare = re.fullmatch(r"c\.(\w+) ([<=]) (\d+|'[^']*')", condition)
+        assert compare, f"filtro não suportado pelo fake: {predicate}"
+        field, operator, literal = compare.groups()
+        value = literal[1:-1] if literal.startswith("'") else int(literal)
+        if field not in document or type(document[field]) is not type(value):
+            return False
+        return document[field] < value if operator == "<" else document[field] == value
+
+    return any(
+        all(holds(condition) for condition in (group[1:-1] if group.startswith("(") else group).split(" AND "))
+        for group in predicate[len("FROM c WHERE "):].split(" OR ")
+    )
+
+
+class FakeContainer:
+    """Container em memória, indexado por (partition key, id); cada escrita ganha um LSN (change feed)"""
+
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.items: Dict[tuple, Dict] = {}
+        self.versions: Dict[tuple, int] = {}  # Último LSN de cada item (itens semeados direto ficam fora do feed)
+        self.lsn = 0
+        self.feed_tokens: Dict[str, int] = {}  # Continuation tokens opacos do change feed -> LSN
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.queries: List[tuple] = []  # (query, partition_key) de cada query executada
+        self.reads = 0
+        self.batches = 0
+        self.throttle_next = 0  # Quantas operações seguintes respondem 429
+        self.request_charge = 1.0  # RU informado em cada resposta
+        self.indexing_policy: Optional[Dict] = None
+
+    async def _io(self, kwargs: Optional[Dict] = None):
+        # Simula o round trip: enquanto espera, outras corrotinas devem poder rodar
+        if self.throttle_next:
+            self.throttle_next -= 1
+            error = exceptions.CosmosHttpResponseError(status_code=429, message="Request rate is large")
+            error.headers = {"x-ms-request-charge": "0", "x-ms-retry-after-ms": "20"}
+            raise error
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        hook = (kwargs or {}).get("response_hook")
+        if hook:
+            hook({"x-ms-request-charge": str(self.request_charge)}, None)
+
+    def _store(self, key: tuple, body: Dict) -> Dict:
+        self.lsn += 1
+        self.items[key] = copy.deepcopy(body)
+        self.versions[key] = self.lsn
+        return self._response(key)
+
+    def _response(self, key: tuple) -> Dict:
+        return {**copy.deepcopy(self.items[key]), "_etag": str(self.versions.get(key, 0))}
+
+    async def create_item(self, body: Dict, **kwargs) -> Dict:
+        await self._io(kwargs)
+        key = (body.get("partitionKey"), body["id"])
+        if key in self.items:
+            raise exceptions.CosmosResourceExistsError(status_code=409, message=f"{body['id']} já existe")
+        return self._store(key, body)
+
+    async def upsert_item(self, body: Dict, **kwargs) -> Dict:
+        await self._io(kwargs)
+        return self._store((body.get("partitionKey"), body["id"]), body)
+
+    async def replace_item(self, item: str, body: Dict, etag: Optional[str] = None, match_condition=None, **kwargs) -> Dict:
+        await self._io(kwargs)
+        key = (body.get("partitionKey"), item)
+        if key not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} não encontrado")
+        if match_condition == MatchConditions.IfNotModified and etag != str(self.versions.get(key, 0)):
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message=f"{item} foi alterado")
+        return self._store(key, body)
+
+    async def read_item(self, item: str, partition_key, **kwargs) -> Dict:
+        await self._io(kwargs)
+        self.reads += 1
+        if (partition_key, item) not in self.items:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} não encontrado")
+        return self._response((partition_key, item))
+
+    async def delete_item(self, item: str, partition_key, **kwargs):
+        await self._io(kwargs)
+        if self.items.pop((partition_key, item), None) is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} não encontrado")
+
+    async def patch_item(self, item: str, partition_key, patch_operations: List[Dict],
+                         filter_predicate: Optional[str] = None, **kwargs) -> Dict:
+        await self._io(kwargs)
+        assert len(patch_operations) <= 10, "o Cosmos aceita no máximo 10 operações por patch"
+        document = copy.deepcopy(self.items.get((partition_key, item)))
+        if document is None:
+            raise exceptions.CosmosResourceNotFoundError(status_code=404, message=f"{item} não encontrado")
+        if filter_predicate and not _matches_filter(document, filter_predicate):
+            raise exceptions.CosmosAccessConditionFailedError(status_code=412, message="filtro não atendido")
+        for operation in patch_operations:
+            *parents, leaf = operation["path"].strip("/").split("/")
+            target = document
+            for parent in parents:
+                if operation["op"] != "set" and parent not in target:
+                    raise exceptions.CosmosHttpResponseError(status_code=400, message=f"{operation['path']} não existe")
+                target = target.setdefault(parent, {})
+            if isinstance(target, list):
+                if operation["op"] == "add":
+                    target.insert(len(target) if leaf == "-" else int(leaf), copy.deepcopy(operation["value"]))
+                else:
+                    assert operation["op"] == "remove", operation
+                    target.pop(int(leaf))
+            elif operation["op"] == "incr":
+                target[leaf] = target.get(leaf, 0) + operation["value"]
+            elif operation["op"] == "remove":
+                target.pop(leaf)
+            else:
+                target[leaf] = copy.deepcopy(operation["value"])
+        return self._store((partition_key, item), document)
+
+    async def read(self, **kwargs) -> Dict:
+        return {"id": self.name, "indexingPolicy": self.indexing_policy or {}}
+
+    async def execute_item_batch(self, batch_operations: List[tuple], partition_key, **kwargs) -> List[Dict]:
+        """Transactional batch: tudo ou nada, numa partição só"""
+        await self._io(kwargs)
+        self.batches += 1
+        assert len(batch_operations) <= 100
+        staged = {}
+        for index, (operation, (body,)) in enumerate(batch_operations):
+            assert operation == "create" and body["partitionKey"] == partition_key, (operation, body)
+            key = (partition_key, body["id"])
+            if key in self.items or key in staged:
+                responses = [{"statusCode": 424}] * len(batch_operations)
+                responses[index] = {"statusCode": 409}
+                raise exceptions.CosmosBatchOperationError(
+                    error_index=index, headers={}, status_code=409,
+                    message=f"{body['id']} já existe", operation_responses=responses
+                )
+            staged[key] = copy.deepcopy(body)
+        return [{"statusCode": 201, "resourceBody": self._store(key, body)} for key, body in staged.items()]
+
+    def query_items(self, query: str, parameters: Optional[List[Dict]] = None,
+                    partition_key=None, max_item_count: Optional[int] = None, **kwargs):
+        query = " ".join(query.split())
+        self.queries.append((query, partition_key))
+        return FakePaged(self, query, {p["name"]: p["value"] for p in parameters or []}, partition_key, max_item_count,
+                         kwargs.get("response_hook"))
+
+    def query_items_change_feed(self, max_item_count: Optional[int] = None, start_time: Optional[str] = None,
+                                response_hook=None, **kwargs):
+        assert "continuation" not in kwargs, "o token volta por by_page(continuation_token)"
+        return FakeChangeFeed(self, start_time, max_item_count or 100, response_hook)
+
+    async def run_query(self, query: str, parameters: Dict, partition_key=None, response_hook=None) -> List:
+        """Subconjunto do SQL do Cosmos usado pelo adapter"""
+        await self._io({"response_hook": response_hook})
+        match = re.fullmatch(
+            r"SELECT (?:TOP (?P<top>\d+) )?(?P<projection>.+?) FROM c"
+            r"(?: WHERE c\.(?P<field>\w+) = (?P<param>@\w+))?"
+            r"(?: ORDER BY (?P<order>c\.\w+ DESC(?:, c\.\w+ DESC)*))?",
+            query
+        )
+        assert match, f"query não suportada pelo fake: {query}"
+
+        rows = [row for (pk, _), row in self.items.items() if partition_key is None or pk == partition_key]
+        if match["field"]:
+            rows = [row for row in rows if row.get(match["field"]) == parameters[match["param"]]]
+        if match["order"]:
+            fields = [term.split()[0][2:] for term in match["order"].split(", ")]
+            if len(fields) > 1:
+                assert self.indexing_policy and self.indexing_policy.get("compositeIndexes"), \
+                    "ORDER BY em várias propriedades exige índice composto"
+            rows.sort(key=lambda row: tuple(row.get(field) or "" for field in fields), reverse=True)
+        if match["top"]:
+            rows = rows[:int(match["top"])]
+
+        projection = match["projection"]
+        if projection == "VALUE COUNT(1)":
+            results = [len(rows)]
+        elif projection.startswith("VALUE SUM(c."):
+            field = projection[len("VALUE SUM(c."):-1]
+            results = [sum(row.get(field) or 0 for row in rows)]
+        elif projection == "*":
+            results = rows
+        else:
+            fields = [name.strip()[2:] for name in projection.split(",")]
+            results = [{name: row.get(name) for name in fields} for row in rows]
+        return copy.deepcopy(results)
+
+
+class FakePaged:
+    """Resultado de query_items: iterável item a item ou por páginas (by_page)"""
+
+    def __init__(self, container: FakeContainer, query: str, parameters: Dict, partition_key, page_size, response_hook):
+        self.container = container
+        self.query = query
+        self.parameters = parameters
+        self.partition_key = partition_key
+        self.page_size = page_size or 1000
+        self.response_hook = response_hook
+
+    async def __aiter__(self):
+        for item in await self.container.run_query(self.query, self.parameters, self.partition_key, self.response_hook):
+            yield item
+
+    def by_page(self, continuation_token: Optional[str] = None):
+        return FakePageIterator(self, int(continuation_token or 0))
+
+
+class FakePageIterator:
+    def __init__(self, paged: FakePaged, offset: int):
+        self.paged = paged
+        self.offset = offset
+        self.continuation_token: Optional[str] = str(offset) if offset else None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        results = await self.paged.container.run_query(
+            self.paged.query, self.paged.parameters, self.paged.partition_key, self.paged.response_hook
+        )
+        page = results[self.offset:self.offset + self.paged.page_size]
+        if not page:
+            raise StopAsyncIteration
+        self.offset += len(page)
+        self.continuation_token = str(self.offset) if self.offset < len(results) else None
+        return _aiter(page)
+
+
+class FakeChangeFeed:
+    """Change feed (última versão de cada item, em ordem de LSN), lido por páginas com by_page"""
+
+    def __init__(self, container: FakeContainer, start_time: Optional[str], page_size: int, response_hook):
+        self.container = container
+        self.start_time = start_time
+        self.page_size = page_size
+        self.response_hook = response_hook
+
+    def by_page(self, continuation_token: Optional[str] = None):
+        assert continuation_token or self.start_time == "Beginning", "o processador deve pedir o feed desde o início"
+        # Só aceita tokens que o próprio feed entregou (KeyError para etag ou LSN cru)
+        after = self.container.feed_tokens[continuation_token] if continuation_token else 0
+        return FakeChangeFeedPages(self, after, continuation_token)
+
+
+class FakeChangeFeedPages:
+    """Paginador do change feed; continuation_token é opaco, como o token composto do SDK >= 4.7"""
+
+    def __init__(self, feed: FakeChangeFeed, after: int, continuation_token: Optional[str]):
+        self.feed = feed
+        self.after = after
+        self.continuation_token = continuation_token
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        container = self.feed.container
+        await container._io()
+        changed = sorted((version, key) for key, version in container.versions.items() if version > self.after)
+        page = changed[:self.feed.page_size]
+        if self.feed.response_hook:
+            self.feed.response_hook({"x-ms-request-charge": str(container.request_charge)}, None)
+        if not page:
+            raise StopAsyncIteration
+        self.after = page[-1][0]
+        self.continuation_token = uuid.uuid4().hex
+        container.feed_tokens[self.continuation_token] = self.after
+        return _aiter([copy.deepcopy(container.items[key]) for _, key in page])
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
+
+
+class FakeDatabase:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.containers: Dict[str, FakeContainer] = {}
+
+    def get_container_client(self, name: str) -> FakeContainer:
+        if name not in self.containers:
+            self.containers[name] = FakeContainer(name, self.latency)
+        return self.containers[name]
+
+    async def create_container_if_not_exists(self, id: str, partition_key, indexing_policy=None, **kwargs) -> FakeContainer:
+        assert partition_key["paths"] == ["/partitionKey"], partition_key
+        created = id not in self.containers
+        container = self.get_container_client(id)
+        if created:
+            container.indexing_policy = indexing_policy
+        return container
+
+    async def replace_container(self, container: FakeContainer, partition_key, indexing_policy=None, **kwargs):
+        container.indexing_policy = indexing_policy
+        return container
+
+
+class FakeCosmosClient:
+    """Cliente fake; o armazenamento fica no FakeDatabase para sobreviver à recriação do cliente"""
+
+    def __init__(self, database: FakeDatabase):
+        self.database = database
+        self.closed = False
+
+    def get_database_client(self, name: str) -> FakeDatabase:
+        return self.database
+
+    async def close(self):
+        self.closed = True
+
+
+def make_adapter(latency: float = 0.0):
+    database = FakeDatabase(latency)
+    clients: List[FakeCosmosClient] = []
+
+    def factory():
+        clients.append(FakeCosmosClient(database))
+        return clients[-1]
+
+    return CosmosDBAdapter(client_factory=factory), database, clients
+
+
+def test_partial_update():
+    adapter, _, _ = make_adapter()
+
+    async def scenario():
+        try:
+            assert not await adapter.update_promo_state_fields("inexistente", {"titulo": "X"})
+            assert await adapter.save_promo_state("s1", {"session_id": "s1", "titulo": "A", "status": "draft"})
+            assert await adapter.update_promo_state_fields("s1", {"titulo": "B", "status": "ready"})
+            return await adapter.get_promo_state("s1")
+        finally:
+            await adapter.close()
+
+    state = asyncio.run(scenario())
+    assert state["titulo"] == "B" and state["status"] == "ready", state
+
+
+def test_concurrent_calls_overlap():
+    # N turnos concorrentes: com I/O assíncrono levam perto de um round trip, não N
+    latency, requests = 0.05, 20
+    adapter, database, _ = make_adapter(latency)
+
+    async def scenario():
+        try:
+            await adapter.initialize()
+            started = time.perf_counter()
+            results = await asyncio.gather(*(
+                adapter.save_message(f"session_{i}", f"oi {i}", f"olá {i}") for i in range(requests)
+            ))
+            return results, time.perf_counter() - started
+        finally:
+            await adapter.close()
+
+    results, elapsed = asyncio.run(scenario())
+    assert all(results)
+    sessions = database.containers[CONTAINERS["sessions"]]
+    assert sessions.max_in_flight == requests, sessions.max_in_flight
+    assert elapsed < latency * requests / 2, f"{elapsed:.3f}s: chamadas serializadas"
+
+
+def test_client_is_shared_and_recreated_per_loop():
+    adapter, _, clients = make_adapter()
+
+    async def two_calls():
+        assert await adapter.save_message("s1", "a", "b")
+        assert await adapter.get_recent_messages("s1")
+
+    asyncio.run(two_calls())
+    assert len(clients) == 1, "chamadas no mesmo loop devem reutilizar o cliente"
+
+    # Novo loop (ex: outro asyncio.run): o cliente antigo não serve mais
+    asyncio.run(two_calls())
+    assert len(clients) == 2
+    assert clients[0].closed, "o cliente do loop anterior deve ser fechado ao recriar"
+    asyncio.run(adapter.close())
+    assert clients[-1].closed
+
+
+def test_unconfigured_adapter_degrades(monkeypatch):
+    monkeypatch.delenv("COSMOS_DB_ENDPOINT", raising=False)
+    monkeypatch.delenv("COSMOS_DB_KEY", raising=False)
+    adapter = CosmosDBAdapter()
+    assert adapter.client is None
+    assert not asyncio.run(adapter.initialize())
+    assert asyncio.run(adapter.save_message("s1", "a", "b")) is False
+    assert asyncio.run(adapter.get_recent_messages("s1")) == []
+
+
+def test_session_data_is_partitioned_by_session():
+    adapter, database, _ = make_adapter()
+
+    async def scenario():
+        await adapter.save_message("s1", "oi", "olá")
+        await adapter.save_promo_state("s1", {"session_id": "s1", "titulo": "A"})
+        await adapter.get_recent_messages("s1")
+        return await adapter.get_promo_state("s1")
+
+    assert asyncio.run(scenario())["titulo"] == "A"
+    assert {pk for pk, _ in database.containers[CONTAINERS["sessions"]].items} == {"s1"}
+    assert {pk for pk, _ in database.containers[CONTAINERS["promo_states"]].items} == {"s1"}
+    # Histórico da sessão vem do documento da sessão: nada no container messages, nenhuma query
+    assert not database.containers[CONTAINERS["messages"]].items
+    assert not database.containers[CONTAINERS["sessions"]].queries
+
+
+def seed_legacy_layout(database: FakeDatabase, sessions: int = 30):
+    messages = database.get_container_client("messages")
+    states = database.get_container_client("promo_states")
+    session_docs = database.get_container_client(CONTAINERS["sessions"])
+    for i in range(sessions):
+        session_id = f"legacy_{i}"
+        # Sessão do layout antigo: sem as trocas embutidas
+        session_docs.items[(session_id, session_id)] = {
+            "id": session_id, "partitionKey": session_id, "created_at": "2026-01-01T00:00:00", "ttl": 86400
+        }
+        messages.items[(None, f"msg_{i}")] = {
+            "id": f"msg_{i}", "session_id": session_id, "user_message": "oi", "ai_response": "olá",
+            "timestamp": f"2026-01-01T00:00:{i:02d}", "_rid": "x", "_ts": 1
+        }
+        states.items[("active", session_id)] = {
+            "id": session_id, "partitionKey": "active", "status": "draft",
+            "data": {"session_id": session_id, "titulo": f"Promo {i}"}, "_etag": "y"
+        }
+    messages.items[(None, "msg_orfa")] = {"id": "msg_orfa", "user_message": "sem sessão"}
+
+
+def test_partition_migration_is_resumable_and_idempotent(tmp_path):
+    adapter, database, _ = make_adapter()
+    seed_legacy_layout(database)
+    checkpoint = str(tmp_path / "checkpoint.json")
+
+    # O app já gravou o estado de legacy_0 no layout novo: a migração não pode sobrescrever
+    asyncio.run(adapter.save_promo_state("legacy_0", {"session_id": "legacy_0", "titulo": "Novo"}))
+
+    # Interrompe no meio: a 3ª página de messages falha com erro não recuperável
+    migration = PartitionMigration(adapter, checkpoint, page_size=10, max_retries=0)
+    source = database.containers["messages"]
+    original = source.run_query
+    calls = {"n": 0}
+
+    async def failing_query(*args, **kwargs):
+        calls["n"] += 1
+        if calls["n"] == 3:
+            raise exceptions.CosmosHttpResponseError(status_code=503, message="indisponível")
+        return await original(*args, **kwargs)
+
+    source.run_query = failing_query
+    try:
+        asyncio.run(migration.run())
+        assert False, "a migração deveria ter sido interrompida"
+    except exceptions.CosmosHttpResponseError:
+        pass
+    source.run_query = original
+
+    # Retoma do checkpoint, com throttling no destino
+    database.containers[CONTAINERS["messages"]].throttle_next = 3
+    resumed = PartitionMigration(adapter, checkpoint, page_size=10)
+    report = asyncio.run(resumed.run())
+
+    assert report["messages"]["done"] and report["promo_states"]["done"], report
+    assert report["messages"]["copied"] == 30 and report["messages"]["invalid"] == 1, report
+    assert report["promo_states"]["copied"] == 29 and report["promo_states"]["skipped"] == 1, report
+    assert report["throttled"] == 3
+
+    async def check():
+        assert (await adapter.get_promo_state("legacy_0"))["titulo"] == "Novo"
+        assert (await adapter.get_promo_state("legacy_7"))["titulo"] == "Promo 7"
+        assert [m["content"] for m in await adapter.get_recent_messages("legacy_7")] == ["oi", "olá"]
+        await adapter.close()
+
+    asyncio.run(check())
+    target = database.containers[CONTAINERS["promo_states"]]
+    assert all("_etag" not in doc and doc["partitionKey"] == doc["id"] for doc in target.items.values())
+
+    # Rodar de novo não faz nada
+    again = asyncio.run(PartitionMigration(adapter, checkpoint).run())
+    assert again["messages"]["copied"] == 30
+
+
+def test_turn_is_one_point_read_and_one_patch():
+    adapter, database, _ = make_adapter()
+    sessions = database.get_container_client(CONTAINERS["sessions"])
+
+    async def scenario():
+        for turn in range(25):
+            assert await adapter.create_session("s1")
+            await adapter.get_recent_messages("s1", limit=10)
+            assert await adapter.save_message("s1", f"oi {turn}", f"olá {turn}")
+        recent = await adapter.get_recent_messages("s1", limit=2)
+        await adapter.close()
+        return recent
+
+    recent = asyncio.run(scenario())
+    assert [m["content"] for m in recent] == ["oi 23", "olá 23", "oi 24", "olá 24"]
+    document = sessions.items[("s1", "s1")]
+    assert len(document["turns"]) == CosmosDBAdapter.MAX_SESSION_TURNS and document["turn_count"] == 25
+    assert document["turns"][0]["user_message"] == "oi 5"
+
+    operations = adapter.get_stats()["request_units"]["operations"]
+    # Existência da sessão fica em cache: um create no total, sem 409 a cada turno
+    assert operations["sessions.create"]["requests"] == 1 and operations["sessions.create"]["errors"] == 0
+    assert operations["sessions.read"]["requests"] == 26 and operations["sessions.patch"]["requests"] == 25
+    assert not sessions.queries and not database.get_container_client(CONTAINERS["messages"]).queries
+    assert asyncio.run(adapter.get_message_count()) == 25
+
+
+def test_turn_trimming_does_not_trust_a_stale_worker_view():
+    worker_a, database, _ = make_adapter()
+    worker_b = CosmosDBAdapter(client_factory=lambda: FakeCosmosClient(database))
+    sessions = database.get_container_client(CONTAINERS["sessions"])
+
+    async def scenario():
+        for turn in range(CosmosDBAdapter.MAX_SESSION_TURNS):
+            assert await worker_a.save_message("s1", f"a {turn}", "ok")
+        # A sessão expira pelo TTL e outro worker a recria; o worker A ainda acha que o array está cheio
+        del sessions.items[("s1", "s1")]
+        assert await worker_b.save_message("s1", "b 0", "ok")
+        assert await worker_a.save_message("s1", "a depois", "ok")
+        # Os dois workers acrescentam ao mesmo tempo com o array cheio: cada um corta só o seu excedente
+        for turn in range(CosmosDBAdapter.MAX_SESSION_TURNS):
+            assert await worker_b.save_message("s1", f"b {turn + 1}", "ok")
+        await asyncio.gather(*(
+            worker.save_message("s1", f"junto {i}", "ok") for i, worker in enumerate((worker_a, worker_b))
+        ))
+        for worker in (worker_a, worker_b):
+            await worker.close()
+
+    asyncio.run(scenario())
+    document = sessions.items[("s1", "s1")]
+    users = [turn["user_message"] for turn in document["turns"]]
+    assert document["turn_count"] == 2 + CosmosDBAdapter.MAX_SESSION_TURNS + 2, document["turn_count"]
+    assert len(users) == CosmosDBAdapter.MAX_SESSION_TURNS, users
+    assert users[-2:] == ["junto 0", "junto 1"] and users[0] == "b 3", users
+    assert worker_a.get_stats()["request_units"]["operations"]["sessions.patch"]["errors"] >= 1
+
+
+def test_legacy_session_is_upgraded_on_first_turn():
+    adapter, database, _ = make_adapter()
+    database.get_container_client(CONTAINERS["sessions"]).items[("antiga", "antiga")] = {
+        "id": "antiga", "partitionKey": "antiga", "created_at": "2026-01-01T00:00:00", "ttl": 86400
+    }
+    legacy = database.get_container_client(CONTAINERS["messages"])
+    for turn in range(3):
+        legacy.items[("antiga", f"msg_{turn}")] = {
+            "id": f"msg_{turn}", "partitionKey": "antiga", "session_id": "antiga",
+            "user_message": f"antes {turn}", "ai_response": "ok", "timestamp": f"2026-01-01T00:00:0{turn}"
+        }
+
+    async def scenario():
+        # Grava sem ler antes: o patch falha (sem /turns), a sessão é convertida e o patch repetido
+        assert await adapter.save_message("antiga", "depois", "ok")
+        adapter._sessions.clear()
+        messages = await adapter.get_recent_messages("antiga", limit=10)
+        await adapter.close()
+        return messages
+
+    users = [m["content"] for m in asyncio.run(scenario()) if m["role"] == "user"]
+    assert users == ["antes 0", "antes 1", "antes 2", "depois"]
+    assert len(legacy.queries) == 1, "o container antigo só é lido na conversão"
+
+
+def test_promotion_by_id_is_a_point_read():
+    adapter, database, _ = make_adapter()
+    promotions = database.get_container_client(CONTAINERS["promotions"])
+    promotion = {"promo_id": "promo_1", "titulo": "Verão", "periodo_inicio": "01/02/2026"}
+
+    async def scenario():
+        assert await adapter.save_promotion(promotion)
+        # Reenvio com outro período continua na partição registrada, sem duplicar
+        assert await adapter.save_promotion({**promotion, "periodo_inicio": "01/05/2026"})
+        assert [pk for pk, _ in promotions.items] == ["2026-02"]
+
+        fresh, _, _ = make_adapter()
+        fresh._bind(FakeCosmosClient(database))
+        assert (await fresh.get_promotion_by_id("promo_1"))["titulo"] == "Verão"
+        assert (await fresh.get_promotion_by_id("promo_1"))["titulo"] == "Verão"
+        await fresh.close()
+        await adapter.close()
+
+    asyncio.run(scenario())
+    # Reenvio: um point read para conferir a sessão dona do promo_id.
+    # 1ª leitura: índice + promoção; 2ª: só a promoção (partição no LRU); nenhuma query
+    assert database.get_container_client(CONTAINERS["promotion_ids"]).reads == 1
+    assert promotions.reads == 1 + 2
+    assert not promotions.queries
+
+
+def test_legacy_promotion_is_found_and_indexed():
+    adapter, database, _ = make_adapter()
+    promotions = database.get_container_client(CONTAINERS["promotions"])
+    promotions.items[("2025-11", "promo_antiga")] = {"id": "promo_antiga", "partitionKey": "2025-11", "titulo": "Antiga"}
+
+    async def scenario():
+        assert (await adapter.get_promotion_by_id("promo_antiga"))["titulo"] == "Antiga"
+        adapter._promotion_partitions.clear()
+        assert (await adapter.get_promotion_by_id("promo_antiga"))["titulo"] == "Antiga"
+        await adapter.close()
+
+    asyncio.run(scenario())
+    assert len(promotions.queries) == 1, "só a primeira leitura pode fazer fan-out"
+    assert database.containers[CONTAINERS["promotion_ids"]].items[("promo_antiga", "promo_antiga")]["period"] == "2025-11"
+
+
+def test_bulk_save_uses_one_batch_per_partition():
+    adapter, database, _ = make_adapter()
+    campaign = [
+        {"promo_id": f"promo_camp_{month:02d}_{i}", "titulo": "Campanha", "periodo_inicio": f"2026-{month:02d}-01"}
+        for month in (1, 2, 3) for i in range(4)
+    ]
+
+    async def scenario():
+        results = await adapter.save_promotions(campaign)
+        await adapter.close()
+        return results
+
+    assert all(r["status"] == "inserted" for r in asyncio.run(scenario()))
+    promotions = database.containers[CONTAINERS["promotions"]]
+    assert promotions.batches == 3
+    assert sorted({pk for pk, _ in promotions.items}) == ["2026-01", "2026-02", "2026-03"]
+
+
+def test_ensure_containers_adds_composite_index_to_existing_container():
+    adapter, database, _ = make_adapter()
+    legacy = database.get_container_client(CONTAINERS["promotions"])  # Criado antes, sem índice composto
+
+    async def scenario():
+        assert await adapter.ensure_containers()
+        await adapter.close()
+
+    asyncio.run(scenario())
+    assert legacy.indexing_policy["compositeIndexes"][0][0] == {"path": "/created_at", "order": "descending"}
+
+
+def test_promotions_function_pages_with_cursor(monkeypatch):
+    import PromotionsFunction
+
+    adapter, _, _ = make_adapter()
+    monkeypatch.setattr(PromotionsFunction, "cosmos_adapter", adapter)
+
+    async def get(**params) -> Tuple[int, Dict]:
+        request = func.HttpRequest(method="GET", url="/api/promotions", params=params, body=b"")
+        response = await PromotionsFunction.main(request)
+        return response.status_code, json.loads(response.get_body())
+
+    async def scenario():
+        try:
+            assert await adapter.ensure_containers()
+            await adapter.save_promotions([
+                {"promo_id": f"promo_{i}", "session_id": f"s{i}", "titulo": f"P{i}", "created_at": f"2026-01-0{i}"}
+                for i in range(1, 4)
+            ])
+            first = await get(limit="2")
+            rest = await get(limit="2", cursor=first[1]["next_cursor"])
+            return first, rest, await get(), await get(limit="0")
+        finally:
+            await adapter.close()
+
+    first, rest, default, invalid = asyncio.run(scenario())
+    assert first[0] == 200 and [p["promo_id"] for p in first[1]["promotions"]] == ["promo_3", "promo_2"]
+    assert first[1]["count"] == 2 and first[1]["next_cursor"]
+    assert [p["promo_id"] for p in rest[1]["promotions"]] == ["promo_1"] and rest[1]["next_cursor"] is None
+    assert default[1]["count"] == 3, "limit padrão (50) cobre as três"
+    assert invalid[0] == 400
+
+
+def test_request_charges_are_aggregated_per_operation():
+    adapter, database, _ = make_adapter()
+    database.get_container_client(CONTAINERS["sessions"]).request_charge = 5.5
+
+    async def scenario():
+        for turn in range(3):
+            await adapter.save_message("s1", f"oi {turn}", "olá")
+        await adapter.get_recent_messages("s1")
+        assert await adapter.get_promo_state("inexistente") is None
+        await adapter.close()
+
+    asyncio.run(scenario())
+    stats = adapter.get_stats()["request_units"]
+    # 1ª troca: patch (404) + create; as seguintes: só o patch
+    assert stats["operations"]["sessions.patch"]["requests"] == 3
+    assert stats["operations"]["sessions.patch"]["errors"] == 1
+    assert stats["operations"]["sessions.patch"]["ru_total"] == 11.0
+    assert stats["operations"]["sessions.read"]["ru_avg"] == 5.5
+    assert stats["operations"]["promo_states.read"]["errors"] == 1
+    assert stats["total_ru"] == sum(minute["ru"] for minute in stats["per_minute"]) == 22.0
+
+
+def test_throttling_is_recorded_and_holds_the_budget():
+    budget = RequestUnitBudget(ru_per_second=1000)
+    database = FakeDatabase(0.0)
+    adapter = CosmosDBAdapter(client_factory=lambda: FakeCosmosClient(database), budget=budget)
+    database.get_container_client(CONTAINERS["sessions"]).throttle_next = 1
+
+    async def scenario():
+        assert await adapter.save_message("s1", "oi", "olá") is False
+        started = time.perf_counter()
+        assert await adapter.save_message("s1", "oi", "olá")
+        await adapter.close()
+        return time.perf_counter() - started
+
+    waited = asyncio.run(scenario())
+    assert waited >= 0.015, f"deveria esperar o retry-after (20ms), esperou {waited * 1000:.1f}ms"
+    stats = adapter.get_stats()
+    assert stats["request_units"]["throttled"] == 1
+    assert stats["request_units"]["operations"]["sessions.patch"]["last_retry_after_ms"] == 20
+    assert stats["budget"]["waits"] == 1
+
+
+def test_bulk_operations_yield_to_interactive_traffic():
+    budget = RequestUnitBudget(ru_per_second=1000, burst_seconds=0.1, bulk_reserve=0.5)
+    finished = []
+
+    async def call(name: str, bulk: bool):
+        if bulk:
+            with bulk_operations():
+                await budget.acquire()
+        else:
+            await budget.acquire()
+        finished.append(name)
+
+    async def scenario():
+        budget.consume(budget.capacity)  # Orçamento esgotado por uma rajada
+        await asyncio.gather(call("bulk", True), call("chat", False))
+
+    asyncio.run(scenario())
+    assert finished == ["chat", "bulk"], finished
+
+
+async def seed_activity(adapter: CosmosDBAdapter, promotions: int, offset: int = 0):
+    for i in range(offset, offset + promotions):
+        await adapter.save_message(f"s{i}", "oi", "olá")
+    await adapter.save_promotions([
+        {
+            "promo_id": f"promo_agg_{i}", "titulo": f"Promo {i}", "status": "sent" if i % 2 else "draft",
+            "mecanica": "progressiva" if i % 3 else "casada", "segmentacao": "varejo",
+            "periodo_inicio": f"2026-0{1 + i % 2}-01"
+        }
+        for i in range(offset, offset + promotions)
+    ])
+
+
+def test_change_feed_keeps_aggregates_incrementally():
+    adapter, database, _ = make_adapter()
+    aggregator = ChangeFeedAggregator(adapter, page_size=4)
+
+    async def scenario():
+        await seed_activity(adapter, 10)
+        first = await aggregator.run_once()
+        await seed_activity(adapter, 3, offset=10)
+        for turn in range(2):  # Sessão já contada recebe mais trocas
+            await adapter.save_message("s0", f"mais {turn}", "ok")
+        second = await aggregator.run_once()
+        idle = await aggregator.run_once()
+        aggregates = await adapter.get_aggregates()
+        await adapter.close()
+        return first, second, idle, aggregates
+
+    first, second, idle, aggregates = asyncio.run(scenario())
+    assert first["processed"] == {"messages": 10, "promotions": 10}, first
+    assert second["processed"] == {"messages": 4, "promotions": 3}, "só as mudanças novas"
+    assert idle["processed"] == {"messages": 0, "promotions": 0}
+
+    promotions = aggregates["promotions"]
+    assert aggregates["messages"]["total"] == 15 and promotions["total"] == 13
+    assert sum(aggregates["messages"]["by_month"].values()) == 15 and "sessions" not in aggregates["messages"]
+    assert promotions["by_status"] == {"draft": 7, "sent": 6}
+    assert promotions["by_month"] == {"2026-01": 7, "2026-02": 6}
+    assert promotions["by_mecanica"] == {"casada": 5, "progressiva": 8}
+    assert promotions["by_segment"] == {"varejo": 13}
+    assert "continuation" not in promotions and "_etag" not in promotions
+    # O que já foi contado fica no documento da sessão; o agregado guarda no máximo uma página de marcas
+    sessions = database.containers[CONTAINERS["sessions"]].items
+    assert all(doc["counted_turns"] == doc["turn_count"] for doc in sessions.values())
+    assert sessions[("s0", "s0")]["counted_turns"] == 3
+    stored = database.containers[CONTAINERS["aggregates"]].items[("messages", "messages")]
+    assert "sessions" not in stored and len(stored["pending_marks"]) <= 4, stored
+    assert stored["continuation"] in database.containers[CONTAINERS["sessions"]].feed_tokens
+    # A leitura é um point read por tipo, sem COUNT cross-partition
+    assert not database.containers[CONTAINERS["sessions"]].queries
+    assert adapter.get_stats()["request_units"]["operations"]["aggregates.read"]["requests"] >= 2
+
+
+def test_aggregate_with_sessions_map_moves_marks_to_sessions():
+    adapter, database, _ = make_adapter()
+    aggregator = ChangeFeedAggregator(adapter, page_size=4)
+
+    async def scenario():
+        await seed_activity(adapter, 3)
+        await aggregator.run_once(["messages"])
+        # Agregado gravado pelo layout antigo: contagens mais o mapa sessions, sem marcas nas sessões
+        aggregates = database.containers[CONTAINERS["aggregates"]]
+        legacy = aggregates.items[("messages", "messages")]
+        legacy["sessions"] = {f"s{i}": [1, "2026-01-01T00:00:00", "2026-01-01"] for i in range(3)}
+        for field in ("pending_marks", "epoch"):
+            del legacy[field]
+        for key, doc in database.containers[CONTAINERS["sessions"]].items.items():
+            for field in ("counted_turns", "counted_epoch"):
+                doc.pop(field)
+            database.containers[CONTAINERS["sessions"]]._store(key, doc)  # Volta ao change feed
+        await adapter.save_message("s1", "mais uma", "ok")
+        await aggregator.run_once(["messages"])
+        aggregates = await adapter.get_aggregates()
+        await adapter.close()
+        return aggregates
+
+    aggregates = asyncio.run(scenario())
+    assert aggregates["messages"]["total"] == 4, aggregates["messages"]
+    stored = database.containers[CONTAINERS["aggregates"]].items[("messages", "messages")]
+    assert "sessions" not in stored and "pending_marks" not in aggregates["messages"]
+
+
+def test_reset_recounts_marked_sessions():
+    adapter, _, _ = make_adapter()
+    aggregator = ChangeFeedAggregator(adapter, page_size=4)
+
+    async def scenario():
+        await seed_activity(adapter, 5)
+        await adapter.save_message("s0", "mais uma", "ok")
+        await aggregator.run_once(["messages"])
+        await aggregator.reset(["messages"])  # Nova época: as marcas das sessões deixam de valer
+        await aggregator.run_once(["messages"])
+        aggregates = await adapter.get_aggregates()
+        await adapter.close()
+        return aggregates
+
+    assert asyncio.run(scenario())["messages"]["total"] == 6
+
+
+def test_concurrent_aggregators_count_each_change_once():
+    adapter, _, _ = make_adapter(latency=0.002)
+    processors = [ChangeFeedAggregator(adapter, page_size=3) for _ in range(3)]
+
+    async def scenario():
+        await seed_activity(adapter, 12)
+        await asyncio.gather(*(processor.run_once() for processor in processors))
+        aggregates = await adapter.get_aggregates()
+        await adapter.close()
+        return aggregates
+
+    aggregates = asyncio.run(scenario())
+    assert aggregates["messages"]["total"] == 12, aggregates["messages"]
+    assert aggregates["promotions"]["total"] == 12
+    assert sum(aggregates["promotions"]["by_status"].values()) == 12
+
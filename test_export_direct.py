@@ -38,7 +38,8 @@ try:
         EXPORT_URL,
         json={
             "promo_data": promo_data,
-            "format": "excel"
+            "format": "excel",
+            "delivery": "stream"
         },
         timeout=30
     )
@@ -46,46 +47,33 @@ try:
     print(f"\n📥 Status Code: {response.status_code}")
     print(f"📥 Headers: {dict(response.headers)}")
     
-    # Verifica resposta
+    # Verifica resposta (delivery "stream": o corpo é o próprio arquivo)
     if response.status_code == 200:
         print("\n✅ SUCESSO!")
+        print(f"📄 Content-Type: {response.headers.get('Content-Type')}")
+        print(f"📄 Content-Disposition: {response.headers.get('Content-Disposition')}")
         
-        try:
-            result = response.json()
-            print(f"\n📄 Resposta JSON:")
-            print(json.dumps(result, indent=2, ensure_ascii=False)[:500])  # Primeiros 500 chars
+        if response.content[:2] == b"PK":
+            filename = f"test_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+            
+            with open(filename, "wb") as f:
+                f.write(response.content)
             
-            if result.get("success"):
-                print(f"\n✅ Excel gerado com sucesso!")
-                print(f"📁 Filename: {result.get('filename')}")
-                
-                if result.get("excel_base64"):
-                    base64_len = len(result.get("excel_base64", ""))
-                    print(f"📦 Tamanho do Base64: {base64_len} caracteres")
-                    print(f"📦 Tamanho estimado do Excel: {base64_len * 3 // 4} bytes")
-                    
-                    # Salva arquivo para teste
-                    import base64
-                    from pathlib import Path
-                    
-                    excel_bytes = base64.b64decode(result["excel_base64"])
-                    filename = f"test_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-                    
-                    with open(filename, "wb") as f:
-                        f.write(excel_bytes)
-                    
-                    print(f"\n💾 Excel salvo localmente: {filename}")
-                    print(f"💾 Tamanho do arquivo: {len(excel_bytes)} bytes")
-                    print(f"\n🎉 TESTE COMPLETO! Abra o arquivo para verificar.")
-                else:
-                    print("\n⚠️ Resposta não contém excel_base64")
-            else:
-                print(f"\n❌ Erro na resposta: {result.get('error', 'Erro desconhecido')}")
-                
-        except json.JSONDecodeError as e:
-            print(f"\n❌ Erro ao decodificar JSON: {e}")
-            print(f"📄 Resposta raw (primeiros 500 chars):")
+            print(f"\n💾 Excel salvo localmente: {filename}")
+            print(f"💾 Tamanho do arquivo: {len(response.content)} bytes")
+            print(f"\n🎉 TESTE COMPLETO! Abra o arquivo para verificar.")
+        else:
+            print("\n⚠️ Resposta não é um arquivo Excel")
             print(response.text[:500])
+        
+        # delivery "url": JSON pequeno com link de download de curta duração
+        link_response = requests.post(
+            EXPORT_URL,
+            json={"promo_data": promo_data, "format": "excel", "delivery": "url"},
+            timeout=30
+        )
+        print(f"\n🔗 Link de download:")
+        print(json.dumps(link_response.json(), indent=2, ensure_ascii=False)[:500])
     
     elif response.status_code == 500:
         print("\n❌ ERRO 500 - Internal Server Error")
@@ -0,0 +1,296 @@
+"""
+Testes do LocalDatabase (SQLite) além do contrato comum de StorageBackend
+Cada teste abre bancos novos no diretório temporário próprio (fixture local_database)
+
+Uso:
+    python -m pytest test_local_database.py
+"""
+import os
+import json
+import asyncio
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, List
+
+import pytest
+
+from src.services import database as database_module
+from src.services.retention import RetentionPolicy, RetentionWorker
+from src.services.state_codec import ENCODERS, FLAG_COMPRESSED, StateCodec
+
+
+def test_promotion_search(local_database, tmp_path):
+    async def scenario():
+        database = await local_database()
+        assert database.fts_enabled, "FTS5 indisponível neste SQLite"
+        for promotion in (
+            {"promo_id": "promo_titulo", "session_id": "s1", "titulo": "Cerveja em dobro",
+             "descricao": "Leve duas", "segmentacao": "varejo"},
+            {"promo_id": "promo_descricao", "session_id": "s2", "titulo": "Combo de verão",
+             "descricao": "Desconto em cerveja artesanal", "segmentacao": "atacado"},
+            {"promo_id": "promo_outra", "session_id": "s3", "titulo": "Refrigerante", "descricao": "Sem álcool"},
+        ):
+            assert await database.save_promotion(promotion)
+
+        # bm25 com peso maior no título: o termo no título vem antes do termo só na descrição
+        found = await database.search_promotions("cerveja")
+        assert found["total"] == 2
+        assert [p["promo_id"] for p in found["results"]] == ["promo_titulo", "promo_descricao"], found
+        assert "<mark>" in found["results"][0]["titulo_highlight"]
+        # Prefixo, acentos removidos e operadores digitados pelo usuário não quebram a query
+        assert (await database.search_promotions("verao"))["total"] == 1
+        assert (await database.search_promotions("artes"))["results"][0]["promo_id"] == "promo_descricao"
+        assert (await database.search_promotions('(refrigerante) -sem'))["total"] == 1
+        assert (await database.search_promotions('sem "álcool'))["total"] == 1
+        assert (await database.search_promotions("cerveja", limit=1, offset=1))["results"][0]["promo_id"] == "promo_descricao"
+
+        # Os triggers mantêm o índice em sincronia com UPDATE e DELETE feitos direto na tabela
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            db.execute("UPDATE promotions SET titulo = 'Vinho em dobro' WHERE promo_id = 'promo_titulo'")
+            db.execute("DELETE FROM promotions WHERE promo_id = 'promo_descricao'")
+        assert (await database.search_promotions("cerveja"))["total"] == 0
+        assert [p["promo_id"] for p in (await database.search_promotions("vinho"))["results"]] == ["promo_titulo"]
+
+        # Rebuild a partir da tabela reproduz o mesmo resultado
+        assert await database.rebuild_search_index()
+        assert (await database.search_promotions("vinho"))["total"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_state_codec_round_trip(local_database, tmp_path):
+    async def scenario():
+        state = {
+            "session_id": "s1", "titulo": "Leve 3 pague 2 – verão", "produtos": ["Água", "Suco"],
+            "desconto_percentual": 12.5, "volume_minimo": None, "descricao": "x" * 2000
+        }
+        # Cada codec disponível, com e sem zlib; qualquer instância lê o que outra gravou
+        for name in ENCODERS:
+            for threshold in (None, 256):
+                codec = StateCodec(name, compress_threshold=threshold)
+                blob = codec.encode(state)
+                assert bool(blob[0] & FLAG_COMPRESSED) == bool(threshold), (name, threshold)
+                assert StateCodec("json").decode(blob) == state, (name, threshold)
+
+                database = await local_database(codec=codec)
+                assert await database.save_promo_state(f"{name}_{threshold}", state)
+                assert await database.get_promo_state(f"{name}_{threshold}") == state
+
+        # Linha legada: TEXT com JSON puro, sem cabeçalho
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            db.execute(
+                "INSERT INTO promo_states (session_id, state_data, status) VALUES ('legada', ?, 'draft')",
+                ('{"session_id": "legada", "titulo": "Antiga"}',)
+            )
+        reader = await local_database(codec=StateCodec("msgpack", compress_threshold=1))
+        assert (await reader.get_promo_state("legada"))["titulo"] == "Antiga"
+        assert StateCodec().decode(b'{"titulo": "bytes legados"}')["titulo"] == "bytes legados"
+        with pytest.raises(ValueError):
+            StateCodec().decode(bytes((0x7F,)) + b"??")
+
+    asyncio.run(scenario())
+
+
+async def _ndjson_records(lines: List[str]) -> AsyncIterator[Dict]:
+    for line in lines:
+        yield json.loads(line)
+
+
+def test_ndjson_export_import(local_database):
+    async def scenario():
+        source = await local_database()
+        promotions = [
+            {"promo_id": f"promo_{i:03d}", "session_id": f"s{i}", "titulo": f"Promoção {i}",
+             "produtos": [f"SKU {i}"], "categorias": ["bebidas"], "status": "sent"}
+            for i in range(25)
+        ]
+        for promotion in promotions:
+            assert await source.save_promotion(promotion)
+
+        # Exporta em lotes menores que o total (keyset por id), na mesma forma do endpoint
+        lines = [json.dumps(promo, ensure_ascii=False) async for promo in source.iter_promotions(batch_size=7)]
+        assert [json.loads(line)["promo_id"] for line in lines] == [p["promo_id"] for p in promotions]
+
+        target = await local_database(name="import.db")
+        first = await target.import_promotions(_ndjson_records(lines), batch_size=10)
+        assert first == {"received": 25, "inserted": 25, "skipped": 0, "conflicts": 0}, first
+        imported = await target.get_promotion_by_id("promo_007")
+        assert imported["produtos"] == ["SKU 7"] and imported["titulo"] == "Promoção 7"
+
+        # Reimportar (ou retomar) não duplica; promo_id de outra sessão conta como conflito
+        again = await target.import_promotions(_ndjson_records(lines + [
+            json.dumps({"promo_id": "promo_001", "session_id": "intrusa"}), json.dumps({"titulo": "sem id"})
+        ]))
+        assert again == {"received": 27, "inserted": 0, "skipped": 26, "conflicts": 1}, again
+        assert len([promo async for promo in target.iter_promotions()]) == 25
+        assert (await target.get_promotion_by_id("promo_001"))["session_id"] == "s1"
+
+    asyncio.run(scenario())
+
+
+def test_data_version_probe(local_database):
+    async def scenario():
+        database = await local_database()
+        await asyncio.sleep(0.2)  # Threads das conexões do initialize terminam (aiosqlite checa a cada 0.1s)
+        threads = threading.active_count()
+        # Primeira leitura concorrente: uma só conexão persistente (cada conexão aiosqlite é uma thread)
+        versions = await asyncio.gather(*(database.data_version() for _ in range(10)))
+        assert len(set(versions)) == 1
+        assert await database.save_message("s1", "oi", "olá")
+        assert await database.data_version() != versions[0], "commit de outra conexão muda o data_version"
+
+        # Depois do close nenhuma conexão fica aberta (uma extra impediria o processo de terminar)
+        await database.close()
+        await asyncio.sleep(0.2)
+        assert threading.active_count() <= threads, f"{threading.active_count() - threads} conexão(ões) abertas"
+
+    asyncio.run(scenario())
+
+
+def test_bulk_save_beyond_parameter_limit(local_database):
+    async def scenario():
+        database = await local_database()
+        # Mais promo_ids que o limite de parâmetros do SQLite antigo (999) numa consulta IN
+        promotions = [{"promo_id": f"promo_{i:05d}", "session_id": "s1", "titulo": f"P{i}"} for i in range(1500)]
+        first = await database.save_promotions(promotions)
+        assert [r["status"] for r in first] == ["inserted"] * 1500
+        again = await database.save_promotions(promotions + [{"promo_id": "promo_00001", "session_id": "s2"}])
+        assert [r["status"] for r in again] == ["exists"] * 1500 + ["failed"]
+
+    asyncio.run(scenario())
+
+
+def test_retention_purge_and_vacuum(local_database, tmp_path):
+    async def scenario():
+        database = await local_database()
+        now = datetime.utcnow()
+        old = (now - timedelta(days=40)).isoformat()
+        yesterday = (now - timedelta(days=1)).isoformat()
+        text = "x" * 500
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            rows = [("antiga", seq, text, text, old) for seq in range(1, 1201)]
+            rows += [("ativa", seq, text, text, yesterday) for seq in range(1, 6)]
+            rows += [("concluida", seq, text, text, yesterday) for seq in range(1, 4)]
+            db.executemany(
+                "INSERT INTO messages (session_id, seq, user_message, ai_response, timestamp) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            db.executemany(
+                "INSERT INTO system_logs (timestamp, level, message, component) VALUES (?, 'INFO', 'log', 'teste')",
+                [(old,)] * 300 + [(yesterday,)] * 2
+            )
+        await database.save_promo_state("concluida", {"session_id": "concluida", "status": "completed"})
+
+        worker = RetentionWorker(database, policies=[
+            RetentionPolicy("messages", max_age=timedelta(days=30), completed_max_age=timedelta(hours=1)),
+            RetentionPolicy("system_logs", max_age=timedelta(days=14)),
+        ], batch_size=100, vacuum_pages=0)
+        size_before = os.path.getsize(tmp_path / "local.db")
+        report = await worker.run_once()
+
+        assert report["deleted"] == {"messages": 1203, "system_logs": 300}, report
+        assert await database.get_message_count() == 5
+        assert len(await database.get_messages_since("ativa")) == 10
+        # Banco novo nasce com auto_vacuum incremental: as páginas do expurgo voltam ao sistema de arquivos
+        assert report["auto_vacuum"] == "incremental" and report["free_pages_after"] == 0, report
+        assert report["free_pages_before"] > 0 and report["db_size_bytes"] < size_before, report
+        assert (await worker.run_once())["deleted"] == {"messages": 0, "system_logs": 0}
+
+        with pytest.raises(ValueError):
+            await database.purge_expired_rows("promotions", now.isoformat())
+
+    asyncio.run(scenario())
+
+
+def test_incremental_vacuum_on_legacy_database(local_database, tmp_path):
+    async def scenario():
+        # Banco criado antes do auto_vacuum incremental
+        with sqlite3.connect(tmp_path / "local.db") as legacy:
+            legacy.execute("CREATE TABLE filler (data TEXT)")
+        database = await local_database()
+        assert (await database.compact())["auto_vacuum"] == "none"
+        assert await database.enable_incremental_vacuum()
+        assert (await database.compact())["auto_vacuum"] == "incremental"
+
+    asyncio.run(scenario())
+
+
+def test_legacy_messages_migration(local_database, tmp_path):
+    async def scenario():
+        # Tabela messages do layout antigo (id 'msg_<timestamp>'), com session_id nulo e ''
+        with sqlite3.connect(tmp_path / "local.db") as legacy:
+            legacy.execute(
+                """CREATE TABLE messages (id TEXT PRIMARY KEY, session_id TEXT, user_message TEXT,
+                   ai_response TEXT, timestamp TEXT, agno_version TEXT)"""
+            )
+            legacy.executemany(
+                "INSERT INTO messages VALUES (?, ?, ?, ?, ?, NULL)",
+                [
+                    ("msg_3", "s1", "terceira", "r3", "2025-01-01T00:00:03"),
+                    ("msg_1", "s1", "primeira", "r1", "2025-01-01T00:00:01"),
+                    ("msg_2", "s1", "segunda", "r2", "2025-01-01T00:00:02"),
+                    ("msg_4", None, "sem sessão", "r4", "2025-01-01T00:00:04"),
+                    ("msg_5", "", "sessão vazia", "r5", "2025-01-01T00:00:05"),
+                ]
+            )
+
+        database = await local_database()
+        history = await database.get_messages_since("s1")
+        assert [m["content"] for m in history if m["role"] == "user"] == ["primeira", "segunda", "terceira"], history
+        # Nulo e '' viram a mesma sessão e são numerados juntos, sem colidir na chave
+        orphans = await database.get_messages_since("")
+        assert [m["content"] for m in orphans if m["role"] == "user"] == ["sem sessão", "sessão vazia"], orphans
+        assert await database.get_message_count() == 5
+
+        assert await database.save_message("s1", "quarta", "r4") == 4
+
+    asyncio.run(scenario())
+
+
+def test_legacy_messages_migration_is_atomic(local_database, tmp_path, monkeypatch):
+    async def scenario():
+        with sqlite3.connect(tmp_path / "local.db") as legacy:
+            legacy.execute(
+                """CREATE TABLE messages (id TEXT PRIMARY KEY, session_id TEXT, user_message TEXT,
+                   ai_response TEXT, timestamp TEXT, agno_version TEXT)"""
+            )
+            legacy.executemany(
+                "INSERT INTO messages VALUES (?, 's1', ?, 'ok', ?, NULL)",
+                [(f"msg_{i}", f"m{i}", f"2025-01-01T00:00:0{i}") for i in range(1, 4)]
+            )
+
+        # Falha no meio da migração (depois do RENAME e do CREATE, no INSERT ... SELECT)
+        monkeypatch.setattr(
+            "src.services.database.MESSAGES_TABLE_SQL",
+            database_module.MESSAGES_TABLE_SQL.replace("seq INTEGER NOT NULL", "seq INTEGER NOT NULL CHECK (seq < 3)")
+        )
+        with pytest.raises(sqlite3.IntegrityError):
+            await local_database()
+        with sqlite3.connect(tmp_path / "local.db") as raw:
+            tables = {row[0] for row in raw.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            columns = [row[1] for row in raw.execute("PRAGMA table_info(messages)")]
+            assert "messages_legacy" not in tables and "seq" not in columns and "id" in columns
+            assert raw.execute("SELECT COUNT(*) FROM messages").fetchone()[0] == 3
+
+        # A tabela antiga ficou intacta: o próximo initialize refaz a migração inteira
+        monkeypatch.undo()
+        database = await local_database()
+        assert [m["seq"] for m in await database.get_messages_since("s1") if m["role"] == "user"] == [1, 2, 3]
+
+    asyncio.run(scenario())
+
+
+def test_concurrent_message_seq(local_database):
+    async def scenario():
+        database = await local_database()
+        # Conexões concorrentes na mesma sessão: cada troca recebe um seq próprio, sem buracos
+        seqs = await asyncio.gather(*(database.save_message("s1", f"m{i}", "ok") for i in range(20)))
+        assert sorted(seqs) == list(range(1, 21)), seqs
+        assert await database.save_message("s2", "outra sessão", "ok") == 1
+
+        since = await database.get_messages_since("s1", after_seq=18)
+        assert [m["seq"] for m in since] == [19, 19, 20, 20]
+        recent = await database.get_recent_messages("s1", limit=2)
+        assert [m["seq"] for m in recent if m["role"] == "user"] == [19, 20]
+
+    asyncio.run(scenario())
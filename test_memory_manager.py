@@ -0,0 +1,346 @@
+"""
+Testes do MemoryManager sobre um LocalDatabase (SQLite) temporário
+Cache de estados, unit of work, coerência entre workers, histórico recente, event
+sourcing e varredura de sessões ociosas (memória e arquivo frio)
+
+Uso:
+    python -m pytest test_memory_manager.py
+"""
+import time
+import asyncio
+import sqlite3
+
+import pytest
+
+from src.core.memory_manager import MemoryManager
+from src.core.promo_state import PromoState
+from src.core.state_cache import StateCache
+from src.services.session_sweeper import SessionSweeper
+
+
+def test_state_cache_lru_and_ttl():
+    evicted = []
+    cache = StateCache(max_entries=2, ttl_seconds=0.05, on_evict=evicted.append)
+    for session_id in ("a", "b"):
+        cache.put(session_id, PromoState(session_id=session_id))
+    assert cache.get("a") is not None  # "a" passa a ser a mais recente
+    cache.put("c", PromoState(session_id="c"))
+    assert "b" not in cache and evicted == ["b"], "LRU deve remover a menos usada"
+
+    time.sleep(0.06)
+    assert cache.get("a") is None and "a" not in cache, "entrada expirada pelo TTL"
+    stats = cache.get_stats()
+    assert (stats["evictions"], stats["expirations"], stats["hits"], stats["misses"]) == (1, 1, 1, 1), stats
+    assert evicted == ["b", "a"] and stats["bytes_estimate"] > 0
+
+
+def test_evicted_state_is_reloaded(local_database):
+    async def scenario():
+        database = await local_database()
+        memory = MemoryManager(database, cache_max_entries=1, revalidate=False)
+        state = await memory.load("s1")
+        state.titulo = "Persistida"
+        assert await memory.save(state)
+        await memory.save_message("s1", "oi", "olá")
+        assert await memory.get_recent_history("s1")
+        assert memory.get_cache_stats()["history_sessions"] == 1
+        await memory.load("s2")  # Passa do limite: s1 sai do cache
+        assert memory.get_cache_stats()["history_sessions"] == 0
+        reloaded = await memory.load("s1")
+        assert reloaded is not state and reloaded.titulo == "Persistida"
+
+    asyncio.run(scenario())
+
+
+def test_clean_state_is_not_rewritten(local_database):
+    async def scenario():
+        database = await local_database()
+        memory = MemoryManager(database)
+        state = await memory.load("s1")
+        state.titulo = "Primeira"
+        assert await memory.save(state)
+        assert await database.get_promo_state_version("s1") == 1 and not state.is_dirty()
+
+        # Sem alterações: save não vai ao banco
+        updated_at = state.updated_at
+        assert await memory.save(state)
+        assert await database.get_promo_state_version("s1") == 1 and state.updated_at == updated_at
+
+        state.produtos.append("SKU 1")  # Alteração in-place também conta
+        assert await memory.save(state)
+        assert await database.get_promo_state_version("s1") == 2
+        assert (await database.get_promo_state("s1"))["produtos"] == ["SKU 1"]
+
+    asyncio.run(scenario())
+
+
+def test_unit_of_work_commit_and_rollback(local_database):
+    async def scenario():
+        database = await local_database()
+        memory = MemoryManager(database)
+
+        async def turn(session_id: str):
+            async with memory.unit_of_work():
+                state = await memory.load(session_id)
+                state.titulo = f"Promo {session_id}"
+                await memory.save(state)
+                await memory.save_message(session_id, "oi", "olá")
+                async with memory.unit_of_work():  # Bloco aninhado reutiliza a unit of work externa
+                    await memory.save_promotion({"promo_id": f"promo_{session_id}", "session_id": session_id})
+                # Nada chega ao banco antes do commit
+                assert await database.get_promo_state(session_id) is None
+                assert await database.get_messages_since(session_id) == []
+
+        # Turnos concorrentes de sessões diferentes: cada um é uma transação própria
+        await asyncio.gather(*(turn(f"s{i}") for i in range(5)))
+        for i in range(5):
+            assert (await database.get_promo_state(f"s{i}"))["titulo"] == f"Promo s{i}"
+            assert [m["seq"] for m in await database.get_messages_since(f"s{i}")] == [1, 1]
+            assert await database.get_promotion_by_id(f"promo_s{i}")
+        assert not (await memory.load("s0")).is_dirty()
+
+        # Rollback explícito: estado volta ao último confirmado, promoção descartada, mensagem mantida
+        async with memory.unit_of_work() as uow:
+            state = await memory.load("s0")
+            state.titulo = "Descartada"
+            await memory.save(state)
+            await memory.save_promotion({"promo_id": "promo_descartada", "session_id": "s0"})
+            await memory.save_message("s0", "cancelar", "ok")
+            uow.rollback()
+        assert (await memory.load("s0")).titulo == "Promo s0"
+        assert await database.get_promotion_by_id("promo_descartada") is None
+        assert len(await database.get_messages_since("s0")) == 4
+
+        # Exceção no bloco descarta tudo, inclusive as mensagens
+        with pytest.raises(ValueError):
+            async with memory.unit_of_work():
+                state = await memory.load("s1")
+                state.status = "completed"
+                await memory.save(state)
+                await memory.save_message("s1", "falhou", "")
+                raise ValueError("erro no turno")
+        assert (await memory.load("s1")).status == "draft"
+        assert len(await database.get_messages_since("s1")) == 2
+
+    asyncio.run(scenario())
+
+
+def test_unit_of_work_promotion_conflict(local_database):
+    async def scenario():
+        database = await local_database()
+        assert await database.save_promotion({"promo_id": "promo_x", "session_id": "outra", "titulo": "Dona"})
+        memory = MemoryManager(database)
+
+        with pytest.raises(RuntimeError, match="outra sessão"):
+            async with memory.unit_of_work():
+                state = await memory.load("s1")
+                state.titulo = "Finalizada"
+                state.status = "completed"
+                await memory.save(state)
+                await memory.save_promotions([{"promo_id": "promo_x", "session_id": "s1", "titulo": "Intrusa"}])
+                await memory.save_message("s1", "confirmar", "salvo")
+
+        # Nada do turno foi confirmado: nem o estado finalizado nem a mensagem
+        assert await database.get_promo_state("s1") is None
+        assert await database.get_message_count() == 0
+        assert (await database.get_promotion_by_id("promo_x"))["titulo"] == "Dona"
+        assert (await memory.load("s1")).status != "completed", "o cache não pode manter o estado não gravado"
+
+        # Reenvio pela própria sessão continua idempotente
+        async with memory.unit_of_work():
+            await memory.save_promotions([{"promo_id": "promo_x", "session_id": "outra", "titulo": "Reenvio"}])
+
+    asyncio.run(scenario())
+
+
+def test_version_conflict_merges_and_retries(local_database):
+    async def scenario():
+        database = await local_database()
+        worker_a, worker_b = MemoryManager(database), MemoryManager(await local_database())
+        state = await worker_a.load("s1")
+        state.titulo = "Inicial"
+        assert await worker_a.save(state)
+
+        # Os dois workers partem da v1 e alteram campos diferentes ao mesmo tempo
+        state_a, state_b = await worker_a.load("s1"), await worker_b.load("s1")
+        state_a.mecanica = "progressiva"
+        state_b.segmentacao = "varejo"
+        state_b.produtos.append("SKU 1")
+        results = await asyncio.gather(worker_a.save(state_a), worker_b.save(state_b))
+        assert results == [True, True]
+        stored, version = await database.get_promo_state_with_version("s1")
+        assert version == 3, "uma gravação conflita, faz merge e grava em cima da outra"
+        assert (stored["titulo"], stored["mecanica"], stored["segmentacao"], stored["produtos"]) == (
+            "Inicial", "progressiva", "varejo", ["SKU 1"]
+        )
+        conflicts = worker_a.get_cache_stats()["conflicts"] + worker_b.get_cache_stats()["conflicts"]
+        assert conflicts == 1
+
+        # O cache do outro worker é revalidado pela versão e recarregado sem ler tudo de novo a cada turno
+        stale = min((worker_a, worker_b), key=lambda worker: worker._cache.peek("s1").version)
+        assert (await stale.load("s1")).version == 3
+        assert stale.get_cache_stats()["refreshes"] == 1
+
+        # Conflito no commit da unit of work (cache sem revalidação): merge e nova tentativa
+        blind = MemoryManager(await local_database(), revalidate=False)
+        await blind.load("s1")
+        theirs = await worker_b.load("s1")
+        theirs.status = "validating"
+        assert await worker_b.save(theirs)
+        async with blind.unit_of_work():
+            mine = await blind.load("s1")
+            assert mine.version == 3, "veio do cache, sem saber da v4"
+            mine.titulo = "Do worker A"
+            await blind.save(mine)
+        assert mine.version == 5 and blind.get_cache_stats()["conflicts"] == 1
+        stored, version = await database.get_promo_state_with_version("s1")
+        assert version == 5 and (stored["titulo"], stored["status"]) == ("Do worker A", "validating")
+
+        # Sem novas tentativas o conflito não é gravado por cima
+        impatient = MemoryManager(await local_database(), max_cas_retries=0)
+        old = await impatient.load("s1")
+        newer = await worker_b.load("s1")
+        newer.titulo = "Mais nova"
+        assert await worker_b.save(newer)
+        old.titulo = "Atrasada"
+        assert not await impatient.save(old)
+        assert (await database.get_promo_state("s1"))["titulo"] == "Mais nova"
+
+    asyncio.run(scenario())
+
+
+def test_recent_history_ring_buffer(local_database):
+    async def scenario():
+        database = await local_database()
+        memory = MemoryManager(database, history_turns=3)
+        await memory.load("s1")  # Buffer só existe para sessões com estado em cache
+        for i in range(2):
+            await memory.save_message("s1", f"u{i}", f"a{i}")
+
+        assert [m["content"] for m in await memory.get_recent_history("s1", limit=3)] == ["u0", "a0", "u1", "a1"]
+        for i in range(2, 6):
+            await memory.save_message("s1", f"u{i}", f"a{i}")
+            async with memory.unit_of_work():
+                pass  # Unit of work vazia não mexe no buffer
+
+        # Buffer mantém só os 3 últimos turnos, sem voltar ao banco
+        history = await memory.get_recent_history("s1", limit=3)
+        assert [m["content"] for m in history if m["role"] == "user"] == ["u3", "u4", "u5"]
+        assert [m["seq"] for m in history] == [4, 4, 5, 5, 6, 6]
+        assert [m["content"] for m in await memory.get_recent_history("s1", limit=1)] == ["u5", "a5"]
+        stats = memory.get_cache_stats()
+        assert (stats["history_hits"], stats["history_misses"]) == (2, 1), stats
+
+        # Mais turnos que o buffer: lê do banco
+        assert len(await memory.get_recent_history("s1", limit=5)) == 10
+        # Outro processo gravou um turno: o seq seguinte pula um número e o buffer é descartado
+        await database.save_message("s1", "u6", "a6")
+        await memory.save_message("s1", "u7", "a7")
+        assert memory.get_cache_stats()["history_sessions"] == 0
+        history = await memory.get_recent_history("s1", limit=3)
+        assert [m["content"] for m in history if m["role"] == "user"] == ["u5", "u6", "u7"]
+
+        # Turnos gravados pelo commit da unit of work entram no buffer com o seq do banco
+        async with memory.unit_of_work():
+            await memory.save_message("s1", "u8", "a8")
+        assert [m["seq"] for m in await memory.get_recent_history("s1", limit=1)] == [9, 9]
+
+    asyncio.run(scenario())
+
+
+def test_event_sourced_replay(local_database, tmp_path):
+    async def scenario():
+        database = await local_database(event_sourcing=True, snapshot_every=3)
+        memory = MemoryManager(database)
+        state = await memory.load("s1")
+        state.titulo = "Rascunho"
+        assert await memory.save(state)  # Primeira gravação: estado inteiro, sem eventos
+
+        for titulo in ("T1", "T2", "T3"):
+            state.titulo = titulo
+            assert await memory.save(state)
+        state.titulo = "T4"
+        state.produtos.append("SKU 1")
+        assert await memory.save(state)  # Dois campos: dois eventos na mesma versão
+
+        # Snapshot a cada 3 eventos: o que veio depois dele é reaplicado na leitura
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            blob, event_seq, snapshot_seq, version = db.execute(
+                "SELECT state_data, event_seq, snapshot_seq, version FROM promo_states WHERE session_id = 's1'"
+            ).fetchone()
+        assert (event_seq, snapshot_seq, version) == (5, 3, 5)
+        assert database.codec.decode(blob)["titulo"] == "T3"
+        stored = await database.get_promo_state("s1")
+        assert (stored["titulo"], stored["produtos"]) == ("T4", ["SKU 1"])
+        # Leitor sem event sourcing (outro worker) também reaplica os eventos
+        plain = await local_database()
+        assert (await plain.get_promo_state("s1"))["titulo"] == "T4"
+
+        # Histórico servido por /promotion-state/{id}/history: mais antigos primeiro, limitado aos últimos
+        history = await database.get_promo_state_events("s1")
+        assert [(e["seq"], e["field"], e["value"]) for e in history] == [
+            (1, "titulo", "T1"), (2, "titulo", "T2"), (3, "titulo", "T3"), (4, "titulo", "T4"), (5, "produtos", ["SKU 1"])
+        ]
+        assert [e["seq"] for e in await database.get_promo_state_events("s1", limit=2)] == [4, 5]
+
+        # Mudança de status força snapshot; excluir o estado apaga o log junto
+        state.status = "completed"
+        assert await memory.save(state)
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            assert db.execute("SELECT event_seq - snapshot_seq FROM promo_states").fetchone() == (0,)
+        assert await memory.delete("s1")
+        assert await database.get_promo_state_events("s1") == []
+
+    asyncio.run(scenario())
+
+
+def test_sweeper_archive_and_restore(local_database, tmp_path):
+    async def scenario():
+        database = await local_database(event_sourcing=True, snapshot_every=10)
+        memory = MemoryManager(database)
+        for session_id, titulo, status in (("old", "Antigo", "draft"), ("done", "Enviada", "completed"), ("new", "Nova", "draft")):
+            state = await memory.load(session_id)
+            state.titulo = titulo
+            state.status = status
+            assert await memory.save(state)
+        state = await memory.load("old")
+        state.mecanica = "progressiva"
+        assert await memory.save(state)  # Fica como evento, ainda sem snapshot
+        pending = await memory.load("pending")
+        pending.titulo = "Não gravada"
+        busy = await memory.load("busy")
+        busy.titulo = "Em andamento"
+
+        # "old" e "done" parados há anos; só o rascunho vai para o arquivo frio
+        with sqlite3.connect(tmp_path / "local.db") as db:
+            db.execute("UPDATE promo_states SET updated_at = '2020-01-01' WHERE session_id IN ('old', 'done')")
+        sweeper = SessionSweeper(
+            memory, database, is_busy=lambda session_id: session_id == "busy",
+            idle_seconds=0, archive_after_days=30, batch_size=1
+        )
+        report = await sweeper.run_once()
+        assert (report["evicted"], report["flushed"], report["skipped"], report["failed"]) == (4, 1, 1, 0), report
+        assert report["archived"] == 1 and await database.get_archived_count() == 1
+        assert memory.get_cache_stats()["entries"] == 1, "sessão com turno em andamento continua em memória"
+        assert (await database.get_promo_state("pending"))["titulo"] == "Não gravada", "pendente gravado antes de sair"
+        assert await database.get_promo_state("old") is None
+        assert await database.get_promo_state_events("old") == []
+        assert (await database.get_promo_state("done"))["status"] == "completed"
+
+        # Conversa retomada: o estado volta materializado (com o evento) e segue gravando normalmente
+        restored = await memory.load("old")
+        assert (restored.titulo, restored.mecanica, restored.is_dirty()) == ("Antigo", "progressiva", False)
+        assert await database.get_archived_count() == 0
+        restored.descricao = "Retomada"
+        assert await memory.save(restored)
+        assert (await database.get_promo_state("old"))["descricao"] == "Retomada"
+        assert not await database.restore_archived_promo_state("old"), "nada mais para restaurar"
+
+        # Sessão recriada enquanto estava arquivada: o estado atual vence e a cópia arquivada é mantida
+        assert await database.archive_idle_promo_states("2999-01-01") == 3
+        assert await database.save_promo_state("new", PromoState(session_id="new", titulo="Recriada").to_dict())
+        assert not await database.restore_archived_promo_state("new")
+        assert (await database.get_promo_state("new"))["titulo"] == "Recriada"
+        assert await database.get_archived_count() == 3
+
+    asyncio.run(scenario())
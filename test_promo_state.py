@@ -0,0 +1,141 @@
+"""
+Testes do PromoState: controle de alterações (dirty tracking), merge com a versão
+gravada e paridade do to_dict/from_dict gerados com o serializador escrito à mão
+
+Uso:
+    python -m pytest test_promo_state.py
+"""
+from datetime import datetime
+from typing import Dict
+
+import pytest
+
+from src.core.promo_state import FIELD_NAMES, PromoState, TRACKED_FIELDS
+
+
+def test_new_state_is_dirty_until_clean():
+    state = PromoState(session_id="s1")
+    assert not state.is_persisted()
+    assert state.changed_fields() == list(TRACKED_FIELDS), "estado novo nunca foi gravado: tudo sujo"
+    state.mark_clean()
+    assert state.is_persisted() and not state.is_dirty()
+
+    # Reatribuir o mesmo valor e mexer em updated_at não sujam o estado
+    state.titulo = None
+    state.update_timestamp()
+    assert not state.is_dirty()
+
+    state.titulo = "Leve 3"
+    revision = state.revision
+    state.mecanica = "progressiva"
+    assert state.changed_fields() == ["titulo", "mecanica"]
+    assert state.fields_changed_since(revision) == ["mecanica"]
+    assert state.missing_fields()[0] == "descricao", "cache de missing_fields zerado ao alterar obrigatório"
+
+    # Mutação in-place de lista/metadata não passa por __setattr__: vem da comparação com o snapshot
+    state.mark_clean()
+    state.produtos.append("SKU 1")
+    state.metadata["origem"] = "chat"
+    assert state.changed_fields() == ["produtos", "metadata"]
+    state.mark_clean()
+    state.produtos.append("SKU 2")
+    assert state.changed_fields() == ["produtos"], "snapshot é cópia, não a mesma lista"
+
+
+def test_rebase_keeps_local_changes():
+    stored = PromoState(session_id="s1", titulo="Antigo", mecanica="casada", produtos=["A"]).to_dict()
+    state = PromoState.from_dict(stored)
+    state.mark_clean()
+    state.version = 3
+    state.titulo = "Local"
+
+    # Outro worker gravou a v4 com mecanica e produtos novos
+    remote = {**stored, "titulo": "Remoto", "mecanica": "pontos", "produtos": ["A", "B"], "updated_at": "2030-01-01"}
+    pending = state.rebase(remote, 4)
+    assert pending == ["titulo"] and state.version == 4
+    assert (state.titulo, state.mecanica, state.produtos) == ("Local", "pontos", ["A", "B"])
+    assert state.updated_at == "2030-01-01"
+    state.produtos.append("C")
+    assert state.changed_fields() == ["titulo", "produtos"], "snapshot passa a ser o gravado"
+
+    # Estado novo (nunca lido do banco): só o que foi preenchido depois de criado é local
+    fresh = PromoState(session_id="s1")
+    fresh.descricao = "Minha descrição"
+    fresh.categorias.append("bebidas")
+    assert sorted(fresh.rebase(remote, 4)) == ["categorias", "descricao"]
+    assert (fresh.titulo, fresh.descricao, fresh.categorias) == ("Remoto", "Minha descrição", ["bebidas"])
+
+
+def legacy_to_dict(state: PromoState) -> Dict:
+    """to_dict escrito à mão, antes da geração a partir de FIELD_NAMES"""
+    return {
+        'session_id': state.session_id, 'promo_id': state.promo_id, 'titulo': state.titulo,
+        'mecanica': state.mecanica, 'descricao': state.descricao, 'segmentacao': state.segmentacao,
+        'periodo_inicio': state.periodo_inicio, 'periodo_fim': state.periodo_fim,
+        'condicoes': state.condicoes, 'recompensas': state.recompensas, 'produtos': state.produtos,
+        'categorias': state.categorias, 'clientes_alvo': state.clientes_alvo,
+        'volume_minimo': state.volume_minimo, 'desconto_percentual': state.desconto_percentual,
+        'margem_esperada': state.margem_esperada, 'roi_estimado': state.roi_estimado,
+        'created_at': state.created_at, 'updated_at': state.updated_at, 'status': state.status,
+        'metadata': state.metadata
+    }
+
+
+def legacy_from_dict(data: Dict) -> PromoState:
+    """from_dict escrito à mão (passando pelo __init__)"""
+    return PromoState(
+        session_id=data.get('session_id', ''), promo_id=data.get('promo_id'), titulo=data.get('titulo'),
+        mecanica=data.get('mecanica'), descricao=data.get('descricao'), segmentacao=data.get('segmentacao'),
+        periodo_inicio=data.get('periodo_inicio'), periodo_fim=data.get('periodo_fim'),
+        condicoes=data.get('condicoes'), recompensas=data.get('recompensas'),
+        produtos=data.get('produtos', []), categorias=data.get('categorias', []),
+        clientes_alvo=data.get('clientes_alvo', []), volume_minimo=data.get('volume_minimo'),
+        desconto_percentual=data.get('desconto_percentual'), margem_esperada=data.get('margem_esperada'),
+        roi_estimado=data.get('roi_estimado'),
+        created_at=data.get('created_at', datetime.utcnow().isoformat()),
+        updated_at=data.get('updated_at', datetime.utcnow().isoformat()),
+        status=data.get('status', 'draft'), metadata=data.get('metadata', {})
+    )
+
+
+FULL_STATE = legacy_to_dict(PromoState(
+    session_id="s1", promo_id="promo_1", titulo="Leve 3", mecanica="progressiva", descricao="d",
+    segmentacao="varejo", periodo_inicio="2026-01-01", periodo_fim="2026-01-31", condicoes="c",
+    recompensas="r", produtos=["A"], categorias=["B"], clientes_alvo=["C"], volume_minimo="10",
+    desconto_percentual="5", margem_esperada="20", roi_estimado="2", status="approved",
+    metadata={"multi": [{"mes": 1}]}
+))
+
+
+def test_to_dict_matches_legacy():
+    state = PromoState.from_dict(FULL_STATE)
+    assert state.to_dict() == legacy_to_dict(state)
+    assert tuple(state.to_dict()) == FIELD_NAMES, "mesma ordem de chaves"
+
+
+@pytest.mark.parametrize("data", [
+    FULL_STATE,
+    {},  # Tudo ausente: defaults do dataclass
+    {"session_id": "s2", "produtos": None, "metadata": None, "status": None},  # None explícito se mantém
+    {"titulo": "Só título", "chave_desconhecida": 1},
+], ids=["completo", "vazio", "none_explicito", "parcial"])
+def test_from_dict_matches_legacy(data):
+    generated, legacy = PromoState.from_dict(data), legacy_from_dict(data)
+    expected = legacy_to_dict(legacy)
+    actual = generated.to_dict()
+    for name in ("created_at", "updated_at"):
+        if name not in data:
+            # Sem valor gravado os dois geram "agora": só o formato precisa bater
+            datetime.fromisoformat(actual.pop(name))
+            expected.pop(name)
+    assert actual == expected
+    # Mesmo estado de controle: nunca persistido, tudo sujo
+    assert generated.changed_fields() == legacy.changed_fields()
+    assert generated.missing_fields() == legacy.missing_fields()
+
+
+def test_from_dict_defaults_are_not_shared():
+    a, b = PromoState.from_dict({}), PromoState.from_dict({})
+    a.produtos.append("X")
+    assert b.produtos == [], "default_factory não pode compartilhar a lista"
+    assert not hasattr(a, "__dict__"), "estado com slots"
@@ -0,0 +1,81 @@
+"""
+Testes do SessionLockRegistry: turnos da mesma sessão em série, sessões diferentes
+em paralelo e limpeza das entradas quando ninguém mais usa o lock
+
+Uso:
+    python -m pytest test_session_locks.py
+"""
+import asyncio
+
+import pytest
+
+from src.core.session_locks import SessionLockRegistry
+
+
+def test_same_session_runs_in_order():
+    async def scenario():
+        registry = SessionLockRegistry()
+        running, order = [], []
+
+        async def turn(session_id: str, n: int):
+            async with registry.lock(session_id):
+                running.append(session_id)
+                assert running.count(session_id) == 1, "dois turnos da mesma sessão ao mesmo tempo"
+                order.append((session_id, n))
+                await asyncio.sleep(0.01)
+                running.remove(session_id)
+
+        started = asyncio.get_running_loop().time()
+        await asyncio.gather(*(turn(session_id, n) for n in range(5) for session_id in ("a", "b")))
+        elapsed = asyncio.get_running_loop().time() - started
+
+        assert [n for session_id, n in order if session_id == "a"] == list(range(5)), "ordem de chegada"
+        assert elapsed < 0.09, f"sessões diferentes não podem esperar umas pelas outras ({elapsed * 1000:.0f}ms)"
+        stats = registry.get_stats()
+        assert stats["acquisitions"] == 10 and stats["contended"] == 8 and stats["max_queue_depth"] == 4, stats
+        assert len(registry) == 0 and stats["active_sessions"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_entries_are_released():
+    async def scenario():
+        registry = SessionLockRegistry()
+        holding = asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with registry.lock("s1"):
+                holding.set()
+                await release.wait()
+
+        async def failing():
+            async with registry.lock("s1"):
+                raise ValueError("erro no turno")
+
+        first = asyncio.create_task(holder())
+        await holding.wait()
+        waiting = asyncio.create_task(registry.lock("s1").__aenter__())
+        broken = asyncio.create_task(failing())
+        await asyncio.sleep(0)
+        assert registry.is_active("s1") and registry.queue_depth("s1") == 2
+
+        # Turno cancelado enquanto aguardava sai da fila sem deixar referência
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert registry.queue_depth("s1") == 1
+
+        release.set()
+        await first
+        with pytest.raises(ValueError):
+            await broken  # Exceção dentro do bloco também libera a entrada
+        assert not registry.is_active("s1") and len(registry) == 0
+        assert registry.queue_depth("s1") == 0
+
+        # Depois de removida, a sessão ganha um lock novo normalmente
+        async with registry.lock("s1"):
+            assert registry.is_active("s1")
+        assert len(registry) == 0
+
+    asyncio.run(scenario())
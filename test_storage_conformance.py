@@ -0,0 +1,167 @@
+"""
+Conformidade dos backends de persistência com o contrato StorageBackend
+Cada teste roda contra todos os backends da fixture storage_backend (conftest.py):
+InMemoryStorage, LocalDatabase (SQLite temporário), CosmosDBAdapter contra o Cosmos
+fake e, se COSMOS_DB_ENDPOINT/COSMOS_DB_KEY estiverem definidas, o Cosmos DB real
+
+Uso:
+    python -m pytest test_storage_conformance.py
+"""
+import uuid
+import asyncio
+from datetime import datetime, timedelta
+
+from src.services.storage import StorageBackend
+
+
+def _id(prefix: str) -> str:
+    # IDs únicos: o Cosmos é compartilhado, então nada pode depender de banco vazio
+    return f"{prefix}_{uuid.uuid4().hex[:12]}"
+
+
+def test_protocol(storage_backend):
+    assert isinstance(storage_backend, StorageBackend), f"{type(storage_backend).__name__} não segue StorageBackend"
+
+
+def test_messages(storage_backend):
+    async def scenario(backend):
+        session_id = _id("conf_session")
+        before = await backend.get_message_count()
+
+        for turn in range(1, 4):
+            assert await backend.save_message(session_id, f"user {turn}", f"ai {turn}")
+        assert await backend.save_message(session_id, "sem resposta", "")
+
+        assert await backend.get_message_count() - before == 4
+
+        recent = await backend.get_recent_messages(session_id, limit=2)
+        contents = [(m["role"], m["content"]) for m in recent]
+        assert contents == [("user", "user 3"), ("assistant", "ai 3"), ("user", "sem resposta")], contents
+        assert all("timestamp" in m for m in recent if m["role"] == "assistant")
+
+        assert await backend.get_recent_messages(_id("conf_empty"), limit=5) == []
+
+    asyncio.run(scenario(storage_backend))
+
+
+def test_promo_states(storage_backend):
+    async def scenario(backend):
+        session_id = _id("conf_state")
+        assert await backend.get_promo_state(session_id) is None
+
+        state = {"session_id": session_id, "titulo": "Conformidade", "status": "draft", "produtos": ["A"]}
+        assert await backend.save_promo_state(session_id, state)
+        state["produtos"].append("mutado depois do save")
+        stored = await backend.get_promo_state(session_id)
+        assert stored["titulo"] == "Conformidade" and stored["produtos"] == ["A"], stored
+
+        assert await backend.save_promo_state(session_id, {**stored, "titulo": "Atualizado"})
+        assert (await backend.get_promo_state(session_id))["titulo"] == "Atualizado"
+        assert any(s.get("session_id") == session_id for s in await backend.list_all_promo_states())
+
+        assert await backend.delete_promo_state(session_id)
+        assert await backend.get_promo_state(session_id) is None
+        assert await backend.delete_promo_state(session_id), "remover estado inexistente deve ser sucesso"
+
+    asyncio.run(scenario(storage_backend))
+
+
+def test_promotions(storage_backend):
+    async def scenario(backend):
+        promo_id = _id("conf_promo")
+        older_id = _id("conf_promo")
+        now = datetime.utcnow()
+        promotion = {
+            "promo_id": promo_id, "session_id": _id("conf_session"), "titulo": "Original",
+            "mecanica": "progressiva", "periodo_inicio": "01/01/2026", "status": "sent",
+            "created_at": now.isoformat()
+        }
+        assert await backend.save_promotion(promotion)
+        assert await backend.save_promotion({**promotion, "promo_id": older_id, "created_at": (now - timedelta(days=1)).isoformat()})
+
+        assert await backend.save_promotion({**promotion, "titulo": "Duplicada"}), "promo_id repetido deve ser idempotente"
+        stored = await backend.get_promotion_by_id(promo_id)
+        assert stored and stored["titulo"] == "Original", stored
+
+        listed = [p["promo_id"] for p in await backend.get_promotions(limit=1000) if p.get("promo_id") in (promo_id, older_id)]
+        assert listed == [promo_id, older_id], listed
+        assert await backend.get_promotion_by_id(_id("conf_missing")) is None
+
+    asyncio.run(scenario(storage_backend))
+
+
+def test_bulk_promotions(storage_backend):
+    async def scenario(backend):
+        existing = _id("conf_bulk")
+        assert await backend.save_promotion({"promo_id": existing, "titulo": "Já gravada", "periodo_inicio": "01/01/2026"})
+
+        # Campanha dividida por mês: 12 promoções em partições (ano-mês) diferentes
+        campaign = [
+            {"promo_id": _id("conf_bulk"), "titulo": f"Mês {month}", "periodo_inicio": f"01/{month:02d}/2026"}
+            for month in range(1, 13)
+        ]
+        batch = campaign + [{"promo_id": existing, "titulo": "Reenvio"}, campaign[0], {"titulo": "Sem id"}]
+        results = await backend.save_promotions(batch)
+
+        statuses = [r["status"] for r in results]
+        assert statuses == ["inserted"] * 12 + ["exists", "exists", "failed"], statuses
+        assert [r["promo_id"] for r in results[:13]] == [p["promo_id"] for p in batch[:13]]
+        assert (await backend.get_promotion_by_id(existing))["titulo"] == "Já gravada"
+        for promo in campaign:
+            stored = await backend.get_promotion_by_id(promo["promo_id"])
+            assert stored and stored["titulo"] == promo["titulo"], promo
+
+        again = await backend.save_promotions(campaign)
+        assert all(r["status"] == "exists" for r in again), again
+
+    asyncio.run(scenario(storage_backend))
+
+
+def test_promotion_id_conflicts(storage_backend):
+    async def scenario(backend):
+        promo_id, owner, other = _id("conf_conflict"), _id("conf_session"), _id("conf_session")
+        assert await backend.save_promotion({"promo_id": promo_id, "session_id": owner, "titulo": "Dona"})
+
+        # Mesmo promo_id vindo de outra sessão não é reenvio: nada é gravado e a falha aparece
+        assert not await backend.save_promotion({"promo_id": promo_id, "session_id": other, "titulo": "Intrusa"})
+        assert await backend.save_promotion({"promo_id": promo_id, "session_id": owner, "titulo": "Reenvio"})
+
+        fresh = _id("conf_conflict")
+        results = await backend.save_promotions([
+            {"promo_id": promo_id, "session_id": other, "titulo": "Intrusa"},
+            {"promo_id": fresh, "session_id": other, "titulo": "Nova"},
+            {"promo_id": fresh, "session_id": owner, "titulo": "Mesmo id no lote"},
+        ])
+        statuses = [r["status"] for r in results]
+        assert statuses == ["failed", "inserted", "failed"], results
+        assert (await backend.get_promotion_by_id(promo_id))["titulo"] == "Dona"
+        assert (await backend.get_promotion_by_id(fresh))["session_id"] == other
+
+    asyncio.run(scenario(storage_backend))
+
+
+def test_promotion_pages(storage_backend):
+    async def scenario(backend):
+        # Datas no futuro: as promoções do teste ficam no topo mesmo num banco compartilhado
+        ids = [_id("conf_page") for _ in range(5)]
+        for i, promo_id in enumerate(ids):
+            assert await backend.save_promotion({
+                "promo_id": promo_id, "titulo": f"Página {i}", "descricao": "não vai na listagem",
+                "periodo_inicio": "01/01/2026", "created_at": f"2999-01-01T00:00:{i:02d}"
+            })
+
+        seen, cursor, pages = [], None, 0
+        while True:
+            page = await backend.get_promotions_page(page_size=2, cursor=cursor)
+            assert len(page["promotions"]) <= 2
+            seen += [p for p in page["promotions"] if p["promo_id"] in ids]
+            pages += 1
+            cursor = page["next_cursor"]
+            if not cursor or len(seen) == len(ids):
+                break
+
+        assert [p["promo_id"] for p in seen] == ids[::-1], [p["promo_id"] for p in seen]
+        assert pages >= 3
+        assert "descricao" not in seen[0] and seen[0]["titulo"] == "Página 4", seen[0]
+
+    asyncio.run(scenario(storage_backend))
@@ -0,0 +1,60 @@
+"""
+Script de Atualização dos Agregados do Cosmos DB
+Roda o ChangeFeedAggregator fora do Azure Functions: contra o Cosmos DB Emulator
+(COSMOS_DB_ENDPOINT=https://localhost:8081) no desenvolvimento local, ou para
+recontar tudo depois de mudar as dimensões dos agregados.
+
+Uso:
+    python update_cosmos_aggregates.py [messages,promotions] [--reset] [--loop]
+
+    --reset  zera os agregados e reconta desde o início do change feed
+    --loop   continua processando a cada minuto (Ctrl+C para parar)
+"""
+import sys
+import json
+import asyncio
+import logging
+
+from shared.adapters.cosmos_adapter import AGGREGATE_KINDS, CosmosDBAdapter
+from shared.adapters.cosmos_aggregates import ChangeFeedAggregator
+
+
+async def update(kinds, reset: bool, loop: bool) -> bool:
+    adapter = CosmosDBAdapter()
+    if not adapter.client:
+        print("❌ Defina COSMOS_DB_ENDPOINT e COSMOS_DB_KEY")
+        return False
+
+    aggregator = ChangeFeedAggregator(adapter)
+    try:
+        if not await adapter.ensure_containers():
+            return False
+        if reset:
+            print(f"🧹 Zerando agregados: {', '.join(kinds)}")
+            await aggregator.reset(kinds)
+        while True:
+            report = await aggregator.run_once(kinds)
+            print(f"📈 {report['processed']} em {report['duration_ms']}ms")
+            if not loop:
+                break
+            await asyncio.sleep(aggregator.interval_seconds)
+        print(json.dumps(await adapter.get_aggregates(), indent=2, ensure_ascii=False))
+        return True
+    finally:
+        await adapter.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    args = sys.argv[1:]
+    positional = [a for a in args if not a.startswith("--")]
+    kinds = positional[0].split(",") if positional else list(AGGREGATE_KINDS)
+    unknown = [kind for kind in kinds if kind not in AGGREGATE_KINDS]
+    if unknown:
+        print(f"❌ Tipos desconhecidos: {', '.join(unknown)} (use {', '.join(AGGREGATE_KINDS)})")
+        sys.exit(2)
+    try:
+        ok = asyncio.run(update(kinds, "--reset" in args, "--loop" in args))
+    except KeyboardInterrupt:
+        ok = True
+    sys.exit(0 if ok else 1)